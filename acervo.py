@@ -0,0 +1,435 @@
+"""
+Acervo colunar do histórico, particionado por dia
+
+Dias encerrados saem da memória do gerenciador e vão para o acervo: um
+diretório por dia, com uma coluna NumPy (.npy) por arquivo.
+
+    acervo/
+        indice.json        dias arquivados, quantos eventos/visitas cada um tem e até onde vai
+        rfids.txt          dicionário de cartões: a linha N (JSON) é o cartão de id N
+        2025-01-10/
+            eventos_rfid.npy        uint32 (id no dicionário)
+            eventos_timestamp.npy   float64 (epoch)
+            eventos_tipo.npy        uint8 (0 = entrada, 1 = saída)
+            visitas_rfid.npy        uint32
+            visitas_entrada.npy     float64
+            visitas_saida.npy       float64 (o dia da visita é o da saída)
+            visitas_duracao.npy     int32 (segundos)
+            cartoes_id.npy          uint32 (cartões com visitas no dia, em ordem de id)
+            cartoes_inicio.npy      int64 (onde as linhas de cada um começam em cartoes_linha)
+            cartoes_linha.npy       uint32 (linhas das visitas agrupadas por cartão, em ordem de saída)
+
+As colunas são abertas com `mmap_mode='r'` só quando uma consulta precisa
+daquele dia, e ficam num cache limitado. As visitas seguem a numeração de
+`tempos_permanencia` (ordem de saída): o acervo tem as posições
+[0, total_visitas) e o gerenciador continua a contagem com as que estão em
+memória; as posições de um dia saem das contagens acumuladas do índice, sem
+abrir partição nenhuma. As colunas `cartoes_*` são o índice por cartão: as
+visitas de um cartão num dia saem de uma busca binária em `cartoes_id`, sem
+percorrer a coluna `visitas_rfid` (partições anteriores a elas montam o
+índice na memória ao serem abertas).
+
+Acrescentar a um dia já arquivado não mexe na partição que está no índice:
+a nova é gravada em `AAAA-MM-DD.vN/` e só passa a valer quando o índice
+(que guarda a versão de cada dia) é trocado; a anterior é apagada depois.
+Leituras não usam lock e continuam vendo a partição antiga até lá.
+Diretórios que o índice não cita (de uma gravação interrompida, ou que o
+Windows não deixou apagar por ainda estarem mapeados) são removidos ao abrir
+o acervo.
+"""
+
+import datetime
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from diario import sincronizar_diretorio
+
+logger = logging.getLogger(__name__)
+
+TIPOS = ('entrada', 'saida')
+CODIGOS_TIPO = {tipo: codigo for codigo, tipo in enumerate(TIPOS)}
+
+COLUNAS = {
+    'eventos': (('rfid', np.uint32), ('timestamp', np.float64), ('tipo', np.uint8)),
+    'visitas': (('rfid', np.uint32), ('entrada', np.float64), ('saida', np.float64), ('duracao', np.int32)),
+    'cartoes': (('id', np.uint32), ('inicio', np.int64), ('linha', np.uint32)),
+}
+ORDEM = {'eventos': 'timestamp', 'visitas': 'saida'}
+
+# (rfid, epoch da entrada, epoch da saída, duração em segundos)
+VisitaArquivada = Tuple[str, float, float, int]
+
+
+def _epoch(iso: str) -> float:
+    return datetime.datetime.fromisoformat(iso).timestamp()
+
+
+def _indice_cartoes(rfids: np.ndarray) -> Dict[str, np.ndarray]:
+    """Colunas `cartoes_*` de um dia a partir da coluna `visitas_rfid`"""
+    linha = np.argsort(rfids, kind='stable')  # estável: cada cartão continua em ordem de saída
+    ids, contagem = np.unique(rfids, return_counts=True)
+    return {'id': ids, 'inicio': np.concatenate([[0], np.cumsum(contagem)]), 'linha': linha}
+
+
+class AcervoHistorico:
+    """Dias encerrados em arquivos colunares, carregados sob demanda"""
+
+    def __init__(self, diretorio: str = "dados/acervo", colunas_em_cache: int = 256):
+        self.diretorio = diretorio
+        self.colunas_em_cache = colunas_em_cache
+        os.makedirs(self.diretorio, exist_ok=True)
+
+        self._lock_escrita = threading.Lock()
+        self._cache: OrderedDict = OrderedDict()
+        self._lock_cache = threading.Lock()
+
+        # Dicionário de cartões (só cresce; uma linha incompleta no fim é de uma gravação interrompida)
+        self._nomes: List[str] = []
+        self._ids: Dict[str, int] = {}
+        caminho = os.path.join(self.diretorio, 'rfids.txt')
+        if os.path.exists(caminho):
+            with open(caminho, 'r', encoding='utf-8') as f:
+                for linha in f:
+                    if linha.endswith('\n'):
+                        self._internar(json.loads(linha))
+        self._nomes_gravados = len(self._nomes)
+
+        indice = {'dias': {}, 'arquivado_ate': None, 'eventos_ate_seq': 0}
+        caminho = os.path.join(self.diretorio, 'indice.json')
+        if os.path.exists(caminho):
+            with open(caminho, 'r', encoding='utf-8') as f:
+                indice = json.load(f)
+        self._publicar_indice(indice)
+        self._remover_orfaos()
+
+        # Visitas arquivadas por cartão: só o índice por cartão de cada dia é lido
+        self.visitas_por_id = np.zeros(len(self._nomes), dtype=np.int64)
+        for dia in self.dias:
+            self._somar_visitas(self.coluna(dia, 'cartoes', 'id'), np.diff(self.coluna(dia, 'cartoes', 'inicio')))
+
+        if self.dias:
+            logger.info("Acervo em %s: %d dias, %d visitas, %d eventos",
+                        self.diretorio, len(self.dias), self.total_visitas, self.total_eventos)
+
+    def _publicar_indice(self, indice: Dict):
+        """Troca o índice e as contagens acumuladas de uma vez (leitores veem um ou outro)"""
+        dias = sorted(indice['dias'])
+        visitas = np.cumsum([0] + [indice['dias'][dia]['visitas'] for dia in dias])
+        eventos = np.cumsum([0] + [indice['dias'][dia]['eventos'] for dia in dias])
+        self._indice = indice
+        self._vista = (dias, visitas, eventos)
+
+    def _remover_orfaos(self):
+        """Apaga partições que o índice não usa (gravação interrompida ou versão substituída)"""
+        em_uso = {self._pasta(dia) for dia in self.dias}
+        for nome in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, nome)
+            if nome not in em_uso and os.path.isdir(caminho):
+                shutil.rmtree(caminho, ignore_errors=True)
+
+    def _somar_visitas(self, rfids: np.ndarray, quantidades: Optional[np.ndarray] = None):
+        contagem = np.bincount(rfids, weights=quantidades, minlength=len(self._nomes)).astype(np.int64)
+        total = np.zeros(len(contagem), dtype=np.int64)
+        total[:len(self.visitas_por_id)] = self.visitas_por_id
+        self.visitas_por_id = total + contagem
+
+    # ---------- Índice ----------
+
+    @property
+    def dias(self) -> List[str]:
+        """Dias arquivados (AAAA-MM-DD), em ordem"""
+        return self._vista[0]
+
+    @property
+    def arquivado_ate(self) -> Optional[str]:
+        """Primeiro dia (AAAA-MM-DD) que ainda não foi arquivado; None se nada foi"""
+        return self._indice['arquivado_ate']
+
+    @property
+    def eventos_ate_seq(self) -> int:
+        """Seq do histórico do primeiro evento ainda não arquivado"""
+        return self._indice['eventos_ate_seq']
+
+    @property
+    def total_visitas(self) -> int:
+        return int(self._vista[1][-1])
+
+    @property
+    def total_eventos(self) -> int:
+        return int(self._vista[2][-1])
+
+    @property
+    def nomes(self) -> List[str]:
+        """Cartões por id (lista que só cresce; não alterar)"""
+        return self._nomes
+
+    def id_rfid(self, rfid: str) -> Optional[int]:
+        return self._ids.get(rfid)
+
+    def contar_visitas(self, rfid: Optional[str] = None) -> int:
+        if rfid is None:
+            return self.total_visitas
+        id_rfid = self._ids.get(rfid)
+        por_id = self.visitas_por_id
+        return int(por_id[id_rfid]) if id_rfid is not None and id_rfid < len(por_id) else 0
+
+    def contagem(self, dia: str) -> Optional[Dict]:
+        """{'eventos': N, 'visitas': M} de um dia arquivado (None se o dia não está no acervo)"""
+        return self._indice['dias'].get(dia)
+
+    def _pasta(self, dia: str) -> str:
+        """Diretório da partição de um dia: `AAAA-MM-DD`, ou `AAAA-MM-DD.vN` depois de acréscimos"""
+        versao = self._indice['dias'].get(dia, {}).get('versao', 0)
+        return f"{dia}.v{versao}" if versao else dia
+
+    def dias_entre(self, inicio: Optional[str] = None, fim: Optional[str] = None) -> List[str]:
+        """Dias arquivados em [inicio, fim] (AAAA-MM-DD, fim inclusive)"""
+        return [dia for dia in self.dias if (inicio is None or dia >= inicio) and (fim is None or dia <= fim)]
+
+    # ---------- Escrita ----------
+
+    def gravar_dia(self, dia: str, eventos: List[Tuple[str, float, str]], visitas: List[Dict],
+                   arquivado_ate: Optional[str] = None, eventos_ate_seq: int = 0):
+        """
+        Grava a partição de um dia (ou acrescenta a ela, se o dia já foi arquivado)
+
+        `eventos` são (rfid, epoch, tipo) como no `HistoricoEventos` e
+        `visitas` são os dicts de `tempos_permanencia`. A partição é escrita
+        num diretório novo (a versão seguinte, se o dia já existe) e o índice
+        é regravado por último, já com `arquivado_ate`/`eventos_ate_seq` como
+        em `avancar`: uma queda antes disso deixa o acervo como estava.
+        """
+        with self._lock_escrita:
+            novas = {
+                'eventos': {
+                    'rfid': np.array([self._internar(rfid) for rfid, _, _ in eventos], dtype=np.uint32),
+                    'timestamp': np.array([epoch for _, epoch, _ in eventos], dtype=np.float64),
+                    'tipo': np.array([CODIGOS_TIPO[tipo] for _, _, tipo in eventos], dtype=np.uint8),
+                },
+                'visitas': {
+                    'rfid': np.array([self._internar(v['rfid']) for v in visitas], dtype=np.uint32),
+                    'entrada': np.array([_epoch(v['entrada']) for v in visitas], dtype=np.float64),
+                    'saida': np.array([_epoch(v['saida']) for v in visitas], dtype=np.float64),
+                    'duracao': np.array([v['duracao_segundos'] for v in visitas], dtype=np.int32),
+                },
+            }
+            self._gravar_nomes()
+
+            particao = dict(novas)
+            anterior = self._indice['dias'].get(dia)
+            if anterior:
+                # Eventos atrasados de um dia já arquivado: junta com o que está lá e reordena
+                for tabela, colunas in novas.items():
+                    juntas = {nome: np.concatenate([self.coluna(dia, tabela, nome), colunas[nome]])
+                              for nome, _ in COLUNAS[tabela]}
+                    ordem = np.argsort(juntas[ORDEM[tabela]], kind='stable')
+                    particao[tabela] = {nome: coluna[ordem] for nome, coluna in juntas.items()}
+            particao['cartoes'] = _indice_cartoes(particao['visitas']['rfid'])
+
+            pasta_anterior = self._pasta(dia) if anterior else None
+            versao = anterior.get('versao', 0) + 1 if anterior else 0
+            pasta = f"{dia}.v{versao}" if versao else dia
+            caminho = os.path.join(self.diretorio, pasta)
+            temporario = caminho + '.tmp'
+            # Restos de uma gravação interrompida (o índice não os cita)
+            shutil.rmtree(temporario, ignore_errors=True)
+            shutil.rmtree(caminho, ignore_errors=True)
+            os.makedirs(temporario)
+            for tabela, colunas in particao.items():
+                for nome, tipo in COLUNAS[tabela]:
+                    with open(os.path.join(temporario, f"{tabela}_{nome}.npy"), 'wb') as f:
+                        np.save(f, colunas[nome].astype(tipo))
+                        f.flush()
+                        os.fsync(f.fileno())
+            sincronizar_diretorio(temporario)
+            os.replace(temporario, caminho)
+            sincronizar_diretorio(self.diretorio)
+
+            dias = dict(self._indice['dias'])
+            dias[dia] = {'eventos': len(particao['eventos']['rfid']), 'visitas': len(particao['visitas']['rfid'])}
+            if versao:
+                dias[dia]['versao'] = versao
+            self._gravar_indice(self._avancado(arquivado_ate, eventos_ate_seq, dias=dias))
+            self._somar_visitas(novas['visitas']['rfid'])
+
+            if pasta_anterior:
+                # Leitores com colunas já mapeadas continuam com elas; no Windows a
+                # remoção falha enquanto estiverem abertas e fica para a próxima abertura
+                self._descartar_cache(pasta_anterior)
+                shutil.rmtree(os.path.join(self.diretorio, pasta_anterior), ignore_errors=True)
+
+    def avancar(self, arquivado_ate: str, eventos_ate_seq: int):
+        """Registra que tudo antes do dia `arquivado_ate` (e do seq `eventos_ate_seq`) já está no acervo"""
+        with self._lock_escrita:
+            self._gravar_indice(self._avancado(arquivado_ate, eventos_ate_seq))
+
+    def _avancado(self, arquivado_ate: Optional[str], eventos_ate_seq: int, **alteracoes) -> Dict:
+        """Cópia do índice com as marcas avançadas (nunca voltam)"""
+        anterior = self._indice['arquivado_ate']
+        if anterior and (not arquivado_ate or anterior > arquivado_ate):
+            arquivado_ate = anterior
+        return dict(self._indice, arquivado_ate=arquivado_ate,
+                    eventos_ate_seq=max(eventos_ate_seq, self._indice['eventos_ate_seq']), **alteracoes)
+
+    def _gravar_indice(self, indice: Dict):
+        caminho = os.path.join(self.diretorio, 'indice.json')
+        with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(indice, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(caminho + '.tmp', caminho)
+        sincronizar_diretorio(self.diretorio)
+        self._publicar_indice(indice)
+
+    def _internar(self, rfid: str) -> int:
+        id_rfid = self._ids.get(rfid)
+        if id_rfid is None:
+            id_rfid = len(self._nomes)
+            self._nomes.append(rfid)
+            self._ids[rfid] = id_rfid
+        return id_rfid
+
+    def _gravar_nomes(self):
+        """Acrescenta ao rfids.txt os cartões novos, antes da partição que os usa"""
+        if self._nomes_gravados == len(self._nomes):
+            return
+        novos = self._nomes[self._nomes_gravados:]
+        with open(os.path.join(self.diretorio, 'rfids.txt'), 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(nome, ensure_ascii=False) + '\n' for nome in novos))
+            f.flush()
+            os.fsync(f.fileno())
+        self._nomes_gravados += len(novos)
+
+    # ---------- Leitura ----------
+
+    def coluna(self, dia: str, tabela: str, nome: str) -> np.ndarray:
+        """Uma coluna de uma partição (mapeada do disco, somente leitura)"""
+        pasta = self._pasta(dia)
+        chave = (pasta, tabela, nome)
+        with self._lock_cache:
+            coluna = self._cache.get(chave)
+            if coluna is not None:
+                self._cache.move_to_end(chave)
+                return coluna
+        caminho = os.path.join(self.diretorio, pasta, f"{tabela}_{nome}.npy")
+        if tabela == 'cartoes' and not os.path.exists(caminho):
+            # Partição gravada antes do índice por cartão: montado a partir da coluna rfid
+            coluna = _indice_cartoes(self.coluna(dia, 'visitas', 'rfid'))[nome]
+        else:
+            coluna = np.load(caminho, mmap_mode='r')
+        with self._lock_cache:
+            self._cache[chave] = coluna
+            while len(self._cache) > self.colunas_em_cache:
+                self._cache.popitem(last=False)
+        return coluna
+
+    def _descartar_cache(self, pasta: str):
+        with self._lock_cache:
+            for chave in [chave for chave in self._cache if chave[0] == pasta]:
+                del self._cache[chave]
+
+    def tabela(self, dia: str, tabela: str) -> Dict[str, np.ndarray]:
+        """Todas as colunas de `tabela` ('eventos' ou 'visitas') de um dia"""
+        return {nome: self.coluna(dia, tabela, nome) for nome, _ in COLUNAS[tabela]}
+
+    def _trecho_cartao(self, dia: str, id_rfid: int) -> Tuple[int, int]:
+        """Onde estão, em `cartoes_linha`, as visitas do cartão no dia ((0, 0) se não há nenhuma)"""
+        ids = self.coluna(dia, 'cartoes', 'id')
+        k = int(np.searchsorted(ids, id_rfid))
+        if k == len(ids) or ids[k] != id_rfid:
+            return 0, 0
+        inicio = self.coluna(dia, 'cartoes', 'inicio')
+        return int(inicio[k]), int(inicio[k + 1])
+
+    def buscar_saida(self, epoch: float, rfid: Optional[str] = None) -> int:
+        """
+        Posição da primeira visita arquivada com saída >= `epoch`
+
+        Com `rfid`, a posição é entre as visitas desse cartão. Só a partição
+        do dia de `epoch` é aberta (e, para um cartão, o índice por cartão
+        dos dias seguintes).
+        """
+        dia_busca = datetime.date.fromtimestamp(epoch).isoformat()
+        dias, acumulado, _ = self._vista
+        i = next((i for i, dia in enumerate(dias) if dia >= dia_busca), len(dias))
+
+        if rfid is None:
+            posicao = int(acumulado[i])
+            if i < len(dias) and dias[i] == dia_busca:
+                posicao += int(np.searchsorted(self.coluna(dias[i], 'visitas', 'saida'), epoch, side='left'))
+            return posicao
+
+        id_rfid = self._ids.get(rfid)
+        if id_rfid is None:
+            return 0
+        # De trás para frente: total do cartão menos o que ele tem do dia buscado em diante
+        posicao = self.contar_visitas(rfid)
+        for dia in dias[i:]:
+            de, ate = self._trecho_cartao(dia, id_rfid)
+            if dia == dia_busca and ate > de:
+                saidas = self.coluna(dia, 'visitas', 'saida')[self.coluna(dia, 'cartoes', 'linha')[de:ate]]
+                posicao -= len(saidas) - int(np.searchsorted(saidas, epoch, side='left'))
+            else:
+                posicao -= ate - de
+        return posicao
+
+    def visitas(self, inicio: int, fim: int, rfid: Optional[str] = None) -> List[VisitaArquivada]:
+        """
+        Visitas arquivadas nas posições [inicio, fim) (entre as do cartão, com `rfid`)
+
+        Abre só as partições que cobrem o intervalo: pelas contagens do
+        índice, ou, para um cartão, percorrendo os dias do mais recente para
+        trás (as páginas pedidas costumam ser as últimas).
+        """
+        dias, acumulado, _ = self._vista
+        trechos = []
+        if rfid is None:
+            for i, dia in enumerate(dias):
+                de, ate = int(acumulado[i]), int(acumulado[i + 1])
+                if ate <= inicio:
+                    continue
+                if de >= fim:
+                    break
+                trechos.append((dia, slice(max(inicio, de) - de, min(fim, ate) - de)))
+        else:
+            id_rfid = self._ids.get(rfid)
+            ate = self.contar_visitas(rfid)
+            for dia in reversed(dias if id_rfid is not None else []):
+                if ate <= inicio:
+                    break
+                primeira, ultima = self._trecho_cartao(dia, id_rfid)
+                selecao = self.coluna(dia, 'cartoes', 'linha')[primeira:ultima]
+                de = ate - len(selecao)
+                if de < fim and len(selecao):
+                    trechos.append((dia, selecao[max(inicio, de) - de:min(fim, ate) - de]))
+                ate = de
+            trechos.reverse()
+
+        nomes = self._nomes
+        resultado = []
+        for dia, indices in trechos:
+            colunas = [self.coluna(dia, 'visitas', nome)[indices].tolist()
+                       for nome in ('entrada', 'saida', 'duracao')]
+            # Com `rfid` o cartão já é conhecido: a coluna rfid do dia nem é aberta
+            if rfid:
+                cartoes = [rfid] * len(colunas[0])
+            else:
+                cartoes = [nomes[id_visita] for id_visita in self.coluna(dia, 'visitas', 'rfid')[indices].tolist()]
+            resultado.extend(zip(cartoes, *colunas))
+        return resultado
+
+    def percorrer_visitas(self, ate: Optional[int] = None) -> Iterator[VisitaArquivada]:
+        """Todas as visitas arquivadas (até a posição `ate`, exclusiva), um dia por vez"""
+        dias, acumulado, _ = self._vista
+        fim = int(acumulado[-1]) if ate is None else ate
+        for i in range(len(dias)):
+            if acumulado[i] >= fim:
+                return
+            yield from self.visitas(int(acumulado[i]), min(fim, int(acumulado[i + 1])))
@@ -0,0 +1,303 @@
+"""
+Análises do histórico: curvas de chegada, dias da semana, permanência e ocupação
+
+Cada dia vira um `ResumoDia` de poucos arrays NumPy, minuto a minuto:
+chegadas e saídas (`np.bincount` do minuto de cada evento), ocupação (soma
+acumulada de chegadas menos saídas) e o histograma das permanências em
+minutos. As consultas de um período só empilham e somam os resumos dos
+dias, então um mês custa alguns arrays de 1440 posições por dia.
+
+Os eventos de cada dia vêm do acervo (dias arquivados, colunas já em
+NumPy) ou do histórico e das visitas em memória. Dias passados não mudam e
+ficam em cache; um evento atrasado (lote com horário do leitor) descarta o
+resumo do dia dele. O dia de hoje é recalculado quando o estado muda.
+"""
+
+import bisect
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from gerenciador import EstadoLeitura, GerenciadorRestaurante
+
+logger = logging.getLogger(__name__)
+
+MINUTOS_DIA = 24 * 60
+PERMANENCIA_MAXIMA_MINUTOS = 240  # Acima disso as visitas vão para a última faixa
+DIAS_SEMANA = ('segunda', 'terça', 'quarta', 'quinta', 'sexta', 'sábado', 'domingo')
+MAXIMO_DIAS_PERIODO = 366
+
+
+class ResumoDia(NamedTuple):
+    """Contagens de um dia, minuto a minuto (nunca alterado depois de montado)"""
+    chegadas: np.ndarray     # entradas por minuto do dia
+    saidas: np.ndarray       # saídas por minuto do dia
+    ocupacao: np.ndarray     # pessoas dentro ao fim de cada minuto
+    permanencias: np.ndarray  # visitas com saída no dia, por minuto de duração (última faixa: acima do máximo)
+    soma_permanencias: int   # segundos
+
+
+def _resumir(meia_noite: float, timestamps: np.ndarray, saida: np.ndarray, duracoes: np.ndarray) -> ResumoDia:
+    """Monta o resumo a partir das colunas do dia (epoch, é saída?, durações em segundos)"""
+    minutos = np.clip((timestamps - meia_noite) // 60, 0, MINUTOS_DIA - 1).astype(np.intp)
+    chegadas = np.bincount(minutos[~saida], minlength=MINUTOS_DIA)
+    saidas = np.bincount(minutos[saida], minlength=MINUTOS_DIA)
+
+    # Quem entrou antes da meia-noite só aparece saindo: o menor saldo negativo é quem já estava dentro
+    ocupacao = np.cumsum(chegadas - saidas)
+    if len(timestamps):
+        ocupacao -= min(0, int(ocupacao.min()))
+
+    permanencias = np.bincount(np.minimum(duracoes // 60, PERMANENCIA_MAXIMA_MINUTOS).astype(np.intp),
+                               minlength=PERMANENCIA_MAXIMA_MINUTOS + 1)
+    return ResumoDia(chegadas, saidas, ocupacao, permanencias, int(duracoes.sum()))
+
+
+def _horario(minuto: int) -> str:
+    return f"{minuto // 60:02d}:{minuto % 60:02d}"
+
+
+def _posicao_saida(estado: EstadoLeitura, iso: str) -> int:
+    """Primeira visita em memória com saída >= `iso` (as visitas estão em ordem de saída)"""
+    return bisect.bisect_left(estado.tempos, iso, 0, estado.total_tempos, key=lambda tempo: tempo['saida'])
+
+
+class AnaliseHistorica:
+    """Consultas agregadas sobre o histórico e o acervo de um `GerenciadorRestaurante`"""
+
+    def __init__(self, gerenciador: GerenciadorRestaurante, dias_em_cache: int = 400):
+        self.gerenciador = gerenciador
+        self.dias_em_cache = dias_em_cache
+        self._cache: OrderedDict = OrderedDict()
+        self._lock_cache = threading.Lock()
+        self._hoje: Optional[Tuple[str, int, ResumoDia]] = None  # (dia, versão do estado, resumo)
+        self._descartes = 0  # resumos montados antes de um descarte não entram no cache
+
+        # Evento atrasado num dia passado: o resumo daquele dia muda
+        gerenciador.adicionar_ouvinte(self._ao_mudar)
+
+    def _ao_mudar(self, delta: Dict):
+        if delta['evento'] not in ('entrada', 'saida'):
+            return
+        dia = delta['timestamp'][:10]
+        if dia < datetime.date.today().isoformat():
+            with self._lock_cache:
+                self._descartes += 1
+                self._cache.pop(dia, None)
+
+    # ---------- Resumo de um dia ----------
+
+    def resumo_dia(self, dia: datetime.date) -> ResumoDia:
+        """Resumo de um dia (do cache, para dias passados)"""
+        chave = dia.isoformat()
+        hoje = datetime.date.today()
+        if dia >= hoje:
+            versao = self.gerenciador.estado.versao
+            atual = self._hoje
+            if atual and atual[0] == chave and atual[1] == versao:
+                return atual[2]
+            resumo = self._montar(dia)
+            self._hoje = (chave, versao, resumo)
+            return resumo
+
+        # Um dia que entrou no acervo (ou recebeu atrasados lá) muda de contagem e é refeito
+        acervo = self.gerenciador.acervo
+        marca = acervo.contagem(chave) if acervo else None
+        with self._lock_cache:
+            guardado = self._cache.get(chave)
+            if guardado is not None and guardado[0] == marca:
+                self._cache.move_to_end(chave)
+                return guardado[1]
+            descartes = self._descartes
+        resumo = self._montar(dia)
+        with self._lock_cache:
+            if self._descartes == descartes:
+                self._cache[chave] = (marca, resumo)
+                while len(self._cache) > self.dias_em_cache:
+                    self._cache.popitem(last=False)
+        return resumo
+
+    def _montar(self, dia: datetime.date) -> ResumoDia:
+        """Lê as colunas do dia no acervo ou na memória e resume"""
+        gerenciador = self.gerenciador
+        chave = dia.isoformat()
+        meia_noite = datetime.datetime.combine(dia, datetime.time())
+        fim_dia = meia_noite + datetime.timedelta(days=1)
+        acervo = gerenciador.acervo
+        arquivado = acervo is not None and acervo.arquivado_ate is not None and chave < acervo.arquivado_ate
+
+        duracoes = []
+        if arquivado and acervo.contagem(chave):
+            timestamps = acervo.coluna(chave, 'eventos', 'timestamp')
+            saida = acervo.coluna(chave, 'eventos', 'tipo') == 1
+            duracoes.append(acervo.coluna(chave, 'visitas', 'duracao'))
+        elif arquivado:
+            timestamps, saida = np.zeros(0), np.zeros(0, dtype=bool)
+        else:
+            historico = gerenciador.historico
+            eventos = historico.intervalo(historico.buscar_seq(meia_noite.timestamp()),
+                                          historico.buscar_seq(fim_dia.timestamp()))
+            timestamps = np.fromiter((epoch for _, epoch, _ in eventos), dtype=np.float64, count=len(eventos))
+            saida = np.fromiter((tipo == 'saida' for _, _, tipo in eventos), dtype=bool, count=len(eventos))
+
+        # Visitas em memória com saída no dia (num dia arquivado, só as atrasadas)
+        estado = gerenciador.estado
+        inicio = _posicao_saida(estado, meia_noite.isoformat())
+        fim = _posicao_saida(estado, fim_dia.isoformat())
+        duracoes.append(np.fromiter((estado.tempos[i]['duracao_segundos'] for i in range(inicio, fim)),
+                                    dtype=np.int64, count=fim - inicio))
+
+        return _resumir(meia_noite.timestamp(), np.asarray(timestamps), np.asarray(saida),
+                        np.concatenate(duracoes).astype(np.int64))
+
+    # ---------- Períodos ----------
+
+    def _periodo(self, inicio: datetime.date, fim: datetime.date) -> Tuple[List[datetime.date], Dict[str, np.ndarray]]:
+        """Dias de [inicio, fim] (até hoje) e os resumos empilhados: uma linha por dia"""
+        fim = min(fim, datetime.date.today())
+        if fim < inicio:
+            raise ValueError('Período vazio: fim antes do início')
+        if (fim - inicio).days >= MAXIMO_DIAS_PERIODO:
+            raise ValueError(f'Período maior que {MAXIMO_DIAS_PERIODO} dias')
+
+        dias = [inicio + datetime.timedelta(days=i) for i in range((fim - inicio).days + 1)]
+        resumos = [self.resumo_dia(dia) for dia in dias]
+        colunas = {campo: np.stack([getattr(resumo, campo) for resumo in resumos])
+                   for campo in ('chegadas', 'saidas', 'ocupacao', 'permanencias')}
+        colunas['soma_permanencias'] = np.array([resumo.soma_permanencias for resumo in resumos], dtype=np.int64)
+        return dias, colunas
+
+    def _cabecalho(self, dias: List[datetime.date], movimento: np.ndarray) -> Dict:
+        return {
+            'inicio': dias[0].isoformat(),
+            'fim': dias[-1].isoformat(),
+            'dias': len(dias),
+            'dias_com_movimento': int(np.count_nonzero(movimento))
+        }
+
+    def chegadas(self, inicio: datetime.date, fim: datetime.date, resolucao: int = 60) -> Dict:
+        """
+        Curva de chegadas ao longo do dia, somando os dias do período
+
+        `resolucao` é o tamanho da faixa em minutos (divisor de 1440); a média
+        considera só os dias com movimento.
+        """
+        if resolucao < 1 or MINUTOS_DIA % resolucao:
+            raise ValueError('Resolução deve ser um divisor de 1440 minutos')
+        dias, colunas = self._periodo(inicio, fim)
+        chegadas = colunas['chegadas']
+        movimento = chegadas.sum(axis=1) > 0
+
+        faixas = chegadas.sum(axis=0).reshape(-1, resolucao).sum(axis=1)
+        media = faixas / max(1, int(np.count_nonzero(movimento)))
+        return {
+            **self._cabecalho(dias, movimento),
+            'resolucao_minutos': resolucao,
+            'total_chegadas': int(faixas.sum()),
+            'faixas': [{'horario': _horario(i * resolucao), 'chegadas': int(total), 'media_por_dia': round(float(m), 2)}
+                       for i, (total, m) in enumerate(zip(faixas, media))]
+        }
+
+    def dias_da_semana(self, inicio: datetime.date, fim: datetime.date) -> Dict:
+        """Médias por dia da semana (dias sem movimento, como feriados, ficam de fora)"""
+        dias, colunas = self._periodo(inicio, fim)
+        entradas = colunas['chegadas'].sum(axis=1)
+        movimento = entradas > 0
+        semana = np.array([dia.weekday() for dia in dias])[movimento]
+
+        quantidade = np.bincount(semana, minlength=7)
+        divisor = np.maximum(quantidade, 1)
+        media_entradas = np.bincount(semana, weights=entradas[movimento], minlength=7) / divisor
+        media_pico = np.bincount(semana, weights=colunas['ocupacao'].max(axis=1)[movimento], minlength=7) / divisor
+        visitas = np.bincount(semana, weights=colunas['permanencias'].sum(axis=1)[movimento], minlength=7)
+        segundos = np.bincount(semana, weights=colunas['soma_permanencias'][movimento], minlength=7)
+
+        # Curva por hora de cada dia da semana: soma as horas dos dias de cada um
+        horas = colunas['chegadas'][movimento].reshape(-1, 24, 60).sum(axis=2)
+        por_hora = np.zeros((7, 24))
+        np.add.at(por_hora, semana, horas)
+        por_hora /= divisor[:, None]
+
+        return {
+            **self._cabecalho(dias, movimento),
+            'dias_da_semana': [{
+                'dia_semana': DIAS_SEMANA[i],
+                'dias': int(quantidade[i]),
+                'entradas_media': round(float(media_entradas[i]), 1),
+                'pico_medio': round(float(media_pico[i]), 1),
+                'permanencia_media_segundos': int(segundos[i] / visitas[i]) if visitas[i] else 0,
+                'chegadas_por_hora': [round(float(valor), 1) for valor in por_hora[i]]
+            } for i in range(7)]
+        }
+
+    def permanencia(self, inicio: datetime.date, fim: datetime.date, faixa: int = 5) -> Dict:
+        """Distribuição das permanências (pelo dia da saída) em faixas de `faixa` minutos"""
+        if faixa < 1 or PERMANENCIA_MAXIMA_MINUTOS % faixa:
+            raise ValueError(f'Faixa deve ser um divisor de {PERMANENCIA_MAXIMA_MINUTOS} minutos')
+        dias, colunas = self._periodo(inicio, fim)
+        por_minuto = colunas['permanencias'].sum(axis=0)
+        total = int(por_minuto.sum())
+        acumulado = np.cumsum(por_minuto)
+
+        faixas = por_minuto[:PERMANENCIA_MAXIMA_MINUTOS].reshape(-1, faixa).sum(axis=1)
+        resultado = {
+            **self._cabecalho(dias, colunas['chegadas'].sum(axis=1) > 0),
+            'total_visitas': total,
+            'media_segundos': int(colunas['soma_permanencias'].sum() / total) if total else 0,
+            'faixas': [{'de_minutos': i * faixa, 'ate_minutos': (i + 1) * faixa, 'visitas': int(quantidade)}
+                       for i, quantidade in enumerate(faixas)]
+            + [{'de_minutos': PERMANENCIA_MAXIMA_MINUTOS, 'ate_minutos': None,
+                'visitas': int(por_minuto[PERMANENCIA_MAXIMA_MINUTOS])}]
+        }
+        # Percentis com resolução de um minuto: primeira faixa em que o acumulado alcança p%
+        for p in (50, 90, 99):
+            resultado[f'p{p}_minutos'] = int(np.searchsorted(acumulado, np.ceil(total * p / 100))) if total else None
+        return resultado
+
+    def ocupacao(self, inicio: datetime.date, fim: datetime.date) -> Dict:
+        """Pico de ocupação de cada dia e de cada semana, e a curva média por hora"""
+        dias, colunas = self._periodo(inicio, fim)
+        ocupacao = colunas['ocupacao']
+        entradas = colunas['chegadas'].sum(axis=1)
+        movimento = entradas > 0
+        picos = ocupacao.max(axis=1)
+        minutos_pico = ocupacao.argmax(axis=1)
+
+        # Semanas ISO: agrupa os dias e pega o maior pico de cada uma
+        rotulos = [f"{ano}-S{semana:02d}" for ano, semana, _ in (dia.isocalendar() for dia in dias)]
+        semanas, grupo = np.unique(rotulos, return_inverse=True)
+        pico_semana = np.zeros(len(semanas), dtype=np.int64)
+        np.maximum.at(pico_semana, grupo, picos)
+        dias_semana = np.bincount(grupo, weights=movimento, minlength=len(semanas))
+        soma_picos = np.bincount(grupo, weights=picos * movimento, minlength=len(semanas))
+        entradas_semana = np.bincount(grupo, weights=entradas, minlength=len(semanas))
+
+        semanas_resultado = []
+        for i, rotulo in enumerate(semanas):
+            indices = np.flatnonzero(grupo == i)
+            maior = indices[np.argmax(picos[indices])]
+            semanas_resultado.append({
+                'semana': str(rotulo),
+                'inicio': dias[indices[0]].isoformat(),
+                'dias_com_movimento': int(dias_semana[i]),
+                'entradas': int(entradas_semana[i]),
+                'pico_maximo': int(pico_semana[i]),
+                'pico_medio': round(float(soma_picos[i] / dias_semana[i]), 1) if dias_semana[i] else 0,
+                'data_pico': dias[maior].isoformat(),
+                'horario_pico': _horario(int(minutos_pico[maior]))
+            })
+
+        curva = ocupacao[movimento].reshape(-1, 24, 60).mean(axis=2)
+        return {
+            **self._cabecalho(dias, movimento),
+            'por_dia': [{'data': dia.isoformat(), 'entradas': int(entradas[i]), 'pico': int(picos[i]),
+                         'horario_pico': _horario(int(minutos_pico[i])) if picos[i] else None}
+                        for i, dia in enumerate(dias)],
+            'por_semana': semanas_resultado,
+            'ocupacao_media_por_hora': [round(float(valor), 1) for valor in
+                                        (curva.mean(axis=0) if len(curva) else np.zeros(24))]
+        }
@@ -2,47 +2,189 @@
 API HTTP usando Flask para comunicação com ESP32 e consultas
 """
 
-from flask import Flask, request, jsonify, Response
+import datetime
+import json
+import logging
 
-from gerenciador import GerenciadorRestaurante
+from flask import Flask, g, request, jsonify, Response
+
+from analise import AnaliseHistorica
+from eventos_push import DifusorEventos
+from exportacao import comprimir_gzip
+from gerenciador import GerenciadorRestaurante, converter_timestamp
+from ingestao import FilaCheia
+from metricas import REGISTRO
 from simulador import SimuladorRestaurante
 import time
 
+logger = logging.getLogger(__name__)
+
 
 # Instância do gerenciador (será injetada pelo main)
 gerenciador: GerenciadorRestaurante = None
 simulador: SimuladorRestaurante = None
 monitor_camera = None
 
+# Maior página aceita nas consultas paginadas
+LIMITE_MAXIMO_PAGINA = 1000
+
+# Maior quantidade de eventos aceita em POST /eventos/lote
+TAMANHO_MAXIMO_LOTE = 1000
+
+# Período das análises quando ?inicio= não é informado
+DIAS_PADRAO_ANALISE = 28
+
+# Por rota (o padrão registrado, ex. /historico/<rfid>), para não criar uma série por cartão
+HTTP_DURACAO = REGISTRO.histograma(
+    'http_requisicao_segundos', 'Duração das requisições HTTP até a resposta', ('rota', 'metodo'))
+HTTP_REQUISICOES = REGISTRO.contador(
+    'http_requisicoes_total', 'Requisições HTTP respondidas', ('rota', 'metodo', 'status'))
+
 
-def criar_app(gerenciador_instancia: GerenciadorRestaurante, monitor_instancia=None) -> Flask:
-    global gerenciador
+def criar_app(gerenciador_instancia: GerenciadorRestaurante, monitor_instancia=None,
+              integrador_serial=None) -> Flask:
+    global gerenciador, simulador, monitor_camera
     gerenciador = gerenciador_instancia
     simulador = SimuladorRestaurante(gerenciador)
-    monitor_camera = monitor_instancia
+    
+    # Um monitor ou uma lista deles (uma câmera por linha de atendimento)
+    if isinstance(monitor_instancia, (list, tuple)):
+        monitores = list(monitor_instancia)
+    else:
+        monitores = [monitor_instancia] if monitor_instancia else []
+    monitor_camera = monitores[0] if monitores else None
+    monitores_por_nome = {monitor.nome: monitor for monitor in monitores}
+    
+    # Push para o dashboard: cada mudança no gerenciador vira um delta no stream
+    difusor = DifusorEventos()
+    gerenciador.adicionar_ouvinte(difusor.publicar)
+    
+    # Análises do histórico (resumos por dia em cache)
+    analise = AnaliseHistorica(gerenciador)
     
     app = Flask(__name__)
-
-    def gerar_frames():
+    
+    @app.errorhandler(FilaCheia)
+    def fila_cheia(erro):
+        """Fila de ingestão cheia: recusa rápido em vez de acumular threads esperando"""
+        resposta = jsonify({"erro": "Sistema ocupado, tente novamente", "ocupado": True})
+        resposta.headers['Retry-After'] = '1'
+        return resposta, 503
+    
+    @app.before_request
+    def iniciar_medicao():
+        g.inicio_requisicao = time.perf_counter()
+    
+    @app.after_request
+    def registrar_medicao(resposta):
+        """Streams (SSE, vídeo, NDJSON) são medidos até o início da resposta"""
+        inicio = g.pop('inicio_requisicao', None)
+        if inicio is not None:
+            rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+            HTTP_DURACAO.rotulos(rota, request.method).observar(time.perf_counter() - inicio)
+            HTTP_REQUISICOES.rotulos(rota, request.method, resposta.status_code).incrementar()
+        return resposta
+    
+    def coletar_metricas():
+        """Estado do restaurante lido sem o lock (só tamanhos e cópias atômicas)"""
+        yield ('restaurante_pessoas_dentro', 'gauge', 'Pessoas dentro do restaurante',
+               [({}, len(gerenciador.pessoas_dentro))])
+        yield ('restaurante_pessoas_na_fila', 'gauge', 'Pessoas na fila de cada linha de atendimento',
+               [({'fila': fila}, quantidade) for fila, quantidade in list(gerenciador.filas.items())])
+        yield ('restaurante_versao_estado', 'counter', 'Mudanças no estado do restaurante',
+               [({}, gerenciador.versao)])
+        yield ('restaurante_clientes_stream', 'gauge', 'Clientes conectados a /eventos/stream',
+               [({}, difusor.total_assinantes)])
+    
+    REGISTRO.coletor('restaurante', coletar_metricas)
+    
+    def ler_inteiro(nome, padrao):
+        """Lê um parâmetro inteiro da query string, usando o padrão se inválido"""
+        try:
+            return int(request.args.get(nome, padrao))
+        except (TypeError, ValueError):
+            return padrao
+    
+    def ler_intervalo():
+        """Lê ?inicio=, ?fim= (ISO 8601 ou epoch) e ?cursor=; levanta ValueError se inválidos"""
+        limites = []
+        for nome in ("inicio", "fim"):
+            bruto = request.args.get(nome)
+            if bruto is None:
+                limites.append(None)
+                continue
+            try:
+                bruto = float(bruto)
+            except ValueError:
+                pass
+            limites.append(converter_timestamp(bruto))
+        
+        cursor = request.args.get("cursor")
+        if cursor is not None:
+            if not cursor.isdigit():
+                raise ValueError("Cursor inválido")
+            cursor = int(cursor)
+        return limites[0], limites[1], cursor
+    
+    def ler_periodo():
+        """Lê ?inicio= e ?fim= (AAAA-MM-DD, fim inclusive); padrão: as últimas semanas até hoje"""
+        try:
+            fim = datetime.date.fromisoformat(request.args.get("fim", datetime.date.today().isoformat()))
+            inicio = request.args.get("inicio")
+            inicio = datetime.date.fromisoformat(inicio) if inicio else fim - datetime.timedelta(days=DIAS_PADRAO_ANALISE - 1)
+        except ValueError:
+            raise ValueError("Data inválida (use AAAA-MM-DD)")
+        return inicio, fim
+    
+    def gerar_ndjson(consultar, chave, cursor):
+        """Percorre uma consulta paginada inteira, uma linha JSON por item"""
         while True:
-            if monitor_camera:
-                frame = monitor_camera.obter_frame()
-                if frame:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                else:
-                    # Se não tiver frame ainda, espera um pouco para não travar a CPU
-                    time.sleep(0.1)
-            else:
-                break
-    
-            # Pequena pausa para liberar recursos do servidor para outras rotas
-            time.sleep(0.01)
+            pagina = consultar(cursor)
+            for item in pagina[chave]:
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            cursor = pagina['proximo_cursor']
+            if cursor is None:
+                return
 
     @app.route('/video_feed')
-    def video_feed():
-        """Rota que transmite o vídeo"""
-        return Response(gerar_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    @app.route('/video_feed/<nome>')
+    def video_feed(nome=None):
+        """Rota que transmite o vídeo (da primeira câmera ou da câmera `nome`)"""
+        monitor = monitores_por_nome.get(nome) if nome else monitor_camera
+        if nome and monitor is None:
+            return jsonify({"erro": f"Câmera {nome} não encontrada"}), 404
+        if not monitor or not monitor.rodando:
+            return Response(status=204)
+        return Response(monitor.gerar_stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+    @app.route('/metrics')
+    def metricas():
+        """Métricas no formato de texto do Prometheus"""
+        return Response(REGISTRO.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    @app.route('/exportar')
+    def exportar():
+        """
+        Exportação completa em NDJSON, gerada enquanto é enviada (nada fica inteiro na memória)
+        ?compactar=1 envia em gzip
+        """
+        nome = datetime.datetime.now().strftime('exportacao_%Y%m%d_%H%M%S.ndjson')
+        linhas = gerenciador.gerar_exportacao()
+        if request.args.get("compactar") in ("1", "true"):
+            return Response(comprimir_gzip(linhas), mimetype='application/gzip',
+                            headers={'Content-Disposition': f'attachment; filename="{nome}.gz"'})
+        return Response(linhas, mimetype='application/x-ndjson',
+                        headers={'Content-Disposition': f'attachment; filename="{nome}"'})
+
+    @app.route('/catracas')
+    def catracas():
+        """Conexão, vazão e erros de cada catraca ligada na serial"""
+        return jsonify(integrador_serial.obter_estatisticas() if integrador_serial else [])
+
+    @app.route('/camera/estatisticas')
+    def camera_estatisticas():
+        """Custo da detecção e estabilidade da contagem de cada câmera"""
+        return jsonify([monitor.obter_estatisticas() for monitor in monitores])
 
     @app.route("/simular/entrada", methods=["POST"])
     def simular_entrada():
@@ -65,36 +207,92 @@ def criar_app(gerenciador_instancia: GerenciadorRestaurante, monitor_instancia=N
     def evento():
         """
         Endpoint para ESP32 enviar eventos via HTTP
-        Body JSON: {"tipo": "ENTRADA" ou "SAIDA", "rfid": "RFID_123"}
+        Body JSON: {"tipo": "ENTRADA" ou "SAIDA", "rfid": "RFID_123", "catraca": "opcional"}
         """
-        print("\n🔔 Requisição recebida em /evento")
-        print(f"   Headers: {dict(request.headers)}")
-        print(f"   Body raw: {request.get_data()}")
+        # Cópia completa da requisição só com DEBUG ligado (ex.: NIVEIS_LOG_MODULOS = {"api": "DEBUG"})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔔 Requisição em /evento | Headers: %s | Body: %r",
+                         dict(request.headers), request.get_data())
         
         dados = request.get_json(silent=True)
-        print(f"   JSON parsed: {dados}")
         
         if not dados:
-            print("   ❌ JSON inválido!")
+            logger.warning("❌ JSON inválido em /evento de %s", request.remote_addr)
             return jsonify({"erro": "JSON inválido"}), 400
         
         tipo = dados.get("tipo", "").upper()
         rfid = dados.get("rfid")
         
-        print(f"   Tipo: {tipo}, RFID: {rfid}")
-        
         if not rfid or tipo not in ("ENTRADA", "SAIDA"):
-            print("   ❌ Campos inválidos!")
+            logger.warning("❌ Campos inválidos em /evento de %s: %s", request.remote_addr, dados)
             return jsonify({"erro": "Campos 'tipo' ou 'rfid' inválidos"}), 400
         
+        catraca = dados.get("catraca")
+        catraca = str(catraca) if catraca is not None else None
         if tipo == "ENTRADA":
-            resp = gerenciador.registrar_entrada(rfid)
+            resp = gerenciador.registrar_entrada(rfid, catraca)
         else:
-            resp = gerenciador.registrar_saida(rfid)
+            resp = gerenciador.registrar_saida(rfid, catraca)
         
-        print(f"   ✓ Resposta: {resp}\n")
+        logger.debug("✓ Resposta de /evento: %s", resp)
         return jsonify(resp)
     
+    @app.route("/eventos/lote", methods=["POST"])
+    def eventos_lote():
+        """
+        Recebe vários eventos de uma vez (leitores que acumulam offline)
+        Body JSON: {"eventos": [{"tipo": "ENTRADA", "rfid": "RFID_123",
+                                 "timestamp": "2025-01-10T11:32:05"}, ...]}
+        """
+        dados = request.get_json(silent=True)
+        eventos = dados.get("eventos") if isinstance(dados, dict) else dados
+        
+        if not isinstance(eventos, list):
+            return jsonify({"erro": "JSON inválido: esperado lista 'eventos'"}), 400
+        if len(eventos) > TAMANHO_MAXIMO_LOTE:
+            return jsonify({"erro": f"Lote maior que {TAMANHO_MAXIMO_LOTE} eventos"}), 413
+        
+        resultados = gerenciador.registrar_lote(eventos)
+        return jsonify({
+            "total": len(resultados),
+            "sucessos": sum(1 for r in resultados if r.get("sucesso")),
+            "resultados": resultados
+        })
+    
+    @app.route("/eventos/stream", methods=["GET"])
+    def eventos_stream():
+        """Stream Server-Sent Events com entradas, saídas e mudanças na fila"""
+        return Response(
+            difusor.gerar_stream(),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    # Identifica esta execução: a versão do estado recomeça do zero a cada início
+    instancia = format(int(time.time()), 'x')
+    
+    @app.route("/snapshot", methods=["GET"])
+    def snapshot():
+        """
+        Status, visitas recentes e pessoas dentro numa única resposta
+        
+        A resposta leva a versão do estado como ETag; com If-None-Match igual
+        à versão atual retorna 304 sem montar nada nem tomar o lock.
+        """
+        data_hoje = time.strftime('%Y-%m-%d')
+        etag = f'"{instancia}-{gerenciador.versao}-{data_hoje}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            resposta = Response(status=304)
+        else:
+            limite = min(ler_inteiro("limite_tempos", 20), LIMITE_MAXIMO_PAGINA)
+            dados = gerenciador.obter_snapshot(limite)
+            resposta = jsonify(dados)
+            etag = f'"{instancia}-{dados["versao"]}-{data_hoje}"'
+        
+        resposta.headers['ETag'] = etag
+        resposta.headers['Cache-Control'] = 'no-cache'
+        return resposta
+    
     @app.route("/status", methods=["GET"])
     def status():
         """Retorna status atual do restaurante"""
@@ -344,9 +542,10 @@ def criar_app(gerenciador_instancia: GerenciadorRestaurante, monitor_instancia=N
             <div style="margin-top: 15px; font-size: 1.2em;">
                 Pessoas na Fila (Detecção): <strong id="num-fila">0</strong>
             </div>
+            <div id="filas-linhas" style="margin-top: 5px; color: #666;"></div>
         </div>
         
-        <p class="refresh-info">⟳ Atualização automática a cada 3 segundos</p>
+        <p class="refresh-info">⟳ Atualização em tempo real</p>
         
         <div id="toast">Ação realizada</div>
     </div>
@@ -371,8 +570,6 @@ def criar_app(gerenciador_instancia: GerenciadorRestaurante, monitor_instancia=N
                 
                 if(data.mensagem) mostrarToast(data.mensagem);
                 else mostrarToast("Sucesso: " + acao);
-                
-                atualizarDados(); 
             } catch (e) { console.error(e); }
         }
 
@@ -390,7 +587,6 @@ def criar_app(gerenciador_instancia: GerenciadorRestaurante, monitor_instancia=N
                 body: JSON.stringify({ acao: 'fila', qtd: qtd }),
             });
             mostrarToast("Fila definida: " + qtd);
-            atualizarDados();
         }
         
         function formatarTempo(segundos) {
@@ -413,84 +609,150 @@ def criar_app(gerenciador_instancia: GerenciadorRestaurante, monitor_instancia=N
             return formatarTempo(diff);
         }
         
+        // Estado local do dashboard; carregado por completo de /snapshot e
+        // depois mantido pelos deltas do stream /eventos/stream
+        let versao = -1;
+        let status = {};
+        let tempos = [];
+        const entradasDentro = {};  // rfid -> horário de entrada
+        
+        function renderizarStats() {
+            document.getElementById("stats").innerHTML = `
+                <div class="stat-card">
+                    <div class="stat-label">👥 Pessoas Dentro</div>
+                    <div class="stat-value">${status.pessoas_dentro || 0}</div>
+                </div>
+                <div class="stat-card">
+                    <div class="stat-label">📥 Entradas Hoje</div>
+                    <div class="stat-value">${status.entradas_hoje || 0}</div>
+                </div>
+                <div class="stat-card">
+                    <div class="stat-label">📤 Saídas Hoje</div>
+                    <div class="stat-value">${status.saidas_hoje || 0}</div>
+                </div>
+                <div class="stat-card">
+                    <div class="stat-label">👨‍👩‍👧‍👦 Fila (Câmera)</div>
+                    <div class="stat-value">${status.pessoas_na_fila || 0}</div>
+                </div>
+            `;
+            document.getElementById("num-fila").innerText = status.pessoas_na_fila || 0;
+            
+            // Com mais de uma linha de atendimento, mostra a contagem de cada uma
+            const filas = Object.entries(status.filas || {});
+            document.getElementById("filas-linhas").innerText = filas.length > 1
+                ? filas.map(([nome, qtd]) => `${nome}: ${qtd}`).join(" · ")
+                : "";
+        }
+        
+        function renderizarTempos() {
+            const temposBody = document.getElementById("temposBody");
+            if (tempos.length === 0) {
+                temposBody.innerHTML = `<tr><td colspan="4" class="empty-state">Nenhum registro ainda</td></tr>`;
+            } else {
+                // Mais recentes primeiro
+                temposBody.innerHTML = tempos.slice(-20).reverse().map(t => `
+                    <tr>
+                        <td><strong>${t.rfid}</strong></td>
+                        <td>${new Date(t.entrada).toLocaleString("pt-BR")}</td>
+                        <td>${new Date(t.saida).toLocaleString("pt-BR")}</td>
+                        <td><strong>${t.duracao_formatada}</strong></td>
+                    </tr>
+                `).join("");
+            }
+        }
+        
+        function renderizarDentro() {
+            const dentroBody = document.getElementById("dentroBody");
+            const pessoasDentro = Object.keys(entradasDentro);
+            
+            if (pessoasDentro.length === 0) {
+                dentroBody.innerHTML = `<tr><td colspan="4" class="empty-state">Nenhuma pessoa dentro no momento</td></tr>`;
+            } else {
+                dentroBody.innerHTML = pessoasDentro.map(rfid => {
+                    const entrada = entradasDentro[rfid] || "--";
+                    const tempoDecorrido = entrada !== "--" ? calcularTempoDecorrido(entrada) : "--";
+                    
+                    return `
+                        <tr>
+                            <td><strong>${rfid}</strong></td>
+                            <td>${entrada !== "--" ? new Date(entrada).toLocaleString("pt-BR") : "--"}</td>
+                            <td><strong>${tempoDecorrido}</strong></td>
+                            <td><span class="badge badge-dentro">Dentro</span></td>
+                        </tr>
+                    `;
+                }).join("");
+            }
+        }
+        
         async function atualizarDados() {
             try {
-                // Status geral
-                const statusResp = await fetch("/status");
-                const status = await statusResp.json();
+                // Tudo numa consulta; se nada mudou o servidor responde 304 e o
+                // navegador reaproveita a última resposta
+                const resp = await fetch("/snapshot");
+                const snapshot = await resp.json();
                 
-                document.getElementById("stats").innerHTML = `
-                    <div class="stat-card">
-                        <div class="stat-label">👥 Pessoas Dentro</div>
-                        <div class="stat-value">${status.pessoas_dentro || 0}</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-label">📥 Entradas Hoje</div>
-                        <div class="stat-value">${status.entradas_hoje || 0}</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-label">📤 Saídas Hoje</div>
-                        <div class="stat-value">${status.saidas_hoje || 0}</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-label">👨‍👩‍👧‍👦 Fila (Câmera)</div>
-                        <div class="stat-value">${status.pessoas_na_fila || 0}</div>
-                    </div>
-                `;
+                versao = snapshot.versao;
+                status = snapshot.status;
+                tempos = snapshot.tempos_recentes;
                 
-                // Tempos de permanência
-                const temposResp = await fetch("/tempos");
-                const tempos = await temposResp.json();
+                for (const rfid in entradasDentro) delete entradasDentro[rfid];
+                snapshot.pessoas_dentro.forEach(p => { entradasDentro[p.rfid] = p.entrada; });
                 
-                const temposBody = document.getElementById("temposBody");
-                if (tempos.length === 0) {
-                    temposBody.innerHTML = `<tr><td colspan="4" class="empty-state">Nenhum registro ainda</td></tr>`;
-                } else {
-                    temposBody.innerHTML = tempos.slice(0, 20).map(t => `
-                        <tr>
-                            <td><strong>${t.rfid}</strong></td>
-                            <td>${new Date(t.entrada).toLocaleString("pt-BR")}</td>
-                            <td>${new Date(t.saida).toLocaleString("pt-BR")}</td>
-                            <td><strong>${t.duracao_formatada}</strong></td>
-                        </tr>
-                    `).join("");
-                }
-                
-                // Pessoas dentro
-                const dentroBody = document.getElementById("dentroBody");
-                const pessoasDentro = status.rfids_dentro || [];
-                
-                if (pessoasDentro.length === 0) {
-                    dentroBody.innerHTML = `<tr><td colspan="4" class="empty-state">Nenhuma pessoa dentro no momento</td></tr>`;
-                } else {
-                    const historico = await fetch("/historico?limite=100");
-                    const registros = await historico.json();
-                    
-                    dentroBody.innerHTML = pessoasDentro.map(rfid => {
-                        // Encontra última entrada (tipo em minúsculo)
-                        const ultimaEntrada = registros.find(r => r.rfid === rfid && r.tipo.toLowerCase() === "entrada");
-                        const entrada = ultimaEntrada ? ultimaEntrada.timestamp : "--";
-                        const tempoDecorrido = ultimaEntrada ? calcularTempoDecorrido(entrada) : "--";
-                        
-                        return `
-                            <tr>
-                                <td><strong>${rfid}</strong></td>
-                                <td>${entrada !== "--" ? new Date(entrada).toLocaleString("pt-BR") : "--"}</td>
-                                <td><strong>${tempoDecorrido}</strong></td>
-                                <td><span class="badge badge-dentro">Dentro</span></td>
-                            </tr>
-                        `;
-                    }).join("");
-                }
+                renderizarStats();
+                renderizarTempos();
+                renderizarDentro();
                 
             } catch (error) {
                 console.error("Erro ao carregar dados:", error);
             }
         }
         
-        // Atualiza a cada 3 segundos
-        atualizarDados();
-        setInterval(atualizarDados, 3000);
+        function aplicarDelta(delta) {
+            // Delta já incluído no último snapshot carregado
+            if (delta.versao <= versao) return;
+            versao = delta.versao;
+            
+            status.pessoas_dentro = delta.pessoas_dentro;
+            status.pessoas_na_fila = delta.pessoas_na_fila;
+            if (delta.filas) status.filas = delta.filas;
+            status.entradas_hoje = delta.entradas_hoje;
+            status.saidas_hoje = delta.saidas_hoje;
+            
+            if (delta.evento === "entrada") {
+                entradasDentro[delta.rfid] = delta.timestamp;
+                renderizarDentro();
+            } else if (delta.evento === "saida") {
+                delete entradasDentro[delta.rfid];
+                if (delta.tempo_permanencia) {
+                    tempos.push(delta.tempo_permanencia);
+                    tempos = tempos.slice(-20);
+                }
+                renderizarDentro();
+                renderizarTempos();
+            }
+            renderizarStats();
+        }
+        
+        function conectarStream() {
+            if (!window.EventSource) {
+                // Navegador sem SSE: volta para a consulta periódica
+                atualizarDados();
+                setInterval(atualizarDados, 3000);
+                return;
+            }
+            
+            const stream = new EventSource("/eventos/stream");
+            ["entrada", "saida", "fila"].forEach(tipo =>
+                stream.addEventListener(tipo, e => aplicarDelta(JSON.parse(e.data))));
+            // Cliente ficou para trás e perdeu deltas: recarrega tudo
+            stream.addEventListener("resync", atualizarDados);
+            // (Re)conexão: carrega o estado completo uma vez
+            stream.onopen = atualizarDados;
+        }
+        
+        conectarStream();
+        // O tempo decorrido muda sem eventos: recalculado localmente, sem consultar o servidor
+        setInterval(renderizarDentro, 1000);
     </script>
 </body>
 </html>
@@ -505,22 +767,111 @@ def criar_app(gerenciador_instancia: GerenciadorRestaurante, monitor_instancia=N
     
     @app.route("/historico", methods=["GET"])
     def historico():
-        """Retorna histórico (opcional: ?limite=50)"""
+        """
+        Retorna histórico (opcional: ?limite=50)
+        
+        Com ?inicio=, ?fim= (ISO 8601 ou epoch) ou ?cursor= retorna
+        {"eventos": [...], "proximo_cursor": ...}; com ?formato=ndjson o
+        intervalo inteiro é enviado em streaming, um evento por linha.
+        """
         try:
             limite = int(request.args.get("limite", 100))
         except ValueError:
             limite = 100
-        return jsonify(gerenciador.obter_historico(limite))
+        
+        if not any(nome in request.args for nome in ("inicio", "fim", "cursor", "formato")):
+            return jsonify(gerenciador.obter_historico(limite))
+        
+        try:
+            inicio, fim, cursor = ler_intervalo()
+        except ValueError as e:
+            return jsonify({"erro": str(e)}), 400
+        
+        if request.args.get("formato") == "ndjson":
+            consultar = lambda c: gerenciador.consultar_historico(inicio, fim, c, LIMITE_MAXIMO_PAGINA)
+            return Response(gerar_ndjson(consultar, "eventos", cursor), mimetype='application/x-ndjson')
+        
+        limite = min(limite, LIMITE_MAXIMO_PAGINA)
+        return jsonify(gerenciador.consultar_historico(inicio, fim, cursor, limite))
+    
+    @app.route("/historico/<rfid>", methods=["GET"])
+    def historico_rfid(rfid):
+        """Retorna entradas/saídas de um cartão (opcional: ?limite=50&offset=0)"""
+        limite = min(ler_inteiro("limite", 100), LIMITE_MAXIMO_PAGINA)
+        offset = ler_inteiro("offset", 0)
+        return jsonify(gerenciador.obter_historico_rfid(rfid, limite, offset))
     
     @app.route("/tempos", methods=["GET"])
     def tempos_permanencia():
-        """Retorna tempos de permanência (opcional: ?rfid=RFID_123)"""
+        """
+        Retorna tempos de permanência (opcional: ?rfid=RFID_123&limite=50&offset=0)
+        
+        Com ?rfid= a resposta é paginada (padrão: 100 visitas mais recentes).
+        O total de visitas vai no cabeçalho X-Total-Count.
+        
+        Com ?inicio=, ?fim= (horário da saída) ou ?cursor= retorna
+        {"tempos": [...], "proximo_cursor": ...}; com ?formato=ndjson o
+        intervalo inteiro é enviado em streaming, uma visita por linha.
+        """
         rfid = request.args.get("rfid")
-        return jsonify(gerenciador.obter_tempos_permanencia(rfid))
+        
+        if any(nome in request.args for nome in ("inicio", "fim", "cursor", "formato")):
+            try:
+                inicio, fim, cursor = ler_intervalo()
+            except ValueError as e:
+                return jsonify({"erro": str(e)}), 400
+            
+            if request.args.get("formato") == "ndjson":
+                consultar = lambda c: gerenciador.consultar_tempos_permanencia(
+                    rfid, inicio, fim, c, LIMITE_MAXIMO_PAGINA)
+                return Response(gerar_ndjson(consultar, "tempos", cursor), mimetype='application/x-ndjson')
+            
+            limite = min(ler_inteiro("limite", 100), LIMITE_MAXIMO_PAGINA)
+            return jsonify(gerenciador.consultar_tempos_permanencia(rfid, inicio, fim, cursor, limite))
+        
+        limite = ler_inteiro("limite", 100 if rfid else None)
+        if limite is not None:
+            limite = min(limite, LIMITE_MAXIMO_PAGINA)
+        offset = ler_inteiro("offset", 0)
+        
+        resposta = jsonify(gerenciador.obter_tempos_permanencia(rfid, limite, offset))
+        resposta.headers['X-Total-Count'] = str(gerenciador.contar_tempos_permanencia(rfid))
+        return resposta
     
     @app.route("/estatisticas-tempo", methods=["GET"])
     def estatisticas_tempo():
-        """Retorna estatísticas de tempo de permanência"""
-        return jsonify(gerenciador.obter_estatisticas_tempo())
+        """Retorna estatísticas de tempo de permanência (opcional: ?data=2025-01-10)"""
+        data = request.args.get("data")
+        return jsonify(gerenciador.obter_estatisticas_tempo(data))
+    
+    # ---------- Análises do histórico (?inicio=AAAA-MM-DD&fim=AAAA-MM-DD) ----------
+    
+    def responder_analise(consultar):
+        try:
+            return jsonify(consultar(*ler_periodo()))
+        except ValueError as e:
+            return jsonify({"erro": str(e)}), 400
+    
+    @app.route("/analise/chegadas", methods=["GET"])
+    def analise_chegadas():
+        """Curva de chegadas ao longo do dia (opcional: ?resolucao=60, em minutos)"""
+        resolucao = ler_inteiro("resolucao", 60)
+        return responder_analise(lambda inicio, fim: analise.chegadas(inicio, fim, resolucao))
+    
+    @app.route("/analise/dias-semana", methods=["GET"])
+    def analise_dias_semana():
+        """Médias de entradas, pico e permanência por dia da semana"""
+        return responder_analise(analise.dias_da_semana)
+    
+    @app.route("/analise/permanencia", methods=["GET"])
+    def analise_permanencia():
+        """Distribuição dos tempos de permanência (opcional: ?faixa=5, em minutos)"""
+        faixa = ler_inteiro("faixa", 5)
+        return responder_analise(lambda inicio, fim: analise.permanencia(inicio, fim, faixa))
+    
+    @app.route("/analise/ocupacao", methods=["GET"])
+    def analise_ocupacao():
+        """Pico de ocupação por dia e por semana, e a ocupação média por hora"""
+        return responder_analise(analise.ocupacao)
     
     return app
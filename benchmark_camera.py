@@ -0,0 +1,138 @@
+"""
+Benchmark offline do pipeline da câmera
+
+Roda redimensionamento, detecção HOG, desenho e codificação JPEG sobre uma
+fonte de frames (gerador sintético por padrão, ou vídeo/imagens) e mede,
+para cada combinação de largura, winStride e scale:
+- latência média e p95 de cada estágio (ms);
+- FPS sustentado do pipeline completo;
+- uso de CPU do processo (100% = um núcleo inteiro).
+
+Exemplos:
+    python benchmark_camera.py
+    python benchmark_camera.py --fonte video.mp4 --quadros 300 --larguras 320,500,640
+    python benchmark_camera.py --win-strides 4,8 --escalas 1.05,1.2 --json resultado.json
+"""
+
+import argparse
+import itertools
+import json
+import time
+from typing import Dict, List
+
+import cv2
+
+from camera_monitor import _desenhar_caixas, _detectar_pessoas
+from fontes_video import FonteSintetica, abrir_fonte
+
+
+ESTAGIOS = ('redimensionar', 'detectar', 'desenhar', 'codificar')
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def _abrir(fonte: str, quadros: int):
+    if fonte == 'sintetico' or fonte.startswith('sintetico:'):
+        _, _, pessoas = fonte.partition(':')
+        return FonteSintetica(int(pessoas) if pessoas else 4, total_quadros=quadros)
+    return abrir_fonte(fonte, repetir=True)
+
+
+def medir(fonte: str, quadros: int, largura: int, win_stride: int, escala: float) -> Dict:
+    """Roda o pipeline em `quadros` frames e devolve as medidas de uma configuração"""
+    hog = cv2.HOGDescriptor()
+    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    cap = _abrir(fonte, quadros)
+    if not cap.isOpened():
+        raise SystemExit(f"Não foi possível abrir a fonte {fonte}")
+
+    tempos = {estagio: [] for estagio in ESTAGIOS}
+    pessoas = 0
+    processados = 0
+    tamanho = None
+    relogio = time.perf_counter
+
+    inicio, inicio_cpu = relogio(), time.process_time()
+    while processados < quadros:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        t0 = relogio()
+        if tamanho is None:
+            tamanho = (largura, int(frame.shape[0] * largura / frame.shape[1]))
+        frame = cv2.resize(frame, tamanho)
+        t1 = relogio()
+        caixas = _detectar_pessoas(hog, frame, win_stride=(win_stride, win_stride), escala=escala)
+        t2 = relogio()
+        _desenhar_caixas(frame, caixas, f"Fila: {len(caixas)}")
+        t3 = relogio()
+        cv2.imencode('.jpg', frame)
+        t4 = relogio()
+
+        for estagio, duracao in zip(ESTAGIOS, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)):
+            tempos[estagio].append(duracao * 1000)
+        pessoas += len(caixas)
+        processados += 1
+
+    duracao, cpu = relogio() - inicio, time.process_time() - inicio_cpu
+    cap.release()
+    if not processados:
+        raise SystemExit(f"A fonte {fonte} não entregou nenhum frame")
+
+    return {
+        'largura': largura,
+        'win_stride': win_stride,
+        'escala': escala,
+        'quadros': processados,
+        'fps': round(processados / duracao, 1),
+        'uso_cpu_percentual': round(100 * cpu / duracao, 1),
+        'pessoas_por_quadro': round(pessoas / processados, 2),
+        'estagios_ms': {estagio: {'media': round(sum(valores) / len(valores), 2),
+                                  'p95': round(_percentil(valores, 0.95), 2)}
+                        for estagio, valores in tempos.items()}
+    }
+
+
+def _lista(tipo):
+    return lambda texto: [tipo(v) for v in texto.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline da câmera")
+    parser.add_argument('--fonte', default='sintetico',
+                        help='"sintetico[:N]", arquivo de vídeo, diretório ou padrão de imagens')
+    parser.add_argument('--quadros', type=int, default=100, help='frames por configuração')
+    parser.add_argument('--larguras', type=_lista(int), default=[320, 500], help='ex.: 320,500,640')
+    parser.add_argument('--win-strides', type=_lista(int), default=[4, 8], help='ex.: 4,8')
+    parser.add_argument('--escalas', type=_lista(float), default=[1.05], help='ex.: 1.05,1.1')
+    parser.add_argument('--json', help='grava os resultados neste arquivo')
+    args = parser.parse_args()
+
+    print(f"Benchmark: fonte={args.fonte}, {args.quadros} frames por configuração\n")
+    cabecalho = (f"{'largura':>7} {'stride':>6} {'escala':>6} {'fps':>7} {'cpu%':>6} {'pess.':>5}  "
+                 + "  ".join(f"{e + ' ms (p95)':>22}" for e in ESTAGIOS))
+    print(cabecalho)
+    print("-" * len(cabecalho))
+
+    resultados = []
+    for largura, win_stride, escala in itertools.product(args.larguras, args.win_strides, args.escalas):
+        r = medir(args.fonte, args.quadros, largura, win_stride, escala)
+        resultados.append(r)
+        estagios = "  ".join(f"{r['estagios_ms'][e]['media']:>12.2f} ({r['estagios_ms'][e]['p95']:>7.2f})"
+                             for e in ESTAGIOS)
+        print(f"{largura:>7} {win_stride:>6} {escala:>6.2f} {r['fps']:>7.1f} "
+              f"{r['uso_cpu_percentual']:>6.1f} {r['pessoas_por_quadro']:>5.2f}  {estagios}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados gravados em {args.json}")
+
+
+if __name__ == "__main__":
+    main()
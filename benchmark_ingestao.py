@@ -0,0 +1,121 @@
+"""
+Benchmark da ingestão de batidas: lock por chamada x fila com escritor único
+
+Dispara uma rajada de batidas (metade entradas, metade saídas dos mesmos
+cartões) a partir de várias threads produtoras, como os workers do Flask
+fariam, e mede para cada modo:
+- vazão da rajada inteira (batidas/s);
+- latência de cada chamada, mediana e p99 (ms);
+- quantas vezes o lock do gerenciador foi tomado.
+
+Exemplos:
+    python benchmark_ingestao.py
+    python benchmark_ingestao.py --batidas 5000 --produtores 4,16,64 --diario
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from diario import DiarioEventos
+from gerenciador import GerenciadorRestaurante
+from ingestao import FilaIngestao
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+class _ContadorLock:
+    """Envolve o lock do gerenciador contando as aquisições"""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self.aquisicoes = 0
+
+    def __enter__(self):
+        self._lock.__enter__()
+        self.aquisicoes += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.__exit__(*exc)
+
+
+def medir(modo: str, batidas: int, produtores: int, com_diario: bool) -> Dict:
+    diretorio = tempfile.TemporaryDirectory() if com_diario else None
+    diario = DiarioEventos(diretorio.name) if diretorio else None
+    gerenciador = GerenciadorRestaurante(diario, eventos_por_snapshot=10 ** 9)
+    if diario:
+        diario.iniciar()
+    lock = gerenciador.lock = _ContadorLock(gerenciador.lock)
+
+    if modo == 'fila':
+        gerenciador.ingestao = FilaIngestao(gerenciador.registrar_grupo, capacidade=batidas)
+        gerenciador.ingestao.iniciar()
+
+    # Cada produtor bate a entrada e depois a saída dos seus cartões
+    cartoes_por_produtor = max(1, batidas // (2 * produtores))
+    latencias: List[float] = []
+    largada = threading.Barrier(produtores + 1)
+
+    def produzir(indice: int):
+        cartoes = [f"RFID_{indice}_{i}" for i in range(cartoes_por_produtor)]
+        medidas = []
+        largada.wait()
+        for registrar in (gerenciador.registrar_entrada, gerenciador.registrar_saida):
+            for rfid in cartoes:
+                inicio = time.perf_counter()
+                registrar(rfid)
+                medidas.append(time.perf_counter() - inicio)
+        latencias.extend(medidas)
+
+    threads = [threading.Thread(target=produzir, args=(i,)) for i in range(produtores)]
+    for thread in threads:
+        thread.start()
+    largada.wait()
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+
+    if gerenciador.ingestao:
+        gerenciador.ingestao.parar()
+    if diario:
+        diario.fechar()
+        diretorio.cleanup()
+
+    return {
+        'modo': modo,
+        'produtores': produtores,
+        'batidas': len(latencias),
+        'vazao': len(latencias) / duracao,
+        'mediana_ms': _percentil(latencias, 0.5) * 1000,
+        'p99_ms': _percentil(latencias, 0.99) * 1000,
+        'aquisicoes_lock': lock.aquisicoes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--batidas', type=int, default=1000, help='Tamanho da rajada')
+    parser.add_argument('--produtores', default='8,32', help='Threads produtoras (lista separada por vírgula)')
+    parser.add_argument('--diario', action='store_true', help='Grava o diário em disco (diretório temporário)')
+    parser.add_argument('--repeticoes', type=int, default=3, help='Rodadas por combinação (vale a mediana da vazão)')
+    args = parser.parse_args()
+
+    print(f"{'modo':<6} {'prod':>5} {'batidas/s':>10} {'mediana ms':>11} {'p99 ms':>8} {'locks':>6}")
+    for produtores in (int(valor) for valor in args.produtores.split(',')):
+        for modo in ('lock', 'fila'):
+            rodadas = sorted((medir(modo, args.batidas, produtores, args.diario)
+                              for _ in range(args.repeticoes)), key=lambda r: r['vazao'])
+            r = rodadas[len(rodadas) // 2]
+            print(f"{r['modo']:<6} {r['produtores']:>5} {r['vazao']:>10.0f} {r['mediana_ms']:>11.3f} "
+                  f"{r['p99_ms']:>8.3f} {r['aquisicoes_lock']:>6}")
+
+
+if __name__ == "__main__":
+    main()
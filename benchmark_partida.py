@@ -0,0 +1,122 @@
+"""
+Benchmark da partida: tempo até o gerenciador ficar pronto com um histórico grande
+
+Gera um histórico sintético (por padrão 1 milhão de eventos: entradas e
+saídas de 20 mil cartões ao longo de semanas), grava o estado em cada
+formato e mede quanto tempo um gerenciador novo leva para carregá-lo:
+- snapshot binário (o que o diário grava hoje);
+- snapshot JSON (formato anterior, ainda lido);
+- importação do dados_ru.json (exportar_dados);
+- importação da exportação NDJSON compactada.
+
+Exemplos:
+    python benchmark_partida.py
+    python benchmark_partida.py --eventos 200000 --cartoes 5000
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from diario import DiarioEventos
+from exportacao import exportar_ndjson, ler_exportacao
+from gerenciador import GerenciadorRestaurante
+from historico import HistoricoEventos
+
+CAPACIDADE_HISTORICO = 10000
+
+
+def _gerenciador(diretorio: str) -> GerenciadorRestaurante:
+    return GerenciadorRestaurante(
+        DiarioEventos(diretorio), 10 ** 9,
+        HistoricoEventos(CAPACIDADE_HISTORICO, os.path.join(diretorio, 'historico')))
+
+
+def gerar(diretorio: str, eventos: int, cartoes: int) -> GerenciadorRestaurante:
+    """Registra `eventos` batidas (metade entradas, metade saídas) terminando agora"""
+    gerenciador = _gerenciador(diretorio)
+    visitas = eventos // 2
+    inicio = datetime.datetime.now() - datetime.timedelta(seconds=visitas * 10 + 3600)
+    lote = []
+    for i in range(visitas):
+        entrada = inicio + datetime.timedelta(seconds=i * 10)
+        saida = entrada + datetime.timedelta(seconds=900 + (i * 7919) % 2700)
+        rfid = f"RFID_{i % cartoes:06d}"
+        lote.append({'tipo': 'ENTRADA', 'rfid': rfid, 'timestamp': entrada.isoformat()})
+        lote.append({'tipo': 'SAIDA', 'rfid': rfid, 'timestamp': saida.isoformat()})
+        if len(lote) >= 20000:
+            gerenciador.registrar_lote(lote)
+            lote = []
+    if lote:
+        gerenciador.registrar_lote(lote)
+    return gerenciador
+
+
+def _cronometrar(funcao):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--eventos', type=int, default=1_000_000, help='Eventos no histórico')
+    parser.add_argument('--cartoes', type=int, default=20000, help='Cartões distintos')
+    args = parser.parse_args()
+
+    raiz = tempfile.mkdtemp()
+    try:
+        origem = os.path.join(raiz, 'origem')
+        print(f"Gerando {args.eventos} eventos...", flush=True)
+        duracao, gerenciador = _cronometrar(lambda: gerar(origem, args.eventos, args.cartoes))
+        print(f"  gerado em {duracao:.1f} s")
+
+        tempo_snapshot, _ = _cronometrar(gerenciador.gravar_snapshot)
+        arquivo_json = os.path.join(raiz, 'dados_ru.json')
+        tempo_exportar, _ = _cronometrar(lambda: gerenciador.exportar_dados(arquivo_json))
+        arquivo_ndjson = os.path.join(raiz, 'exportacao.ndjson.gz')
+        tempo_ndjson, _ = _cronometrar(lambda: exportar_ndjson(gerenciador, arquivo_ndjson))
+        gerenciador.diario.fechar()
+        esperado = gerenciador.contar_tempos_permanencia()
+
+        # Mesmo estado no formato JSON antigo, num diretório à parte
+        legado = os.path.join(raiz, 'legado')
+        shutil.copytree(origem, legado)
+        snapshot, _ = DiarioEventos(legado).carregar()
+        os.remove(os.path.join(legado, DiarioEventos.ARQUIVO_SNAPSHOT))
+        with open(os.path.join(legado, DiarioEventos.ARQUIVO_SNAPSHOT_JSON), 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+
+        def importar(arquivo):
+            diretorio = tempfile.mkdtemp(dir=raiz)
+            novo = _gerenciador(diretorio)
+            novo.importar_exportacao(ler_exportacao(arquivo))
+            return novo
+
+        casos = [
+            ('snapshot binário', os.path.join(origem, DiarioEventos.ARQUIVO_SNAPSHOT), tempo_snapshot,
+             lambda: _gerenciador(origem)),
+            ('snapshot JSON', os.path.join(legado, DiarioEventos.ARQUIVO_SNAPSHOT_JSON), None,
+             lambda: _gerenciador(legado)),
+            ('dados_ru.json', arquivo_json, tempo_exportar, lambda: importar(arquivo_json)),
+            ('NDJSON gzip', arquivo_ndjson, tempo_ndjson, lambda: importar(arquivo_ndjson)),
+        ]
+
+        print(f"\n{'formato':<18} {'tamanho MB':>10} {'gravar s':>9} {'partida s':>10} {'visitas':>8}")
+        for nome, arquivo, gravar, carregar in casos:
+            duracao, novo = _cronometrar(carregar)
+            visitas = novo.contar_tempos_permanencia()
+            novo.diario.fechar()
+            gravado = f"{gravar:.2f}" if gravar is not None else "-"
+            print(f"{nome:<18} {os.path.getsize(arquivo) / 1e6:>10.1f} {gravado:>9} {duracao:>10.2f} "
+                  f"{visitas:>8}{'' if visitas == esperado else '  (diferente!)'}")
+    finally:
+        shutil.rmtree(raiz, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,113 +1,928 @@
+import logging
+import multiprocessing
+import os
+import queue
+import sys
 import threading
 import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, Optional, Tuple
+
 import cv2
 import numpy as np
-from gerenciador import GerenciadorRestaurante
+from fontes_video import abrir_fonte
+from gerenciador import FILA_PADRAO, GerenciadorRestaurante
+from metricas import REGISTRO
+
+logger = logging.getLogger(__name__)
+
+# Estágios: captura, redimensionar, agendar (movimento + cópia para o pool),
+# deteccao (do envio ao pool até o resultado), desenhar e codificar
+CAMERA_ESTAGIO = REGISTRO.histograma(
+    'camera_estagio_segundos', 'Duração de cada estágio do pipeline da câmera', ('camera', 'estagio'))
+CAMERA_FPS = REGISTRO.medidor(
+    'camera_fps', 'Frames por segundo alcançados em cada estágio da câmera', ('camera', 'estagio'))
+
+# Monitores em execução, exportados pelo coletor no fim do módulo
+_monitores_ativos = set()
+
+
+class _MedidorFPS:
+    """Atualiza um medidor com a taxa de chamadas a `contar()`, a cada segundo"""
+
+    def __init__(self, medidor):
+        self.medidor = medidor
+        self._inicio = time.perf_counter()
+        self._quadros = 0
+
+    def contar(self, agora: float):
+        self._quadros += 1
+        decorrido = agora - self._inicio
+        if decorrido >= 1:
+            self.medidor.definir(round(self._quadros / decorrido, 2))
+            self._inicio, self._quadros = agora, 0
+
+
+def _detectar_pessoas(hog, imagem, deslocamento=(0, 0), win_stride=(4, 4), escala=1.05):
+    """Roda o HOG e devolve as caixas (x, y, w, h) no sistema de coordenadas do frame"""
+    # winStride: passo da janela (menor = mais preciso e mais lento)
+    # padding: margem
+    # scale: fator de escala (1.05 é padrão, aumentar deixa mais rápido mas perde detalhes)
+    boxes, weights = hog.detectMultiScale(
+        imagem,
+        winStride=win_stride,
+        padding=(4, 4),
+        scale=escala
+    )
+    dx, dy = deslocamento
+    # Filtra retângulos muito pequenos (ruído)
+    return [(int(x) + dx, int(y) + dy, int(w), int(h))
+            for (x, y, w, h) in boxes if w > 30 and h > 50]
+
+
+def _desenhar_caixas(frame, caixas, rotulo: str, area=None):
+    """Desenha as caixas, a área monitorada (se houver) e a contagem no frame"""
+    if area:
+        x, y, w, h = area
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 1)
+
+    # Desenha os retângulos
+    for (x, y, w, h) in caixas:
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+
+    # Adiciona contagem na tela
+    cv2.putText(frame, rotulo, (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+
+
+def _intersecta(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def _iou(a, b) -> float:
+    """Interseção sobre união de duas caixas (x, y, w, h)"""
+    largura = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    altura = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if largura <= 0 or altura <= 0:
+        return 0.0
+    intersecao = largura * altura
+    return intersecao / (a[2] * a[3] + b[2] * b[3] - intersecao)
+
+
+def _centro(caixa) -> Tuple[float, float]:
+    return caixa[0] + caixa[2] / 2, caixa[1] + caixa[3] / 2
+
+
+class RastreadorCaixas:
+    """
+    Acompanha as pessoas entre uma detecção e outra
+
+    Cada detecção é associada às trilhas existentes pela maior sobreposição
+    (IoU) e, para quem andou mais que a própria largura, pelo centro mais
+    próximo. Uma trilha sem detecção sobrevive a `max_perdidos` detecções
+    seguidas (o HOG falha de vez em quando), e entre detecções a caixa
+    segue a velocidade medida, por no máximo `horizonte` segundos.
+    """
+
+    def __init__(self, iou_minimo: float = 0.3, max_perdidos: int = 2, horizonte: float = 1.0):
+        self.iou_minimo = iou_minimo
+        self.max_perdidos = max_perdidos
+        self.horizonte = horizonte
+        self.trilhas = []  # dicts: id, caixa, velocidade, atualizado, perdidos
+        self._proximo_id = 1
+
+    def __len__(self) -> int:
+        return len(self.trilhas)
+
+    def atualizar(self, caixas, agora: float):
+        """Associa as caixas de uma detecção às trilhas"""
+        trilhas = self.trilhas
+        livres_trilha = set(range(len(trilhas)))
+        livres_caixa = set(range(len(caixas)))
+        pares = []
+
+        # Primeiro por sobreposição, da maior para a menor
+        candidatos = sorted(((_iou(t['caixa'], c), i, j)
+                             for i, t in enumerate(trilhas) for j, c in enumerate(caixas)), reverse=True)
+        for valor, i, j in candidatos:
+            if valor < self.iou_minimo:
+                break
+            if i in livres_trilha and j in livres_caixa:
+                pares.append((i, j))
+                livres_trilha.discard(i)
+                livres_caixa.discard(j)
+
+        # Depois pelo centro mais próximo, dentro de uma largura de caixa
+        candidatos = []
+        for i in livres_trilha:
+            cx, cy = _centro(trilhas[i]['caixa'])
+            raio = trilhas[i]['caixa'][2]
+            for j in livres_caixa:
+                dx, dy = _centro(caixas[j])
+                distancia = ((dx - cx) ** 2 + (dy - cy) ** 2) ** 0.5
+                if distancia <= raio:
+                    candidatos.append((distancia, i, j))
+        for _, i, j in sorted(candidatos):
+            if i in livres_trilha and j in livres_caixa:
+                pares.append((i, j))
+                livres_trilha.discard(i)
+                livres_caixa.discard(j)
+
+        for i, j in pares:
+            trilha, caixa = trilhas[i], caixas[j]
+            dt = agora - trilha['atualizado']
+            if dt > 0:
+                (x0, y0), (x1, y1) = _centro(trilha['caixa']), _centro(caixa)
+                vx, vy = trilha['velocidade']
+                trilha['velocidade'] = ((vx + (x1 - x0) / dt) / 2, (vy + (y1 - y0) / dt) / 2)
+            trilha.update(caixa=tuple(caixa), atualizado=agora, perdidos=0)
+
+        novas = []
+        for i, trilha in enumerate(trilhas):
+            if i in livres_trilha:
+                trilha['perdidos'] += 1
+                if trilha['perdidos'] > self.max_perdidos:
+                    continue
+            novas.append(trilha)
+        for j in sorted(livres_caixa):
+            novas.append({'id': self._proximo_id, 'caixa': tuple(caixas[j]),
+                          'velocidade': (0.0, 0.0), 'atualizado': agora, 'perdidos': 0})
+            self._proximo_id += 1
+
+        # Troca a lista de uma vez: a codificação lê as trilhas em outra thread
+        self.trilhas = novas
+
+    def parado(self):
+        """Cena sem movimento: as caixas ficam onde estão"""
+        for trilha in self.trilhas:
+            trilha['velocidade'] = (0.0, 0.0)
+
+    def caixas(self, agora: float):
+        """Caixas previstas para o instante `agora`"""
+        previstas = []
+        for trilha in self.trilhas:
+            x, y, w, h = trilha['caixa']
+            vx, vy = trilha['velocidade']
+            dt = min(max(0.0, agora - trilha['atualizado']), self.horizonte)
+            previstas.append((int(x + vx * dt), int(y + vy * dt), w, h))
+        return previstas
+
+
+class ContagemSuavizada:
+    """
+    Média móvel exponencial com histerese
+
+    O valor publicado só muda quando a média se afasta dele pelo menos
+    `histerese` pessoas, então uma oscilação de 3 para 4 e de volta não
+    chega ao dashboard.
+    """
+
+    def __init__(self, alfa: float = 0.3, histerese: float = 0.7):
+        self.alfa = alfa
+        self.histerese = histerese
+        self.media = None
+        self.valor = 0
+
+    def atualizar(self, bruta: int) -> int:
+        if self.media is None:
+            self.media = float(bruta)
+            self.valor = bruta
+        else:
+            self.media += self.alfa * (bruta - self.media)
+            if abs(self.media - self.valor) >= self.histerese:
+                self.valor = int(round(self.media))
+        return self.valor
+
+
+class DetectorMovimento:
+    """
+    Detecta movimento por diferença entre frames, em escala reduzida
+
+    Custa uma fração do HOG: serve para decidir se vale rodar o detector
+    completo ou se a contagem anterior continua valendo.
+    """
+
+    def __init__(self, area_minima: int, escala: float = 0.25, limiar: int = 25):
+        self.escala = escala
+        self.limiar = limiar
+        self.area_minima = area_minima * escala * escala
+        self._anterior = None
+
+    def regiao(self, frame):
+        """
+        Retorna o retângulo (x, y, w, h) que envolve as áreas com movimento,
+        em coordenadas do frame, ou None se a cena está parada
+        """
+        pequeno = cv2.resize(frame, None, fx=self.escala, fy=self.escala, interpolation=cv2.INTER_AREA)
+        cinza = cv2.GaussianBlur(cv2.cvtColor(pequeno, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        anterior, self._anterior = self._anterior, cinza
+        if anterior is None:
+            return (0, 0, frame.shape[1], frame.shape[0])
+
+        diferenca = cv2.threshold(cv2.absdiff(anterior, cinza), self.limiar, 255, cv2.THRESH_BINARY)[1]
+        diferenca = cv2.dilate(diferenca, None, iterations=2)
+        contornos, _ = cv2.findContours(diferenca, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        # Só contam áreas do tamanho de uma pessoa (AREA_MINIMA_PESSOA)
+        retangulos = [cv2.boundingRect(c) for c in contornos if cv2.contourArea(c) >= self.area_minima]
+        if not retangulos:
+            return None
+
+        x0 = min(r[0] for r in retangulos)
+        y0 = min(r[1] for r in retangulos)
+        x1 = max(r[0] + r[2] for r in retangulos)
+        y1 = max(r[1] + r[3] for r in retangulos)
+        return tuple(int(v / self.escala) for v in (x0, y0, x1 - x0, y1 - y0))
+
+
+def _expandir_regiao(regiao, forma, margem=0.5):
+    """Aumenta a região para caber a janela do HOG (64x128) com folga"""
+    x, y, w, h = regiao
+    altura_frame, largura_frame = forma[:2]
+    w2 = max(int(w * (1 + margem)), 96)
+    h2 = max(int(h * (1 + margem)), 160)
+    x2 = max(0, x - (w2 - w) // 2)
+    y2 = max(0, y - (h2 - h) // 2)
+    return x2, y2, min(w2, largura_frame - x2), min(h2, altura_frame - y2)
+
+
+def _abrir_memoria(nome: str) -> shared_memory.SharedMemory:
+    """
+    Abre no trabalhador o frame criado pela câmera, sem passar a ser dono dele
+
+    Quem libera a memória é a câmera; sem isso o resource_tracker do
+    trabalhador tentaria removê-la de novo ao sair. O resource_tracker só
+    existe no POSIX (no Windows a memória some com o último handle).
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=nome, track=False)
+    memoria = shared_memory.SharedMemory(name=nome)
+    if os.name == 'posix':
+        resource_tracker.unregister(memoria._name, 'shared_memory')
+    return memoria
+
+
+def _trabalhador_deteccao(tarefas, resultados):
+    """
+    Processo do pool de detecção: roda o HOG nas tarefas de qualquer câmera
+
+    Cada tarefa aponta para o frame da câmera na memória compartilhada e para
+    a região onde procurar pessoas. Enquanto a tarefa não volta, a câmera não
+    escreve nesse frame, então ele pode ser lido sem cópia e sem lock. Uma
+    câmera cuja tarefa venceu o prazo passa a escrever num bloco novo; o
+    anterior é fechado aqui quando chega a primeira tarefa com o novo.
+    """
+    hog = cv2.HOGDescriptor()
+    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    memorias = {}  # id da câmera -> (nome, memória) do bloco atual dela
+    try:
+        while True:
+            tarefa = tarefas.get()
+            if tarefa is None:
+                break
+
+            id_camera, numero, nome_memoria, forma, (x, y, w, h) = tarefa
+            inicio = time.process_time()
+            # Toda tarefa tem resposta, mesmo com erro: a câmera só agenda outra quando ela volta
+            try:
+                atual = memorias.get(id_camera)
+                if atual is None or atual[0] != nome_memoria:
+                    if atual is not None:
+                        atual[1].close()
+                        del memorias[id_camera]
+                    memorias[id_camera] = (nome_memoria, _abrir_memoria(nome_memoria))
+                frame = np.ndarray(forma, dtype=np.uint8, buffer=memorias[id_camera][1].buf)
+                caixas = _detectar_pessoas(hog, frame[y:y + h, x:x + w], (x, y))
+            except Exception:
+                logger.exception("❌ Erro na detecção (câmera %d, tarefa %d)", id_camera, numero)
+                caixas = None
+            frame = None
+            resultados.put((id_camera, numero, caixas, time.process_time() - inicio))
+    finally:
+        for _, memoria in memorias.values():
+            memoria.close()
+
+
+class PoolDeteccao:
+    """
+    Pool de processos de detecção compartilhado por todas as câmeras
+
+    As câmeras colocam tarefas numa fila única e o primeiro trabalhador livre
+    pega a próxima, então a carga se distribui entre os processos sozinha.
+    Cada câmera tem no máximo uma tarefa pendente: se o pool está ocupado na
+    hora da detecção, aquele frame é pulado. Assim a fila nunca passa do
+    número de câmeras e uma câmera a mais divide os mesmos processos em vez
+    de ocupar um núcleo inteiro com HOG.
+
+    Se um trabalhador morre (falta de memória, erro no OpenCV), o pool é
+    recomeçado com processos novos; as tarefas perdidas vencem o prazo nas
+    câmeras (`MonitorFilaCamera.PRAZO_DETECCAO`) e são agendadas de novo.
+    """
+
+    def __init__(self, processos: int = 0):
+        # 0 = automático: um núcleo fica livre para captura, API e codificação
+        self.processos = processos or max(1, (os.cpu_count() or 2) - 1)
+        self.rodando = False
+
+        self._tarefas = None
+        self._resultados = None
+        self._trabalhadores = []
+        self._destinos: Dict[int, Callable] = {}
+        self._proximo_id = 0
+        self._lock = threading.Lock()
+        self.reinicios = 0  # processos que morreram e foram repostos
+
+    def iniciar(self):
+        """Cria os processos (só na primeira chamada; as câmeras chamam ao iniciar)"""
+        with self._lock:
+            if self.rodando:
+                return
+            self.rodando = True
+
+            self._tarefas = multiprocessing.Queue()
+            self._resultados = multiprocessing.Queue()
+            self._trabalhadores = [self._criar_trabalhador() for _ in range(self.processos)]
+
+        threading.Thread(target=self._loop_resultados, daemon=True).start()
+        logger.info("Pool de detecção iniciado (%d processos)", self.processos)
+
+    def _criar_trabalhador(self) -> multiprocessing.Process:
+        processo = multiprocessing.Process(
+            target=_trabalhador_deteccao,
+            args=(self._tarefas, self._resultados),
+            daemon=True
+        )
+        processo.start()
+        return processo
+
+    def _repor_trabalhadores(self):
+        """
+        Recomeça o pool se algum processo morreu
+
+        Um processo morto no meio de um `get` leva junto o lock interno da
+        fila de tarefas, e nenhum outro consegue mais ler dela; por isso as
+        filas e os processos são todos trocados. As tarefas que estavam no
+        pool se perdem e vencem o prazo nas câmeras, que as agendam de novo.
+        """
+        with self._lock:
+            if not self.rodando:
+                return
+            mortos = [processo for processo in self._trabalhadores if not processo.is_alive()]
+            if not mortos:
+                return
+            for processo in mortos:
+                logger.warning("⚠ Processo de detecção %d terminou (código %s); reiniciando o pool",
+                               processo.pid, processo.exitcode)
+            antigos = (self._trabalhadores, self._tarefas, self._resultados)
+            self._tarefas = multiprocessing.Queue()
+            self._resultados = multiprocessing.Queue()
+            self._trabalhadores = [self._criar_trabalhador() for _ in range(self.processos)]
+            self.reinicios += len(mortos)
+
+        trabalhadores, tarefas, resultados = antigos
+        for processo in trabalhadores:
+            if processo.is_alive():
+                processo.terminate()
+            processo.join(timeout=2)
+        for fila in (tarefas, resultados):
+            fila.cancel_join_thread()
+            fila.close()
+
+    def registrar(self, destino: Callable) -> int:
+        """Registra uma câmera; `destino(numero, caixas, cpu)` recebe os resultados dela"""
+        with self._lock:
+            id_camera = self._proximo_id
+            self._proximo_id += 1
+            self._destinos[id_camera] = destino
+        return id_camera
+
+    def remover(self, id_camera: int):
+        with self._lock:
+            self._destinos.pop(id_camera, None)
+
+    def enviar(self, id_camera: int, numero: int, nome_memoria: str, forma, regiao):
+        """Agenda a detecção na região (x, y, w, h) do frame da câmera; `numero` volta com o resultado"""
+        self._tarefas.put((id_camera, numero, nome_memoria, forma, regiao))
+
+    def _loop_resultados(self):
+        """Entrega cada resultado à câmera que pediu a detecção e repõe trabalhadores mortos"""
+        verificacao = time.monotonic()
+        while self.rodando:
+            if time.monotonic() - verificacao >= 1.0:
+                self._repor_trabalhadores()
+                verificacao = time.monotonic()
+            try:
+                id_camera, numero, caixas, cpu = self._resultados.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            destino = self._destinos.get(id_camera)
+            if destino:
+                try:
+                    destino(numero, caixas, cpu)
+                except Exception:
+                    logger.exception("❌ Erro ao aplicar detecção")
+
+    def parar(self):
+        with self._lock:
+            if not self.rodando:
+                return
+            self.rodando = False
+
+        for _ in self._trabalhadores:
+            self._tarefas.put(None)
+        for processo in self._trabalhadores:
+            processo.join(timeout=2)
+            if processo.is_alive():
+                processo.terminate()
+        self._trabalhadores = []
+
+
+class DifusorFrames:
+    """
+    Distribui o JPEG mais recente para os clientes do /video_feed
+
+    Cada frame é codificado uma única vez e recebe um número de sequência;
+    os clientes dormem numa Condition até a sequência mudar, então nunca
+    recebem o mesmo frame duas vezes. Um cliente lento simplesmente pega o
+    frame mais novo quando voltar, pulando os intermediários.
+    """
+
+    def __init__(self):
+        self._condicao = threading.Condition()
+        self._jpeg = None
+        self._seq = 0
+        self.assinantes = 0
+        self._tem_assinantes = threading.Event()
+        self.encerrado = False
+
+    def publicar(self, jpeg: bytes):
+        with self._condicao:
+            self._jpeg = jpeg
+            self._seq += 1
+            self._condicao.notify_all()
+
+    def ultimo(self):
+        with self._condicao:
+            return self._jpeg
+
+    def esperar_assinantes(self, timeout: float) -> bool:
+        """Bloqueia até haver pelo menos um cliente (ou estourar o timeout)"""
+        return self._tem_assinantes.wait(timeout)
+
+    def encerrar(self):
+        with self._condicao:
+            self.encerrado = True
+            self._condicao.notify_all()
+
+    def gerar_stream(self, timeout: float = 1.0):
+        """Gerador multipart/x-mixed-replace de um cliente"""
+        with self._condicao:
+            self.assinantes += 1
+            self._tem_assinantes.set()
+        try:
+            ultimo_seq = 0
+            while not self.encerrado:
+                with self._condicao:
+                    self._condicao.wait_for(lambda: self._seq != ultimo_seq or self.encerrado, timeout)
+                    if self._seq == ultimo_seq or self._jpeg is None:
+                        continue
+                    ultimo_seq, jpeg = self._seq, self._jpeg
+
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            with self._condicao:
+                self.assinantes -= 1
+                if not self.assinantes:
+                    self._tem_assinantes.clear()
+
 
 class MonitorFilaCamera:
-    """Monitora a fila usando câmera e visão computacional"""
+    """
+    Monitora uma linha de atendimento usando câmera e visão computacional
+
+    O trabalho é dividido em estágios independentes:
+    - captura (thread): lê e redimensiona frames e, na taxa `fps_deteccao`
+      (ou a cada `quadros_por_deteccao` frames), decide se a detecção
+      precisa rodar e em que região;
+    - detecção (pool de processos compartilhado entre as câmeras): roda o
+      HOG e devolve as caixas, que atualizam a fila desta linha;
+    - codificação (thread): desenha as caixas e gera o JPEG do stream, na
+      taxa `fps_stream`.
+
+    `roi` limita a contagem a um retângulo (x, y, largura, altura) em
+    frações do frame, por exemplo (0.5, 0, 0.5, 1) para a metade direita.
+    Sem `pool`, o monitor cria um pool próprio com um processo.
+
+    Com `rastreamento`, as caixas são acompanhadas entre as detecções
+    (`RastreadorCaixas`) e a fila recebe a contagem suavizada com histerese
+    (`ContagemSuavizada`); sem ele, recebe a contagem bruta do HOG.
+    `obter_estatisticas()` mostra o custo e a estabilidade de cada modo.
+    """
+
+    LARGURA_ALVO = 500
+    # Sem resultado do pool nesse prazo (trabalhador morto, resultado perdido), a detecção é refeita
+    PRAZO_DETECCAO = 5.0
 
     def __init__(self, gerenciador: GerenciadorRestaurante,
-                 camera_index: int = 0,
+                 camera_index=0,
                  intervalo_segundos: int = 2,
-                 habilitar: bool = True):
+                 habilitar: bool = True,
+                 fps_deteccao: float = 2,
+                 fps_stream: float = 15,
+                 area_minima_pessoa: int = 1500,
+                 deteccao_por_movimento: bool = True,
+                 deteccao_somente_regiao: bool = True,
+                 intervalo_deteccao_completa: float = 30,
+                 nome: str = FILA_PADRAO,
+                 roi: Optional[Tuple[float, float, float, float]] = None,
+                 pool: Optional[PoolDeteccao] = None,
+                 quadros_por_deteccao: int = 0,
+                 rastreamento: bool = True):
         self.gerenciador = gerenciador
-        self.camera_index = camera_index
+        self.camera_index = camera_index  # índice da webcam, vídeo, imagens ou "sintetico" (ver fontes_video)
+        self.nome = nome
+        self.roi = roi
         self.intervalo_segundos = intervalo_segundos
         self.habilitar = habilitar
+        self.fps_deteccao = fps_deteccao
+        self.quadros_por_deteccao = quadros_por_deteccao  # 0 = usa só o orçamento de tempo
+        self.fps_stream = fps_stream
         self.rodando = False
 
-        # Buffer do último frame para streaming
-        self.ultimo_frame_jpeg = None
-        self.lock_frame = threading.Lock()
+        # Detecção condicionada a movimento (evita rodar o HOG em cena parada)
+        self.somente_regiao = deteccao_somente_regiao
+        self.intervalo_deteccao_completa = intervalo_deteccao_completa
+        self._movimento = DetectorMovimento(area_minima_pessoa) if deteccao_por_movimento else None
+        self._ultima_completa = 0
+
+        # Frames codificados para streaming (só enquanto houver clientes)
+        self.difusor = DifusorFrames()
+
+        # Frame mais recente da captura, entregue ao estágio de codificação
+        self._frame_atual = None
+        self._seq_frame = 0
+        self._condicao_frame = threading.Condition()
+        self._thread_captura = None
+
+        # Último resultado da detecção e quantas vezes cada modo foi usado
+        # ('descartada': o pool ainda estava com a detecção anterior desta câmera;
+        # 'expirada': o resultado não voltou em PRAZO_DETECCAO e a detecção foi refeita)
+        self.caixas = []
+        self.contagem = 0
+        self.deteccoes = {'completa': 0, 'regiao': 0, 'reaproveitada': 0, 'descartada': 0, 'expirada': 0}
+        self._ultima_publicacao = 0
+
+        # Rastreamento entre detecções e contagem suavizada (None = contagem bruta)
+        self._rastreador = RastreadorCaixas() if rastreamento else None
+        self._suavizada = ContagemSuavizada()
+
+        # Medidas para comparar configurações: CPU do HOG e quantas vezes a contagem mudou
+        self.contagem_bruta = 0
+        self.trocas_contagem = {'bruta': 0, 'publicada': 0}
+        self.tempo_cpu_deteccao = 0.0
+        self._inicio = None
+        self._metricas = {estagio: CAMERA_ESTAGIO.rotulos(nome, estagio)
+                          for estagio in ('captura', 'redimensionar', 'agendar', 'deteccao',
+                                          'desenhar', 'codificar')}
+        self._fps = {estagio: _MedidorFPS(CAMERA_FPS.rotulos(nome, estagio))
+                     for estagio in ('captura', 'deteccao', 'stream')}
 
-        if self.habilitar:
-            # HOG Detector
-            self.hog = cv2.HOGDescriptor()
-            self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        # Estágio de detecção: pool compartilhado e o frame desta câmera na
+        # memória compartilhada (criado no primeiro frame, quando o tamanho é conhecido)
+        self._pool_proprio = pool is None
+        self.pool = pool if pool is not None else PoolDeteccao(1)
+        self._id_pool = None
+        self._area = None
+        self._memoria = None
+        self._frame_compartilhado = None
+        self._pendente = None  # (número, modo, região, envio) da detecção em andamento no pool
+        self._tarefas_enviadas = 0
 
     def iniciar(self):
         """Inicia monitoramento da câmera"""
         if not self.habilitar:
-            print("⚠ Monitor de câmera desabilitado")
+            logger.warning("⚠ Monitor de câmera desabilitado")
             return False
 
+        self.pool.iniciar()
+        self._id_pool = self.pool.registrar(self._receber_deteccao)
+
         self.rodando = True
-        thread = threading.Thread(target=self._loop_camera, daemon=True)
-        thread.start()
+        self._inicio = time.time()
+        _monitores_ativos.add(self)
+        self._thread_captura = threading.Thread(target=self._loop_captura, daemon=True)
+        self._thread_captura.start()
+        threading.Thread(target=self._loop_codificacao, daemon=True).start()
         return True
 
-    def _loop_camera(self):
-        """Loop principal da câmera"""
-        # Tenta abrir a câmera (pode ser index 0 ou 1 dependendo do USB)
-        cap = cv2.VideoCapture(self.camera_index)
+    # ---------- Captura ----------
+
+    def _loop_captura(self):
+        """Estágio de captura: lê frames, agenda detecções e publica o mais recente"""
+        # Tenta abrir a câmera (pode ser index 0 ou 1 dependendo do USB);
+        # vídeos, imagens e o gerador sintético repetem no ritmo original
+        cap = abrir_fonte(self.camera_index, tempo_real=True, repetir=True)
 
         if not cap.isOpened():
-            print(f"Não foi possível abrir a câmera {self.camera_index}")
+            logger.error("Não foi possível abrir a câmera %s (%s)", self.camera_index, self.nome)
             return
 
-        print(f"Câmera iniciada (Index: {self.camera_index})")
-
-        ultimo_tempo_atualizacao = 0
+        logger.info("Câmera iniciada (Index: %s, fila: %s)", self.camera_index, self.nome)
 
+        tamanho = None
+        intervalo_deteccao = 1 / self.fps_deteccao
+        proxima_deteccao = 0
+        quadros_desde_deteccao = 0
+        relogio = time.perf_counter
         while self.rodando:
+            t0 = relogio()
             ret, frame = cap.read()
             if not ret:
-                print("Falha ao capturar frame")
+                logger.warning("Falha ao capturar frame (%s)", self.nome)
                 time.sleep(1)
                 continue
 
-            largura_alvo = 500
-            proporcao = largura_alvo / frame.shape[1]
-            altura_alvo = int(frame.shape[0] * proporcao)
-            frame = cv2.resize(frame, (largura_alvo, altura_alvo))
-
-            # --- DETECÇÃO ---
-            # Detecta pessoas
-            # winStride: passo da janela (menor = mais preciso e mais lento)
-            # padding: margem
-            # scale: fator de escala (1.05 é padrão, aumentar deixa mais rápido mas perde detalhes)
-            boxes, weights = self.hog.detectMultiScale(
-                frame,
-                winStride=(4, 4),
-                padding=(4, 4),
-                scale=1.05
-            )
-
-            count = 0
-            # Desenha os retângulos
-            for (x, y, w, h) in boxes:
-                # Filtra retângulos muito pequenos (ruído) ou muito grandes (tela toda)
-                if w > 30 and h > 50:
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                    count += 1
-
-            # Adiciona contagem na tela
-            cv2.putText(frame, f"Fila: {count}", (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-
-            # --- ATUALIZAÇÃO DO SISTEMA ---
+            t1 = relogio()
+            if tamanho is None:
+                proporcao = self.LARGURA_ALVO / frame.shape[1]
+                tamanho = (self.LARGURA_ALVO, int(frame.shape[0] * proporcao))
+            frame = cv2.resize(frame, tamanho)
+            t2 = relogio()
+            self._metricas['captura'].observar(t1 - t0)
+            self._metricas['redimensionar'].observar(t2 - t1)
+            self._fps['captura'].contar(t2)
+
             agora = time.time()
-            if agora - ultimo_tempo_atualizacao >= self.intervalo_segundos:
-                self.gerenciador.atualizar_fila(count)
-                # print(f"📹 Fila atualizada: {count}")
-                ultimo_tempo_atualizacao = agora
+            quadros_desde_deteccao += 1
+            if self.quadros_por_deteccao:
+                hora_de_detectar = quadros_desde_deteccao >= self.quadros_por_deteccao
+            else:
+                hora_de_detectar = agora >= proxima_deteccao
+            if hora_de_detectar:
+                quadros_desde_deteccao = 0
+                proxima_deteccao = agora + intervalo_deteccao
+                self._agendar_deteccao(frame, agora)
+                self._metricas['agendar'].observar(relogio() - t2)
+
+            # Entrega para a codificação
+            with self._condicao_frame:
+                self._frame_atual = frame
+                self._seq_frame += 1
+                self._condicao_frame.notify_all()
+
+        cap.release()
+        logger.info("Câmera encerrada (%s).", self.nome)
+
+    # ---------- Detecção ----------
+
+    def _area_roi(self, forma) -> Tuple[int, int, int, int]:
+        """Converte a ROI (frações) em pixels do frame redimensionado"""
+        altura, largura = forma[:2]
+        if not self.roi:
+            return 0, 0, largura, altura
+        fx, fy, fw, fh = self.roi
+        x, y = int(fx * largura), int(fy * altura)
+        return x, y, max(1, min(int(fw * largura), largura - x)), max(1, min(int(fh * altura), altura - y))
+
+    def _agendar_deteccao(self, frame, agora: float):
+        """
+        Decide se o HOG precisa rodar e em que região, e manda a tarefa ao pool
+
+        Cena parada reaproveita a contagem anterior; com `somente_regiao` o
+        HOG roda só na área que mudou. A cada `intervalo_deteccao_completa`
+        segundos roda uma detecção na ROI inteira para corrigir desvios.
+        """
+        pendente = self._pendente
+        if pendente is not None:
+            if time.perf_counter() - pendente[3] < self.PRAZO_DETECCAO:
+                self.deteccoes['descartada'] += 1
+                return
+            # O resultado não vai voltar; se voltar atrasado, o número não confere e é ignorado.
+            # Um trabalhador lento pode ainda estar lendo o frame: o próximo vai para um bloco novo
+            self.deteccoes['expirada'] += 1
+            self._pendente = None
+            self._liberar_memoria()
+            logger.warning("⚠ Câmera %s: detecção sem resposta há mais de %.0f s; agendando outra",
+                           self.nome, self.PRAZO_DETECCAO)
+
+        if self._memoria is None:
+            self._area = self._area_roi(frame.shape)
+            self._memoria = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+            self._frame_compartilhado = np.ndarray(frame.shape, dtype=np.uint8, buffer=self._memoria.buf)
+
+        x, y, w, h = self._area
+        regiao = self._movimento.regiao(frame[y:y + h, x:x + w]) if self._movimento else None
+
+        if self._movimento is None or agora - self._ultima_completa >= self.intervalo_deteccao_completa:
+            alvo, modo = self._area, 'completa'
+            self._ultima_completa = agora
+        elif regiao is None:
+            # Cena parada: a contagem anterior continua valendo
+            self.deteccoes['reaproveitada'] += 1
+            if self._rastreador is not None:
+                self._rastreador.parado()
+            self._publicar_contagem(agora)
+            return
+        elif self.somente_regiao:
+            rx, ry, rw, rh = _expandir_regiao(regiao, (h, w))
+            alvo, modo = (x + rx, y + ry, rw, rh), 'regiao'
+        else:
+            alvo, modo = self._area, 'completa'
+
+        self._frame_compartilhado[:] = frame
+        self._tarefas_enviadas += 1
+        self._pendente = (self._tarefas_enviadas, modo, alvo, time.perf_counter())
+        self.pool.enviar(self._id_pool, self._tarefas_enviadas, self._memoria.name, frame.shape, alvo)
+
+    def _receber_deteccao(self, numero: int, caixas, cpu: float):
+        """Aplica o resultado do pool (chamado pela thread de resultados do pool)"""
+        pendente = self._pendente
+        if pendente is None or pendente[0] != numero:
+            return  # resultado de uma detecção que já tinha vencido o prazo
+        _, modo, alvo, envio = pendente
+        fim = time.perf_counter()
+        self._metricas['deteccao'].observar(fim - envio)
+        self._fps['deteccao'].contar(fim)
+        agora = time.time()
+        self.tempo_cpu_deteccao += cpu
+        if caixas is not None:
+            if modo == 'regiao':
+                caixas = [c for c in self.caixas if not _intersecta(c, alvo)] + caixas
+            self.caixas = caixas
+            self._atualizar_contagem(agora)
+        self.deteccoes[modo] += 1
+        self._pendente = None
+
+        self._publicar_contagem(agora)
+
+    def _atualizar_contagem(self, agora: float):
+        bruta = len(self.caixas)
+        if bruta != self.contagem_bruta:
+            self.trocas_contagem['bruta'] += 1
+        self.contagem_bruta = bruta
+
+        if self._rastreador is not None:
+            self._rastreador.atualizar(self.caixas, agora)
+            contagem = self._suavizada.atualizar(len(self._rastreador))
+        else:
+            contagem = bruta
+
+        if contagem != self.contagem:
+            self.trocas_contagem['publicada'] += 1
+        self.contagem = contagem
+
+    def _caixas_atuais(self):
+        """Caixas para desenhar: as previstas pelo rastreador ou as da última detecção"""
+        if self._rastreador is not None:
+            return self._rastreador.caixas(time.time())
+        return self.caixas
+
+    def _publicar_contagem(self, agora: float):
+        # --- ATUALIZAÇÃO DO SISTEMA ---
+        if agora - self._ultima_publicacao >= self.intervalo_segundos:
+            self._ultima_publicacao = agora
+            self.gerenciador.atualizar_fila(self.contagem, self.nome)
+
+    # ---------- Codificação ----------
+
+    def _loop_codificacao(self):
+        """
+        Estágio de codificação: desenha a última detecção e gera o JPEG do stream
+
+        Só codifica enquanto houver alguém assistindo ao /video_feed, e cada
+        frame é codificado uma vez só, independente do número de clientes.
+        """
+        ultimo_seq = 0
+        intervalo = 1 / self.fps_stream
+
+        while self.rodando:
+            if not self.difusor.esperar_assinantes(timeout=1):
+                continue
+
+            inicio = time.time()
+
+            with self._condicao_frame:
+                self._condicao_frame.wait_for(
+                    lambda: self._seq_frame != ultimo_seq or not self.rodando, timeout=1)
+                frame, ultimo_seq = self._frame_atual, self._seq_frame
+
+            if frame is None:
+                continue
+
+            t0 = time.perf_counter()
+            frame = frame.copy()
+            self._desenhar(frame, self._caixas_atuais(), self.contagem)
+            t1 = time.perf_counter()
 
             # --- PREPARA PARA STREAMING ---
             ret, buffer = cv2.imencode('.jpg', frame)
             if ret:
-                with self.lock_frame:
-                    self.ultimo_frame_jpeg = buffer.tobytes()
+                self.difusor.publicar(buffer.tobytes())
+            t2 = time.perf_counter()
+            self._metricas['desenhar'].observar(t1 - t0)
+            self._metricas['codificar'].observar(t2 - t1)
+            self._fps['stream'].contar(t2)
 
-            time.sleep(0.05)
+            espera = intervalo - (time.time() - inicio)
+            if espera > 0:
+                time.sleep(espera)
 
-        cap.release()
-        print("Câmera encerrada.")
+    def _desenhar(self, frame, caixas, count):
+        # Área monitorada só aparece quando a câmera conta parte do frame
+        _desenhar_caixas(frame, caixas, f"{self.nome}: {count}", self._area if self.roi else None)
+
+    def obter_estatisticas(self) -> Dict:
+        """Custo da detecção e estabilidade da contagem desde o início"""
+        duracao = time.time() - self._inicio if self._inicio else 0
+        minutos = duracao / 60
+        realizadas = self.deteccoes['completa'] + self.deteccoes['regiao']
+        return {
+            'nome': self.nome,
+            'rodando': self.rodando,
+            'rastreamento': self._rastreador is not None,
+            'contagem': self.contagem,
+            'contagem_bruta': self.contagem_bruta,
+            'deteccoes': dict(self.deteccoes),
+            'cpu_deteccao_segundos': round(self.tempo_cpu_deteccao, 3),
+            'cpu_por_deteccao_ms': round(1000 * self.tempo_cpu_deteccao / realizadas, 1) if realizadas else 0,
+            'uso_cpu_deteccao': round(self.tempo_cpu_deteccao / duracao, 3) if duracao else 0,  # fração de um núcleo
+            'trocas_contagem_bruta': self.trocas_contagem['bruta'],
+            'trocas_contagem': self.trocas_contagem['publicada'],
+            'trocas_por_minuto_bruta': round(self.trocas_contagem['bruta'] / minutos, 2) if minutos else 0,
+            'trocas_por_minuto': round(self.trocas_contagem['publicada'] / minutos, 2) if minutos else 0
+        }
 
     def obter_frame(self):
         """Retorna o último frame codificado em JPEG para o feed"""
-        with self.lock_frame:
-            return self.ultimo_frame_jpeg
+        return self.difusor.ultimo()
+
+    def gerar_stream(self):
+        """Stream MJPEG para um cliente do /video_feed"""
+        return self.difusor.gerar_stream()
 
     def parar(self):
-        self.rodando = False
\ No newline at end of file
+        self.rodando = False
+        _monitores_ativos.discard(self)
+        self.difusor.encerrar()
+        with self._condicao_frame:
+            self._condicao_frame.notify_all()
+
+        if self._id_pool is not None:
+            self.pool.remover(self._id_pool)
+        if self._pool_proprio:
+            self.pool.parar()
+
+        # Espera a captura sair da memória compartilhada antes de liberá-la
+        if self._thread_captura is not None:
+            self._thread_captura.join(timeout=2)
+        self._liberar_memoria()
+
+    def _liberar_memoria(self):
+        """Solta o frame compartilhado; o próximo agendamento cria outro bloco"""
+        if self._memoria is not None:
+            self._frame_compartilhado = None
+            self._memoria.close()
+            self._memoria.unlink()
+            self._memoria = None
+
+
+def _coletar_metricas():
+    """Contagem, detecções por modo e CPU do HOG de cada câmera, lidos na exportação"""
+    monitores = sorted(_monitores_ativos, key=lambda monitor: monitor.nome)
+    yield ('camera_pessoas', 'gauge', 'Pessoas contadas na fila da câmera (publicada)',
+           [({'camera': monitor.nome}, monitor.contagem) for monitor in monitores])
+    yield ('camera_deteccoes_total', 'counter',
+           'Detecções por modo (descartada = pool ocupado, expirada = sem resposta no prazo)',
+           [({'camera': monitor.nome, 'modo': modo}, quantidade)
+            for monitor in monitores for modo, quantidade in list(monitor.deteccoes.items())])
+    yield ('camera_cpu_deteccao_segundos_total', 'counter', 'CPU gasta pelo HOG da câmera',
+           [({'camera': monitor.nome}, monitor.tempo_cpu_deteccao) for monitor in monitores])
+    yield ('camera_assinantes', 'gauge', 'Clientes assistindo ao /video_feed da câmera',
+           [({'camera': monitor.nome}, monitor.difusor.assinantes) for monitor in monitores])
+
+
+REGISTRO.coletor('camera', _coletar_metricas)
@@ -12,16 +12,75 @@ class Config:
     # Configurações para modo SERIAL
     PORTA_SERIAL = "COM7"
     BAUDRATE = 115200
+    # Uma entrada por catraca (ESP32 ligado na USB); cada uma reconecta sozinha
+    PORTAS_SERIAIS = [
+        {"catraca": "principal", "porta": PORTA_SERIAL},
+    ]
     
     # Configurações para modo HTTP
     HTTP_HOST = "0.0.0.0"
     HTTP_PORT = 5000
     
+    # Recepção leve por UDP ("SEQ TIPO:RFID" com confirmação), junto com o HTTP
+    HABILITAR_UDP = False
+    UDP_PORTA = 5005
+    UDP_JANELA_DEDUPLICACAO = 30  # Segundos em que uma retransmissão é reconhecida
+    
+    # ==== INGESTÃO ====
+    # Batidas (HTTP, serial, UDP) numa fila aplicada por uma única thread, em grupos
+    FILA_INGESTAO = False
+    CAPACIDADE_FILA_INGESTAO = 1000  # Batidas esperando; acima disso o produtor recebe "ocupado" (503)
+    GRUPO_MAXIMO_INGESTAO = 256  # Batidas aplicadas por aquisição do lock
+    ESPERA_FILA_INGESTAO = 0.05  # Segundos que um produtor espera vaga na fila cheia
+    
     # ==== CÂMERA - MONITORAMENTO DE FILA ====
     HABILITAR_CAMERA = True  # True para ativar monitoramento de fila (contagem de pessoas)
     CAMERA_INDEX = 0    # 0 = webcam padrão
     INTERVALO_CAMERA_SEGUNDOS = 3  # Intervalo entre atualizações
+    FPS_DETECCAO = 2  # Detecções HOG por segundo (roda em processo separado)
+    FPS_STREAM = 15   # Frames por segundo do vídeo em /video_feed
+    QUADROS_POR_DETECCAO = 0  # Roda o HOG a cada N frames capturados (0 = usa FPS_DETECCAO)
+    RASTREAMENTO = True  # Acompanha as pessoas entre detecções e suaviza a contagem (False = contagem bruta)
+    
+    AREA_MINIMA_PESSOA = 1500  # Área mínima (px, no frame de 500px de largura) de movimento que conta como pessoa
+    DETECCAO_POR_MOVIMENTO = True  # Só roda o HOG quando há movimento na cena
+    DETECCAO_SOMENTE_REGIAO = True  # Roda o HOG só na região que mudou
+    INTERVALO_DETECCAO_COMPLETA = 30  # Segundos entre detecções completas (corrige desvios)
+    
+    # Uma câmera por linha de atendimento; todas dividem o mesmo pool de detecção.
+    # "fonte": índice da webcam ou caminho/URL de vídeo; "roi": (x, y, largura, altura)
+    # em frações do frame (None = frame inteiro); "intervalo": segundos entre atualizações
+    CAMERAS = [
+        {"nome": "principal", "fonte": CAMERA_INDEX, "roi": None, "intervalo": INTERVALO_CAMERA_SEGUNDOS},
+    ]
+    PROCESSOS_DETECCAO = 0  # Processos do pool de detecção (0 = núcleos da CPU - 1)
+    
+    ARQUIVO_EXPORTACAO = "dados_ru.json"
+    # Sem snapshot/diário (primeira partida), carrega a última exportação (.json ou .ndjson[.gz])
+    IMPORTAR_EXPORTACAO_NA_PARTIDA = True
+    
+    # Exportação periódica em NDJSON (gerada fora do lock, em segundo plano); também em GET /exportar
+    EXPORTACAO_PERIODICA_MINUTOS = 0  # 0 = desligada
+    DIRETORIO_EXPORTACOES = "dados/exportacoes"
+    EXPORTACOES_MANTIDAS = 24  # Apaga as mais antigas
+    COMPACTAR_EXPORTACOES = True  # .ndjson.gz
+    
+    # ==== PERSISTÊNCIA ====
+    HABILITAR_DIARIO = True  # Grava cada evento em disco para recuperar após queda/reinício
+    DIRETORIO_DADOS = "dados"
+    INTERVALO_FSYNC_SEGUNDOS = 0.05  # Janela do commit em grupo (fsync)
+    EVENTOS_POR_SNAPSHOT = 5000  # Snapshot completo a cada N eventos no diário
     
-    AREA_MINIMA_PESSOA = 1500  # Área mínima para considerar como pessoa
+    # ==== HISTÓRICO ====
+    CAPACIDADE_HISTORICO = 10000  # Eventos recentes mantidos em memória
+    EVENTOS_POR_SEGMENTO = 100000  # Eventos antigos vão para segmentos em DIRETORIO_DADOS/historico
+    # Dias encerrados em arquivos colunares (NumPy), fora da memória; precisa do diário
+    HABILITAR_ACERVO = True
+    DIRETORIO_ACERVO = "dados/acervo"
+    DIAS_EM_MEMORIA = 7  # Dias recentes cujas visitas ficam em memória
     
-    ARQUIVO_EXPORTACAO = "dados_ru.json"
\ No newline at end of file
+    # ==== LOG ====
+    NIVEL_LOG = "INFO"  # DEBUG mostra cada requisição e cada linha da serial
+    NIVEIS_LOG_MODULOS = {}  # Nível por módulo, ex.: {"api": "DEBUG", "esp32_serial": "WARNING"}
+    FORMATO_LOG = "texto"  # "texto" ou "json" (uma linha JSON por registro)
+    ARQUIVO_LOG = None  # Também grava o log neste arquivo (None = só no terminal)
@@ -0,0 +1,91 @@
+"""
+Configuração do log do sistema
+
+Os módulos registram com `logging.getLogger(__name__)`; aqui o log raiz
+recebe um `QueueHandler`, que só coloca o registro numa fila em memória, e
+um `QueueListener` numa thread separada formata e escreve no terminal (e no
+arquivo, se configurado). Assim quem registra um evento nunca espera pelo
+stdout, e mensagens de nível desligado custam só a checagem do nível.
+"""
+
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Dict, Optional
+
+_ouvinte: Optional[logging.handlers.QueueListener] = None
+
+# Atributos que todo LogRecord tem; o resto veio de `extra=` e vira campo no JSON
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class FormatadorJSON(logging.Formatter):
+    """Uma linha JSON por registro, com os campos passados em `extra=`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'origem': record.name,
+            'mensagem': record.getMessage()
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO:
+                dados[chave] = valor
+        if record.exc_info:
+            dados['excecao'] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+def configurar_log(nivel: str = "INFO",
+                   niveis_modulos: Optional[Dict[str, str]] = None,
+                   formato: str = "texto",
+                   arquivo: Optional[str] = None):
+    """
+    Liga o log assíncrono
+
+    `nivel` vale para todos os módulos; `niveis_modulos` ajusta módulos
+    específicos (ex.: {"api": "DEBUG"} para ver cada requisição).
+    `formato` "json" grava uma linha JSON por registro.
+    """
+    global _ouvinte
+    encerrar_log()
+
+    if formato == "json":
+        formatador = FormatadorJSON()
+    else:
+        formatador = logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S")
+
+    destinos = [logging.StreamHandler(sys.stdout)]
+    if arquivo:
+        destinos.append(logging.FileHandler(arquivo, encoding='utf-8'))
+    for destino in destinos:
+        destino.setFormatter(formatador)
+
+    fila = queue.SimpleQueue()
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(logging.handlers.QueueHandler(fila))
+    raiz.setLevel(nivel.upper())
+
+    for modulo, nivel_modulo in (niveis_modulos or {}).items():
+        logging.getLogger(modulo).setLevel(nivel_modulo.upper())
+
+    # O servidor de desenvolvimento do Flask registra cada requisição em INFO
+    if 'werkzeug' not in (niveis_modulos or {}):
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    _ouvinte = logging.handlers.QueueListener(fila, *destinos, respect_handler_level=True)
+    _ouvinte.start()
+
+
+def encerrar_log():
+    """Escreve o que ainda está na fila e para a thread do log"""
+    global _ouvinte
+    if _ouvinte is not None:
+        _ouvinte.stop()
+        _ouvinte = None
@@ -2,128 +2,369 @@
 Integração com ESP32 via comunicação serial (USB)
 """
 
+import datetime
 import json
+import logging
 import threading
 import time
 import queue
-from typing import Dict
+from collections import deque
+from typing import Callable, Dict, List, Optional
 
 from gerenciador import GerenciadorRestaurante
+from ingestao import FilaCheia
+from metricas import REGISTRO
 
+logger = logging.getLogger(__name__)
 
-class IntegradorESP32Serial:
-    """Integração com ESP32 via porta serial (USB)"""
-    
-    def __init__(self, gerenciador: GerenciadorRestaurante, 
-                 porta: str = '/dev/ttyUSB0', 
-                 baudrate: int = 115200):
-        self.gerenciador = gerenciador
+SERIAL_PROCESSAMENTO = REGISTRO.histograma(
+    'serial_processamento_segundos', 'Tempo para processar uma linha recebida do ESP32', ('catraca',))
+SERIAL_ESCRITA = REGISTRO.histograma(
+    'serial_escrita_segundos', 'Tempo para escrever uma mensagem na porta serial', ('catraca',))
+
+# Canais em execução, exportados pelo coletor abaixo
+_canais_ativos = set()
+
+
+def processar_comando(gerenciador: GerenciadorRestaurante, comando: str,
+                      catraca: Optional[str] = None) -> Optional[Dict]:
+    """
+    Executa uma linha "TIPO:RFID" vinda de um leitor e retorna a resposta para ele
+
+    Usado pela serial e pelo receptor UDP; retorna None se a linha não é um comando.
+    """
+    # Formato: "ENTRADA:RFID_123" ou "SAIDA:RFID_456"
+    if ':' not in comando:
+        return None
+
+    partes = comando.split(':', 1)
+    if len(partes) != 2:
+        return None
+
+    tipo, rfid = partes
+    tipo = tipo.strip().upper()
+    rfid = rfid.strip()
+
+    try:
+        if tipo == 'ENTRADA':
+            return gerenciador.registrar_entrada(rfid, catraca)
+        elif tipo == 'SAIDA':
+            return gerenciador.registrar_saida(rfid, catraca)
+    except FilaCheia:
+        # O leitor repete a batida; não é uma recusa do cartão
+        return {'sucesso': False, 'mensagem': 'Sistema ocupado, tente novamente', 'ocupado': True}
+    if tipo == 'STATUS':
+        return gerenciador.obter_status_atual()
+    return None
+
+
+class CanalSerial:
+    """
+    Uma catraca: a porta serial do seu ESP32, com leitura, escrita e reconexão próprias
+
+    Duas threads dividem a porta: a de leitura fica bloqueada em `readline`
+    (com timeout curto, só para poder encerrar) e processa cada linha assim
+    que ela chega; a de escrita fica bloqueada em `fila_comandos` e é a
+    única que escreve na porta, tanto comandos quanto respostas, então duas
+    mensagens nunca se misturam.
+
+    Se a porta cair (cabo desconectado, ESP32 reiniciando), o canal tenta
+    reabrir sozinho, com espera crescente de `RECONEXAO_MINIMA` até
+    `RECONEXAO_MAXIMA` segundos, sem afetar os canais das outras catracas.
+    """
+
+    TIMEOUT_LEITURA = 0.2  # segundos; só limita quanto o encerramento espera
+    RECONEXAO_MINIMA = 1.0
+    RECONEXAO_MAXIMA = 30.0
+    JANELA_VAZAO = 60  # segundos considerados em eventos_por_minuto
+
+    def __init__(self, catraca: str, porta: str, baudrate: int,
+                 processar: Callable[[str, str], Optional[Dict]]):
+        self.catraca = catraca
         self.porta = porta
         self.baudrate = baudrate
+        self.processar = processar  # (linha, catraca) -> resposta para o ESP32
         self.ativo = False
+        self.conectado = False
         self.serial = None
-        self.fila_comandos = queue.Queue()  # Fila para comandos E/S
-    
-    def iniciar(self):
-        """Inicia comunicação serial"""
-        try:
-            import serial
-            self.serial = serial.Serial(self.porta, self.baudrate, timeout=1)
-            self.ativo = True
-            print(f"✓ Conexão serial estabelecida em {self.porta}")
-            
-            # Thread para ler dados continuamente
-            thread = threading.Thread(target=self._loop_leitura, daemon=True)
+        self.fila_comandos = queue.Queue()  # (texto, descrição) a escrever na porta
+        self._threads = []
+        self._parar = threading.Event()
+
+        # Vazão e erros desta catraca
+        self.contadores = {
+            'eventos': 0,
+            'respostas': 0,
+            'comandos': 0,
+            'erros_leitura': 0,
+            'erros_escrita': 0,
+            'erros_processamento': 0,
+            'erros_conexao': 0,
+            'reconexoes': 0
+        }
+        self._instantes_eventos = deque(maxlen=10000)
+        self.ultima_atividade: Optional[float] = None
+        self.ultimo_erro: Optional[str] = None
+        self._metrica_processamento = SERIAL_PROCESSAMENTO.rotulos(catraca)
+        self._metrica_escrita = SERIAL_ESCRITA.rotulos(catraca)
+
+    def iniciar(self) -> bool:
+        """Tenta abrir a porta e inicia as threads (que seguem tentando se falhar)"""
+        self.ativo = True
+        self._parar.clear()
+        _canais_ativos.add(self)
+        conectado = self._conectar()
+        if not conectado:
+            logger.info("   A catraca %s será conectada quando %s estiver disponível", self.catraca, self.porta)
+
+        self._threads = [threading.Thread(target=self._loop_leitura, daemon=True),
+                         threading.Thread(target=self._loop_escrita, daemon=True)]
+        for thread in self._threads:
             thread.start()
-            
-            return True
-        
-        except ImportError:
-            print("❌ Biblioteca pyserial não instalada!")
-            print("   Instale com: pip install pyserial")
-            return False
+        return conectado
+
+    # ---------- Conexão ----------
+
+    def _conectar(self) -> bool:
+        import serial
+        try:
+            self.serial = serial.Serial(self.porta, self.baudrate, timeout=self.TIMEOUT_LEITURA)
         except Exception as e:
-            print(f"❌ Erro ao conectar serial: {e}")
-            print(f"   Verifique se a porta {self.porta} está correta")
-            print("   No Windows use algo como 'COM3', no Linux '/dev/ttyUSB0'")
+            # Só avisa na primeira falha; as tentativas seguintes só contam
+            if not self.contadores['erros_conexao']:
+                logger.error("❌ Erro ao conectar serial (%s): %s\n"
+                             "   Verifique se a porta %s está correta\n"
+                             "   No Windows use algo como 'COM3', no Linux '/dev/ttyUSB0'",
+                             self.catraca, e, self.porta)
+            self._contar_erro('erros_conexao', e)
             return False
-    
+
+        self.conectado = True
+        logger.info("✓ Conexão serial estabelecida em %s (catraca %s)", self.porta, self.catraca)
+        return True
+
+    def _desconectar(self, erro: Exception):
+        self.conectado = False
+        self._contar_erro('erros_leitura', erro)
+        logger.warning("⚠ Catraca %s desconectada (%s); tentando reconectar...", self.catraca, erro)
+        try:
+            self.serial.close()
+        except Exception:
+            pass
+
+    def _contar_erro(self, tipo: str, erro: Exception):
+        self.contadores[tipo] += 1
+        self.ultimo_erro = f"{tipo}: {erro}"
+
+    # ---------- Leitura ----------
+
     def _loop_leitura(self):
-        """Loop que lê comandos do ESP32 e envia comandos da fila"""
-        print("📡 Aguardando comandos do ESP32...\n")
-        
+        """Lê linhas do ESP32, bloqueando até chegar dado (ou estourar o timeout)"""
+        logger.info("📡 Aguardando comandos do ESP32 (%s)...", self.catraca)
+
+        parcial = b''
+        espera = self.RECONEXAO_MINIMA
         while self.ativo:
+            if not self.conectado:
+                if self._parar.wait(espera):
+                    break
+                if not self._conectar():
+                    espera = min(espera * 2, self.RECONEXAO_MAXIMA)
+                    continue
+                self.contadores['reconexoes'] += 1
+                espera = self.RECONEXAO_MINIMA
+                parcial = b''
+
             try:
-                # Envia comandos E/S se houver na fila
-                if not self.fila_comandos.empty():
-                    comando = self.fila_comandos.get()
-                    self.serial.write(comando.encode())
-                    self.serial.flush()
-                    print(f"[Python → ESP32] Comando enviado: {comando}")
-                
-                # Lê do ESP32
-                if self.serial.in_waiting:
-                    linha = self.serial.readline().decode('utf-8').strip()
-                    
-                    if linha and not linha.startswith('='):  # Ignora linhas decorativas
-                        print(f"[ESP32 → Python] {linha}")
-                        self._processar_comando(linha)
-            
+                dados = self.serial.readline()
             except Exception as e:
-                print(f"❌ Erro ao ler/escrever serial: {e}")
-            
-            time.sleep(0.05)
-    
-    def _processar_comando(self, comando: str):
-        """Processa comando recebido do ESP32"""
+                if self.ativo:
+                    self._desconectar(e)
+                continue
+
+            if not dados:
+                continue
+
+            # Timeout no meio da linha: guarda o pedaço até o resto chegar
+            parcial += dados
+            if not parcial.endswith(b'\n'):
+                continue
+            linha, parcial = parcial.decode('utf-8', errors='replace').strip(), b''
+
+            if linha and not linha.startswith('='):  # Ignora linhas decorativas
+                logger.debug("[ESP32 %s → Python] %s", self.catraca, linha)
+                self._processar_linha(linha)
+
+    def _processar_linha(self, linha: str):
+        agora = time.time()
+        self.contadores['eventos'] += 1
+        self._instantes_eventos.append(agora)
+        self.ultima_atividade = agora
+
+        inicio = time.perf_counter()
         try:
-            # Formato: "ENTRADA:RFID_123" ou "SAIDA:RFID_456"
-            if ':' not in comando:
-                return
-            
-            partes = comando.split(':', 1)
-            if len(partes) != 2:
-                return
-            
-            tipo, rfid = partes
-            tipo = tipo.strip().upper()
-            rfid = rfid.strip()
-            
-            resultado = None
-            
-            if tipo == 'ENTRADA':
-                resultado = self.gerenciador.registrar_entrada(rfid)
-            elif tipo == 'SAIDA':
-                resultado = self.gerenciador.registrar_saida(rfid)
-            elif tipo == 'STATUS':
-                resultado = self.gerenciador.obter_status_atual()
-            
-            if resultado:
-                self._enviar_resposta(resultado)
-        
+            resposta = self.processar(linha, self.catraca)
         except Exception as e:
-            print(f"❌ Erro ao processar comando: {e}")
-    
-    def _enviar_resposta(self, resposta: Dict):
-        """Envia resposta JSON para o ESP32"""
+            logger.exception("❌ Erro ao processar comando (%s)", self.catraca)
+            self._contar_erro('erros_processamento', e)
+            return
+        finally:
+            self._metrica_processamento.observar(time.perf_counter() - inicio)
+
+        if resposta:
+            self.enviar_resposta(resposta)
+
+    # ---------- Escrita ----------
+
+    def _loop_escrita(self):
+        """Único ponto que escreve na porta: comandos e respostas, na ordem da fila"""
+        while True:
+            item = self.fila_comandos.get()
+            if item is None:
+                break
+
+            texto, descricao = item
+            if not self.conectado:
+                # ESP32 fora do ar: a resposta não serve mais quando ele voltar
+                self._contar_erro('erros_escrita', 'porta desconectada')
+                continue
+
+            try:
+                inicio = time.perf_counter()
+                self.serial.write(texto.encode('utf-8'))
+                self.serial.flush()
+                self._metrica_escrita.observar(time.perf_counter() - inicio)
+                logger.debug("[Python → ESP32 %s] %s", self.catraca, descricao)
+            except Exception as e:
+                logger.error("❌ Erro ao escrever serial (%s): %s", self.catraca, e)
+                self._contar_erro('erros_escrita', e)
+
+    def enviar_resposta(self, resposta: Dict):
+        """Envia resposta JSON para o ESP32 (pela thread de escrita)"""
         try:
             mensagem = json.dumps(resposta, ensure_ascii=False) + '\n'
-            self.serial.write(mensagem.encode('utf-8'))
-            print(f"[Python → ESP32] {resposta.get('mensagem', 'OK')}")
-        
         except Exception as e:
-            print(f"❌ Erro ao enviar resposta: {e}")
-    
-    def enviar_comando_esp32(self, comando: str):
-        """Adiciona comando E ou S na fila para enviar ao ESP32"""
-        if self.ativo and self.serial:
-            self.fila_comandos.put(comando)
-        else:
-            print("❌ Serial não está ativa para enviar comandos.")
-    
+            logger.error("❌ Erro ao enviar resposta (%s): %s", self.catraca, e)
+            self._contar_erro('erros_escrita', e)
+            return
+        self.contadores['respostas'] += 1
+        self.fila_comandos.put((mensagem, resposta.get('mensagem', 'OK')))
+
+    def enviar_comando(self, comando: str):
+        self.contadores['comandos'] += 1
+        self.fila_comandos.put((comando, f"Comando enviado: {comando}"))
+
+    # ---------- Consulta ----------
+
+    def obter_estatisticas(self) -> Dict:
+        limite = time.time() - self.JANELA_VAZAO
+        recentes = sum(1 for instante in list(self._instantes_eventos) if instante >= limite)
+        return {
+            'catraca': self.catraca,
+            'porta': self.porta,
+            'conectado': self.conectado,
+            **self.contadores,
+            'eventos_por_minuto': round(recentes * 60 / self.JANELA_VAZAO, 1),
+            'ultima_atividade': datetime.datetime.fromtimestamp(self.ultima_atividade).isoformat()
+            if self.ultima_atividade else None,
+            'ultimo_erro': self.ultimo_erro
+        }
+
     def parar(self):
-        """Para a comunicação serial"""
         self.ativo = False
-        if self.serial:
+        self._parar.set()
+        _canais_ativos.discard(self)
+        self.fila_comandos.put(None)
+        for thread in self._threads:
+            thread.join(timeout=2 * self.TIMEOUT_LEITURA + 1)
+        if self.serial and self.conectado:
+            self.conectado = False
             self.serial.close()
-        print("Serial encerrada.")
\ No newline at end of file
+
+
+def _coletar_metricas():
+    """Conexão e contadores de cada catraca ativa, lidos na hora da exportação"""
+    canais = sorted(_canais_ativos, key=lambda canal: canal.catraca)
+
+    def por_catraca(valor):
+        return [({'catraca': canal.catraca}, valor(canal)) for canal in canais]
+
+    yield ('serial_conectado', 'gauge', 'Porta serial da catraca aberta (1) ou não (0)',
+           por_catraca(lambda canal: canal.conectado))
+    yield ('serial_fila_escrita', 'gauge', 'Mensagens aguardando a thread de escrita',
+           por_catraca(lambda canal: canal.fila_comandos.qsize()))
+    for chave in ('eventos', 'respostas', 'comandos', 'reconexoes'):
+        yield (f'serial_{chave}_total', 'counter', f'Total de {chave} da catraca',
+               por_catraca(lambda canal: canal.contadores[chave]))
+    yield ('serial_erros_total', 'counter', 'Erros da catraca por tipo',
+           [({'catraca': canal.catraca, 'tipo': chave[len('erros_'):]}, valor)
+            for canal in canais for chave, valor in canal.contadores.items() if chave.startswith('erros_')])
+
+
+REGISTRO.coletor('serial', _coletar_metricas)
+
+
+class IntegradorESP32Serial:
+    """
+    Integração com ESP32 via porta serial (USB)
+
+    `porta` é uma porta só (uma catraca) ou uma lista de catracas no formato
+    {"catraca": "norte", "porta": "/dev/ttyUSB0", "baudrate": opcional}.
+    Cada catraca é um `CanalSerial` independente: um cabo com defeito só
+    afeta a própria catraca, e cada evento chega ao gerenciador marcado com
+    a catraca de origem.
+    """
+
+    TIMEOUT_LEITURA = CanalSerial.TIMEOUT_LEITURA
+
+    def __init__(self, gerenciador: GerenciadorRestaurante,
+                 porta='/dev/ttyUSB0',
+                 baudrate: int = 115200):
+        self.gerenciador = gerenciador
+        self.porta = porta
+        self.baudrate = baudrate
+
+        catracas = [{'catraca': 'principal', 'porta': porta}] if isinstance(porta, str) else porta
+        self.canais: List[CanalSerial] = [
+            CanalSerial(str(catraca.get('catraca', catraca['porta'])), catraca['porta'],
+                        catraca.get('baudrate', baudrate), self._processar_comando)
+            for catraca in catracas
+        ]
+
+    @property
+    def ativo(self) -> bool:
+        return any(canal.ativo for canal in self.canais)
+
+    def iniciar(self):
+        """Inicia comunicação serial com todas as catracas"""
+        try:
+            import serial  # noqa: F401
+        except ImportError:
+            logger.error("❌ Biblioteca pyserial não instalada! Instale com: pip install pyserial")
+            return False
+
+        for canal in self.canais:
+            canal.iniciar()
+        return True
+
+    def _processar_comando(self, comando: str, catraca: Optional[str] = None) -> Optional[Dict]:
+        """Processa comando recebido do ESP32 e retorna a resposta para ele"""
+        return processar_comando(self.gerenciador, comando, catraca)
+
+    def enviar_comando_esp32(self, comando: str, catraca: Optional[str] = None):
+        """Adiciona comando E ou S na fila da catraca (a primeira, se não informada)"""
+        canal = next((c for c in self.canais if catraca is None or c.catraca == catraca), None)
+        if canal and canal.ativo and canal.conectado:
+            canal.enviar_comando(comando)
+        else:
+            logger.warning("❌ Serial não está ativa para enviar comandos.")
+
+    def obter_estatisticas(self) -> List[Dict]:
+        """Vazão, erros e estado da conexão de cada catraca"""
+        return [canal.obter_estatisticas() for canal in self.canais]
+
+    def parar(self):
+        """Para a comunicação serial"""
+        for canal in self.canais:
+            canal.parar()
+        logger.info("Serial encerrada.")
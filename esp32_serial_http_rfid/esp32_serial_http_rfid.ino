@@ -26,18 +26,23 @@
  * LÓGICA MODO HTTP:
  * - Mesma lógica de E/S via serial
  * - Envia evento via HTTP POST para o servidor Python
+ * - Com USAR_UDP, envia um datagrama "SEQ TIPO:RFID" em vez do POST e
+ *   retransmite com o mesmo SEQ até receber "ACK SEQ ..." do servidor
+ *   (HABILITAR_UDP = True no config.py)
  */
 
 #include <SPI.h>
 #include <MFRC522.h>
 #include <WiFi.h>
 #include <HTTPClient.h>
+#include <WiFiUdp.h>
 #include <ArduinoJson.h>
 
 // ============================================================
 // CONFIGURAÇÃO: ESCOLHA O MODO AQUI
 // ============================================================
 #define MODO_HTTP true  // true = envia via HTTP | false = envia via Serial
+#define USAR_UDP false  // com MODO_HTTP: true = envia por UDP (um datagrama por cartão)
 
 // ============================================================
 // CONFIGURAÇÕES Wi-Fi (somente para MODO_HTTP = true)
@@ -45,6 +50,14 @@
 const char* WIFI_SSID = "IoT";
 const char* WIFI_PASSWORD = "tudoehiot";
 const char* SERVER_URL = "http://10.191.217.193:5000/evento";
+const char* SERVER_IP = "10.191.217.193";
+const int SERVER_UDP_PORT = 5005;
+
+// UDP: tentativas e espera pela confirmação de cada evento
+const int UDP_TENTATIVAS = 4;
+const unsigned long UDP_TIMEOUT_ACK = 300;  // ms
+WiFiUDP udp;
+uint32_t seqEvento = 0;
 
 #define SS_PIN 21
 #define RST_PIN 22
@@ -77,9 +90,14 @@ void setup() {
   Serial.println("  ESP32 - Sistema de Controle de Restaurante");
   
   if (MODO_HTTP) {
-    Serial.println("  Modo: HTTP (Wi-Fi)");
+    Serial.println(USAR_UDP ? "  Modo: UDP (Wi-Fi)" : "  Modo: HTTP (Wi-Fi)");
     Serial.println("===========================================");
     conectarWiFi();
+    if (USAR_UDP) {
+      udp.begin(SERVER_UDP_PORT);
+      // Sequência aleatória a cada boot: não colide com a anterior ao reiniciar
+      seqEvento = esp_random() % 1000000000UL;
+    }
   } else {
     Serial.println("  Modo: SERIAL (USB)");
     Serial.println("===========================================");
@@ -188,7 +206,10 @@ String obterRFID() {
 }
 
 void enviarEvento(String tipo, String rfid) {
-  if (MODO_HTTP) {
+  if (MODO_HTTP && USAR_UDP) {
+    // Modo UDP: um datagrama, confirmado pelo servidor
+    enviarEventoUDP(tipo, rfid);
+  } else if (MODO_HTTP) {
     // Modo HTTP: envia via POST
     enviarEventoHTTP(tipo, rfid);
   } else {
@@ -230,6 +251,39 @@ void enviarEventoHTTP(String tipo, String rfid) {
   http.end();
 }
 
+void enviarEventoUDP(String tipo, String rfid) {
+  if (WiFi.status() != WL_CONNECTED) {
+    Serial.println("✗ Wi-Fi desconectado! Não foi possível enviar.");
+    return;
+  }
+  
+  seqEvento++;
+  String mensagem = String(seqEvento) + " " + tipo + ":" + rfid;
+  String esperado = "ACK " + String(seqEvento) + " ";
+  Serial.println("📤 Enviando (UDP): " + mensagem);
+  
+  // Retransmite com o mesmo número: o servidor não registra o evento duas vezes
+  for (int tentativa = 0; tentativa < UDP_TENTATIVAS; tentativa++) {
+    udp.beginPacket(SERVER_IP, SERVER_UDP_PORT);
+    udp.print(mensagem);
+    udp.endPacket();
+    
+    unsigned long inicio = millis();
+    while (millis() - inicio < UDP_TIMEOUT_ACK) {
+      if (udp.parsePacket() > 0) {
+        String resposta = udp.readString();
+        if (resposta.startsWith(esperado)) {
+          Serial.println("✓ Resposta: " + resposta.substring(esperado.length()));
+          return;
+        }
+      }
+      delay(1);
+    }
+  }
+  
+  Serial.println("✗ Sem confirmação do servidor (UDP)");
+}
+
 void piscarLED(int vezes) {
   for (int i = 0; i < vezes; i++) {
     digitalWrite(LED_PIN, HIGH);
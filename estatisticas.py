@@ -0,0 +1,102 @@
+"""
+Agregados incrementais de tempo de permanência
+
+Cada visita atualiza contagem, soma, mínimo, máximo e um histograma de
+faixas fixas. As consultas (média e percentis) custam O(1) em relação ao
+número de visitas, e histogramas de períodos diferentes podem ser somados.
+"""
+
+import bisect
+from typing import Dict, List, Optional
+
+
+def _limites_faixas() -> List[int]:
+    """Limites superiores (em segundos) das faixas do histograma"""
+    limites = list(range(15, 3600 + 1, 15))            # até 1h, faixas de 15s
+    limites += list(range(3600 + 300, 4 * 3600 + 1, 300))  # até 4h, faixas de 5min
+    return limites
+
+
+class EstatisticasDuracao:
+    """Contagem/soma/mín/máx e histograma de durações, atualizados a cada visita"""
+
+    LIMITES = _limites_faixas()
+
+    def __init__(self):
+        self.contagem = 0
+        self.soma = 0
+        self.minimo: Optional[int] = None
+        self.maximo: Optional[int] = None
+        # Uma faixa extra no fim para durações acima do último limite
+        self.faixas = [0] * (len(self.LIMITES) + 1)
+
+    def adicionar(self, segundos: int):
+        self.contagem += 1
+        self.soma += segundos
+        if self.minimo is None or segundos < self.minimo:
+            self.minimo = segundos
+        if self.maximo is None or segundos > self.maximo:
+            self.maximo = segundos
+        self.faixas[bisect.bisect_left(self.LIMITES, segundos)] += 1
+
+    def copiar(self) -> 'EstatisticasDuracao':
+        copia = EstatisticasDuracao()
+        copia.contagem, copia.soma = self.contagem, self.soma
+        copia.minimo, copia.maximo = self.minimo, self.maximo
+        copia.faixas = list(self.faixas)
+        return copia
+
+    def mesclar(self, outra: 'EstatisticasDuracao'):
+        """Soma os agregados de outro período a este"""
+        if not outra.contagem:
+            return
+        self.contagem += outra.contagem
+        self.soma += outra.soma
+        self.minimo = outra.minimo if self.minimo is None else min(self.minimo, outra.minimo)
+        self.maximo = outra.maximo if self.maximo is None else max(self.maximo, outra.maximo)
+        for i, quantidade in enumerate(outra.faixas):
+            self.faixas[i] += quantidade
+
+    @property
+    def media(self) -> float:
+        return self.soma / self.contagem if self.contagem else 0
+
+    def percentil(self, p: float) -> Optional[int]:
+        """
+        Estima o percentil `p` (0-100) interpolando dentro da faixa do histograma
+
+        O erro máximo é a largura da faixa (15s até 1h, 5min até 4h).
+        """
+        if not self.contagem:
+            return None
+
+        alvo = p / 100 * self.contagem
+        acumulado = 0
+        for i, quantidade in enumerate(self.faixas):
+            if quantidade and acumulado + quantidade >= alvo:
+                inferior = self.LIMITES[i - 1] if i > 0 else 0
+                superior = self.LIMITES[i] if i < len(self.LIMITES) else self.maximo
+                fracao = (alvo - acumulado) / quantidade
+                estimativa = inferior + fracao * (superior - inferior)
+                return int(min(max(estimativa, self.minimo), self.maximo))
+            acumulado += quantidade
+        return self.maximo
+
+    def exportar_estado(self) -> Dict:
+        return {
+            'contagem': self.contagem,
+            'soma': self.soma,
+            'minimo': self.minimo,
+            'maximo': self.maximo,
+            'faixas': list(self.faixas)
+        }
+
+    @classmethod
+    def restaurar_estado(cls, estado: Dict) -> 'EstatisticasDuracao':
+        estatisticas = cls()
+        estatisticas.contagem = estado['contagem']
+        estatisticas.soma = estado['soma']
+        estatisticas.minimo = estado['minimo']
+        estatisticas.maximo = estado['maximo']
+        estatisticas.faixas = list(estado['faixas'])
+        return estatisticas
@@ -0,0 +1,97 @@
+"""
+Difusão de eventos (entradas, saídas e fila) para o dashboard via Server-Sent Events
+
+O gerenciador avisa cada mudança por um ouvinte; o difusor serializa o
+delta uma única vez e o coloca no buffer de cada assinante. Cada buffer tem
+tamanho limitado: se um cliente lento não consome a tempo, os deltas mais
+antigos dele são descartados e o cliente é avisado para recarregar o estado
+completo, sem atrasar os demais.
+"""
+
+import json
+import threading
+from collections import deque
+from typing import Dict, List, Tuple
+
+
+class AssinaturaEventos:
+    """Buffer limitado de um cliente conectado ao stream"""
+
+    def __init__(self, tamanho_buffer: int):
+        self._buffer = deque(maxlen=tamanho_buffer)
+        self._condicao = threading.Condition()
+        self.perdeu_eventos = False
+
+    def _entregar(self, mensagem: str):
+        with self._condicao:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.perdeu_eventos = True
+            self._buffer.append(mensagem)
+            self._condicao.notify()
+
+    def proximas(self, timeout: float) -> Tuple[List[str], bool]:
+        """
+        Espera até `timeout` segundos por mensagens
+
+        Retorna as mensagens pendentes e se alguma foi descartada desde a
+        última chamada (nesse caso o cliente precisa recarregar o estado).
+        """
+        with self._condicao:
+            if not self._buffer:
+                self._condicao.wait(timeout)
+            mensagens = list(self._buffer)
+            self._buffer.clear()
+            perdeu = self.perdeu_eventos
+            self.perdeu_eventos = False
+            return mensagens, perdeu
+
+
+class DifusorEventos:
+    """Distribui os deltas do gerenciador para todos os clientes conectados"""
+
+    def __init__(self, tamanho_buffer: int = 100):
+        self.tamanho_buffer = tamanho_buffer
+        self._assinantes = set()
+        self._lock = threading.Lock()
+
+    def assinar(self) -> AssinaturaEventos:
+        assinatura = AssinaturaEventos(self.tamanho_buffer)
+        with self._lock:
+            self._assinantes.add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura: AssinaturaEventos):
+        with self._lock:
+            self._assinantes.discard(assinatura)
+
+    @property
+    def total_assinantes(self) -> int:
+        return len(self._assinantes)
+
+    def publicar(self, delta: Dict):
+        """Ouvinte do gerenciador: envia o delta para todos os assinantes"""
+        with self._lock:
+            assinantes = list(self._assinantes)
+        if not assinantes:
+            return
+
+        mensagem = f"event: {delta['evento']}\ndata: {json.dumps(delta, ensure_ascii=False)}\n\n"
+        for assinatura in assinantes:
+            assinatura._entregar(mensagem)
+
+    def gerar_stream(self, intervalo_keepalive: float = 15.0):
+        """Gerador do corpo da resposta text/event-stream de um cliente"""
+        assinatura = self.assinar()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                mensagens, perdeu = assinatura.proximas(intervalo_keepalive)
+                if perdeu:
+                    # O cliente vai recarregar tudo; os deltas restantes já estariam incluídos
+                    yield "event: resync\ndata: {}\n\n"
+                elif mensagens:
+                    yield ''.join(mensagens)
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            self.cancelar(assinatura)
@@ -0,0 +1,192 @@
+"""
+Exportação em NDJSON (opcionalmente gzip), sem parar as catracas
+
+`exportar_dados` monta um único JSON com tudo e o grava de uma vez; num dia
+cheio isso é um dict enorme na memória. Aqui as linhas de
+`GerenciadorRestaurante.gerar_exportacao` (um corte consistente tirado em
+microssegundos sob o lock) são escritas conforme são geradas:
+
+- `exportar_ndjson` grava um arquivo (`.gz` = compactado), trocando o
+  anterior só quando o novo está completo;
+- `comprimir_gzip` compacta o stream para a resposta HTTP (GET /exportar);
+- `ExportadorPeriodico` exporta a cada intervalo, numa thread própria, e
+  guarda só as últimas exportações;
+- `ler_exportacao` lê de volta uma exportação (NDJSON ou o dados_ru.json)
+  para `GerenciadorRestaurante.importar_exportacao`.
+"""
+
+import datetime
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+from gerenciador import GerenciadorRestaurante
+from metricas import REGISTRO
+
+logger = logging.getLogger(__name__)
+
+EXPORTACAO_DURACAO = REGISTRO.histograma(
+    'exportacao_segundos', 'Duração de uma exportação NDJSON para arquivo')
+
+# Texto acumulado antes de cada escrita/compactação (menos chamadas, memória limitada)
+TAMANHO_BLOCO = 64 * 1024
+
+
+def _em_blocos(linhas: Iterable[str]) -> Iterator[bytes]:
+    bloco, tamanho = [], 0
+    for linha in linhas:
+        bloco.append(linha)
+        tamanho += len(linha)
+        if tamanho >= TAMANHO_BLOCO:
+            yield ''.join(bloco).encode('utf-8')
+            bloco, tamanho = [], 0
+    if bloco:
+        yield ''.join(bloco).encode('utf-8')
+
+
+def comprimir_gzip(linhas: Iterable[str], nivel: int = 6) -> Iterator[bytes]:
+    """Compacta um stream de linhas em gzip, devolvendo os pedaços conforme ficam prontos"""
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # cabeçalho gzip
+    for bloco in _em_blocos(linhas):
+        saida = compressor.compress(bloco)
+        if saida:
+            yield saida
+    yield compressor.flush()
+
+
+def exportar_ndjson(gerenciador: GerenciadorRestaurante, arquivo: str,
+                    compactar: Optional[bool] = None) -> int:
+    """
+    Grava a exportação completa em `arquivo` e retorna quantas linhas foram escritas
+
+    `compactar` None decide pela extensão (.gz). O arquivo é escrito ao lado,
+    com sufixo .tmp, e só substitui o anterior quando termina.
+    """
+    if compactar is None:
+        compactar = arquivo.endswith('.gz')
+
+    inicio = time.perf_counter()
+    temporario = arquivo + '.tmp'
+    linhas = 0
+
+    def contar(geradas):
+        nonlocal linhas
+        for linha in geradas:
+            linhas += 1
+            yield linha
+
+    abrir = (lambda caminho: gzip.open(caminho, 'wb', compresslevel=6)) if compactar \
+        else (lambda caminho: open(caminho, 'wb'))
+    try:
+        with abrir(temporario) as f:
+            for bloco in _em_blocos(contar(gerenciador.gerar_exportacao())):
+                f.write(bloco)
+        os.replace(temporario, arquivo)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+    duracao = time.perf_counter() - inicio
+    EXPORTACAO_DURACAO.observar(duracao)
+    logger.info("Exportação gravada em %s: %d linhas em %.1f s", arquivo, linhas, duracao)
+    return linhas
+
+
+def ler_exportacao(arquivo: str) -> Dict:
+    """
+    Lê uma exportação no formato de `exportar_dados` (dados_ru.json)
+
+    Arquivos .ndjson/.ndjson.gz (desta exportação) são convertidos para o
+    mesmo formato.
+    """
+    if not arquivo.endswith(('.ndjson', '.ndjson.gz')):
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    dados = {'historico': [], 'tempos_permanencia': [], 'estatisticas': {}}
+    abrir = gzip.open if arquivo.endswith('.gz') else open
+    with abrir(arquivo, 'rt', encoding='utf-8') as f:
+        for linha in f:
+            registro = json.loads(linha)
+            tipo = registro.pop('registro')
+            if tipo == 'evento':
+                dados['historico'].append(registro)
+            elif tipo == 'permanencia':
+                dados['tempos_permanencia'].append(registro)
+            elif tipo == 'estatisticas_dia':
+                dados['estatisticas'][registro.pop('data')] = registro
+            elif tipo == 'exportacao':
+                dados.update((chave, registro[chave]) for chave in
+                             ('pessoas_dentro', 'pessoas_na_fila', 'filas', 'exportado_em'))
+            elif tipo == 'estatisticas_tempo':
+                dados['estatisticas_tempo'] = registro
+    return dados
+
+
+class ExportadorPeriodico:
+    """Exporta o estado a cada `intervalo` segundos numa thread própria, mantendo as últimas `manter`"""
+
+    PREFIXO = 'exportacao_'
+
+    def __init__(self, gerenciador: GerenciadorRestaurante,
+                 diretorio: str,
+                 intervalo: float = 3600,
+                 manter: int = 24,
+                 compactar: bool = True):
+        self.gerenciador = gerenciador
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self.manter = manter
+        self.extensao = '.ndjson.gz' if compactar else '.ndjson'
+        self.ultima_exportacao: Optional[str] = None
+        self.ativo = False
+        self._acordar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.ativo = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        logger.info("✓ Exportação periódica a cada %d min em %s", self.intervalo // 60, self.diretorio)
+
+    def solicitar(self):
+        """Pede uma exportação agora (feita na thread do exportador)"""
+        self._acordar.set()
+
+    def _loop(self):
+        while self.ativo:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            if not self.ativo:
+                break
+            try:
+                self.exportar()
+            except Exception:
+                logger.exception("❌ Erro na exportação periódica")
+
+    def exportar(self) -> str:
+        """Exporta para um arquivo novo e apaga os mais antigos além de `manter`"""
+        nome = self.PREFIXO + datetime.datetime.now().strftime('%Y%m%d_%H%M%S') + self.extensao
+        arquivo = os.path.join(self.diretorio, nome)
+        exportar_ndjson(self.gerenciador, arquivo)
+        self.ultima_exportacao = arquivo
+
+        antigos = sorted(glob.glob(os.path.join(self.diretorio, self.PREFIXO + '*' + self.extensao)))
+        for antigo in antigos[:-self.manter] if self.manter > 0 else []:
+            os.remove(antigo)
+        return arquivo
+
+    def parar(self):
+        self.ativo = False
+        self._acordar.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        logger.info("Exportação periódica encerrada.")
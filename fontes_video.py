@@ -0,0 +1,190 @@
+"""
+Fontes de frames para o monitor de fila
+
+Todas têm a mesma interface do `cv2.VideoCapture` (`isOpened`, `read`,
+`release`), então o monitor e o benchmark não precisam saber de onde vêm os
+frames: webcam, arquivo de vídeo, sequência de imagens ou um gerador
+sintético com figuras andando, útil para testar num servidor sem câmera.
+
+Com `tempo_real`, arquivos, imagens e o gerador entregam os frames no ritmo
+do vídeo original (`fps`); sem ele, o mais rápido possível.
+"""
+
+import glob
+import os
+import random
+import time
+from typing import List
+
+import cv2
+import numpy as np
+
+
+class _Ritmo:
+    """Segura a leitura para manter `fps` frames por segundo"""
+
+    def __init__(self, fps: float, ativo: bool):
+        self.intervalo = 1 / fps if ativo and fps > 0 else 0
+        self._proximo = None
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        agora = time.monotonic()
+        if self._proximo is None:
+            self._proximo = agora
+        elif self._proximo > agora:
+            time.sleep(self._proximo - agora)
+        # Se atrasou mais de um frame, não tenta compensar de uma vez
+        self._proximo = max(self._proximo, agora - self.intervalo) + self.intervalo
+
+
+class FonteArquivoVideo:
+    """Arquivo de vídeo (ou URL de stream) lido pelo OpenCV"""
+
+    def __init__(self, caminho: str, tempo_real: bool = False, repetir: bool = False):
+        self.caminho = caminho
+        self.repetir = repetir
+        self._cap = cv2.VideoCapture(caminho)
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 30
+        self._ritmo = _Ritmo(self.fps, tempo_real)
+
+    def isOpened(self) -> bool:
+        return self._cap.isOpened()
+
+    def read(self):
+        self._ritmo.esperar()
+        ret, frame = self._cap.read()
+        if not ret and self.repetir:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._cap.read()
+        return ret, frame
+
+    def release(self):
+        self._cap.release()
+
+
+class FonteSequenciaImagens:
+    """Imagens de um diretório (em ordem alfabética) ou de um padrão glob"""
+
+    EXTENSOES = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self, padrao: str, fps: float = 15, tempo_real: bool = False, repetir: bool = False):
+        if os.path.isdir(padrao):
+            arquivos = [os.path.join(padrao, nome) for nome in os.listdir(padrao)]
+        else:
+            arquivos = glob.glob(padrao)
+        self.arquivos: List[str] = sorted(a for a in arquivos if a.lower().endswith(self.EXTENSOES))
+        self.fps = fps
+        self.repetir = repetir
+        self._ritmo = _Ritmo(fps, tempo_real)
+        self._indice = 0
+
+    def isOpened(self) -> bool:
+        return bool(self.arquivos)
+
+    def read(self):
+        if self._indice >= len(self.arquivos):
+            if not self.repetir or not self.arquivos:
+                return False, None
+            self._indice = 0
+
+        self._ritmo.esperar()
+        frame = cv2.imread(self.arquivos[self._indice])
+        self._indice += 1
+        return frame is not None, frame
+
+    def release(self):
+        self._indice = len(self.arquivos)
+
+
+class FonteSintetica:
+    """
+    Gerador de frames com figuras humanas simplificadas andando
+
+    Cada figura (cabeça + tronco + pernas) atravessa a cena numa altura e
+    velocidade próprias; a semente fixa deixa a sequência reproduzível.
+    `total_quadros` = 0 gera frames sem fim.
+    """
+
+    def __init__(self, pessoas: int = 4, largura: int = 640, altura: int = 480,
+                 fps: float = 15, total_quadros: int = 0,
+                 tempo_real: bool = False, semente: int = 0):
+        self.largura = largura
+        self.altura = altura
+        self.fps = fps
+        self.total_quadros = total_quadros
+        self._ritmo = _Ritmo(fps, tempo_real)
+        self._quadro = 0
+        self._aberta = True
+
+        aleatorio = random.Random(semente)
+        escala = altura / 480
+        self._figuras = [{
+            'x': aleatorio.uniform(0, largura),
+            'y': aleatorio.uniform(0.45, 0.75) * altura,
+            'velocidade': aleatorio.choice((-1, 1)) * aleatorio.uniform(1, 4) * escala,
+            'altura': aleatorio.uniform(150, 220) * escala,
+            'cor': tuple(aleatorio.randint(30, 200) for _ in range(3))
+        } for _ in range(pessoas)]
+
+        # Fundo com um pouco de textura, gerado uma vez
+        self._fundo = np.full((altura, largura, 3), 170, np.uint8)
+        cv2.randn(self._fundo, 170, 12)
+        cv2.rectangle(self._fundo, (0, int(altura * 0.8)), (largura, altura), (110, 110, 110), -1)
+
+    def isOpened(self) -> bool:
+        return self._aberta
+
+    def read(self):
+        if not self._aberta or (self.total_quadros and self._quadro >= self.total_quadros):
+            return False, None
+
+        self._ritmo.esperar()
+        frame = self._fundo.copy()
+        for figura in self._figuras:
+            x = (figura['x'] + figura['velocidade'] * self._quadro) % (self.largura + 100) - 50
+            self._desenhar_figura(frame, int(x), int(figura['y']), figura['altura'],
+                                  figura['cor'], self._quadro)
+        self._quadro += 1
+        return True, frame
+
+    @staticmethod
+    def _desenhar_figura(frame, x: int, base: int, altura: float, cor, quadro: int):
+        """Figura de pé com os pés em (x, base), balançando as pernas"""
+        cabeca = int(altura * 0.08)
+        topo = int(base - altura)
+        quadril = int(base - altura * 0.48)
+        ombro = topo + 2 * cabeca + 4
+        passo = int(altura * 0.12 * np.sin(quadro / 3))
+
+        cv2.circle(frame, (x, topo + cabeca), cabeca, cor, -1)
+        cv2.rectangle(frame, (x - int(altura * 0.12), ombro), (x + int(altura * 0.12), quadril), cor, -1)
+        largura_perna = max(2, int(altura * 0.06))
+        cv2.line(frame, (x, quadril), (x - passo, base), cor, largura_perna)
+        cv2.line(frame, (x, quadril), (x + passo, base), cor, largura_perna)
+
+    def release(self):
+        self._aberta = False
+
+
+def abrir_fonte(fonte, tempo_real: bool = False, repetir: bool = False):
+    """
+    Abre a fonte de frames indicada na configuração da câmera
+
+    - int (ou texto com só dígitos): índice da webcam;
+    - "sintetico" ou "sintetico:N": gerador com N figuras (padrão 4);
+    - diretório ou padrão glob (ex.: "frames/*.png"): sequência de imagens;
+    - qualquer outro texto: arquivo de vídeo ou URL.
+    """
+    if isinstance(fonte, int) or (isinstance(fonte, str) and fonte.isdigit()):
+        return cv2.VideoCapture(int(fonte))
+
+    if fonte.startswith('sintetico'):
+        _, _, pessoas = fonte.partition(':')
+        return FonteSintetica(int(pessoas) if pessoas else 4, tempo_real=tempo_real)
+
+    if os.path.isdir(fonte) or glob.has_magic(fonte):
+        return FonteSequenciaImagens(fonte, tempo_real=tempo_real, repetir=repetir)
+
+    return FonteArquivoVideo(fonte, tempo_real=tempo_real, repetir=repetir)
@@ -1,171 +1,649 @@
 """
 Gerenciador principal do Restaurante Universitário
+
+Quem registra eventos toma `GerenciadorRestaurante.lock`; quem consulta não.
+Ao fim de cada alteração o escritor publica um `EstadoLeitura` novo, e as
+consultas trabalham sobre o último publicado. Nada que já foi publicado é
+alterado depois: estatísticas do dia, agregados de permanência, filas e
+cartões são trocados por cópias novas, e a lista de visitas só cresce no
+fim (os leitores usam o prefixo `total_tempos`; uma visita atrasada, que
+precisaria entrar no meio, vai para uma cópia da lista). Assim uma rajada de
+consultas do dashboard não atrasa as batidas nas catracas.
+
+Com um acervo (ver acervo.py), os dias que passaram de `dias_em_memoria`
+saem da memória: as visitas e eventos do dia vão para arquivos colunares e
+as consultas de permanência juntam o acervo (posições
+[0, tempos_arquivados)) com a lista em memória.
 """
 
+import bisect
 import datetime
+import gc
+import itertools
 import json
+import logging
 import threading
-from typing import Dict, List, Optional
-from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from collections import Counter, defaultdict, deque
 
+from diario import DiarioEventos
+from estatisticas import EstatisticasDuracao
+from historico import HistoricoEventos
+from metricas import REGISTRO
 from models import Registro
 
 
+logger = logging.getLogger(__name__)
+
+FILA_PADRAO = 'principal'  # linha usada por quem não informa a fila (instalação com uma câmera)
+
+def _chave_saida(tempo: Dict) -> str:
+    return tempo['saida']
+
+
+class Cartao(NamedTuple):
+    """Visitas de um cartão e a entrada em aberto, trocados juntos a cada batida"""
+    visitas: Tuple[Dict, ...]
+    entrada: Optional[datetime.datetime]
+    arquivadas: int = 0  # visitas anteriores, já no acervo
+
+
+class EstadoLeitura(NamedTuple):
+    """Estado publicado para as consultas; nunca é alterado depois de publicado"""
+    versao: int
+    dentro: Dict[str, datetime.datetime]  # rfid -> horário de entrada
+    filas: Dict[str, int]
+    pessoas_na_fila: int
+    ultima_atualizacao_fila: Optional[datetime.datetime]
+    estatisticas_diarias: Dict[str, Dict]
+    tempos: List[Dict]  # lista compartilhada com o escritor: vale só o prefixo `total_tempos`
+    total_tempos: int
+    estatisticas_tempo: EstatisticasDuracao
+    estatisticas_tempo_diarias: Dict[str, EstatisticasDuracao]
+    tempos_arquivados: int = 0  # visitas no acervo, antes de `tempos`
+
+
+def _com_catraca(dados: Dict, catraca: Optional[str]) -> Dict:
+    """Identifica a catraca (leitor) de origem no resultado, quando conhecida"""
+    if catraca is not None:
+        dados['catraca'] = catraca
+    return dados
+
+
+def _registrar_no_log(tipo: str, resultado: Dict, nivel: int):
+    """Registra no log o resultado de uma batida (chamar fora do lock)"""
+    if not logger.isEnabledFor(nivel):
+        return
+    origem = f" [{resultado['catraca']}]" if 'catraca' in resultado else ""
+    if not resultado['sucesso']:
+        logger.log(nivel, "%s recusada%s: %s (%s)", tipo, origem,
+                   resultado.get('rfid'), resultado['mensagem'])
+        return
+    tempo = resultado.get('tempo_permanencia')
+    permanencia = f" | Permanência: {tempo['duracao_formatada']}" if tempo else ""
+    logger.log(nivel, "%s registrada%s: %s | Pessoas dentro: %d%s", tipo, origem,
+               resultado['rfid'], resultado['pessoas_dentro'], permanencia)
+
+
+def converter_timestamp(valor) -> datetime.datetime:
+    """Converte ISO 8601 ou epoch em datetime local sem fuso (levanta ValueError)"""
+    try:
+        if isinstance(valor, (int, float)):
+            return datetime.datetime.fromtimestamp(valor)
+        timestamp = datetime.datetime.fromisoformat(str(valor))
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError('Timestamp inválido')
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
 class GerenciadorRestaurante:
     
-    def __init__(self):
+    def __init__(self, diario: Optional[DiarioEventos] = None,
+                 eventos_por_snapshot: int = 5000,
+                 historico: Optional[HistoricoEventos] = None,
+                 acervo=None,
+                 dias_em_memoria: int = 7):
         self.pessoas_dentro: set = set()
-        self.historico: List[Registro] = []
-        self.estatisticas_diarias = defaultdict(lambda: {
-            'total_entradas': 0,
-            'total_saidas': 0,
-            'pico_pessoas': 0,
-            'horarios_pico': []
-        })
+        self.historico = historico if historico is not None else HistoricoEventos()
+        self.estatisticas_diarias: Dict[str, Dict] = {}
         
-        # Controle da fila
+        # Controle da fila: uma contagem por linha de atendimento (câmera) e o total
+        self.filas: Dict[str, int] = {}
         self.pessoas_na_fila: int = 0
         self.ultima_atualizacao_fila: Optional[datetime.datetime] = None
         
         # Controle de tempo de permanência
         self.horarios_entrada: Dict[str, datetime.datetime] = {}
         self.tempos_permanencia: List[Dict] = []
+        self.cartoes: Dict[str, Cartao] = {}  # índice por cartão
+        
+        # Dias antigos no acervo colunar (opcional, ver acervo.py); ficam em memória
+        # as visitas dos últimos `dias_em_memoria` dias
+        self.acervo = acervo
+        self.dias_em_memoria = dias_em_memoria
+        self.tempos_arquivados = self.acervo.total_visitas if self.acervo else 0
+        # Até onde as visitas em memória já foram tiradas (o acervo avança antes, sem o lock)
+        self.arquivado_ate = self.acervo.arquivado_ate if self.acervo else None
+        self._arquivamento_em_andamento = False
+        self._lock_arquivamento = threading.Lock()
+        self._dia_arquivamento: Optional[datetime.date] = None
+        
+        # Agregados incrementais dos tempos de permanência (geral e por dia da saída)
+        self.estatisticas_tempo = EstatisticasDuracao()
+        self.estatisticas_tempo_diarias: Dict[str, EstatisticasDuracao] = defaultdict(EstatisticasDuracao)
+        
+        # Só para quem altera o estado; mede espera e posse em /metrics (gerenciador_lock_*)
+        self.lock = REGISTRO.lock_medido('gerenciador_lock', 'lock do gerenciador')
+        
+        # Último estado publicado e o que mudou desde então (o que precisa ser copiado)
+        self._estado: Optional[EstadoLeitura] = None
+        self._alterado = {'dentro', 'dias', 'tempos'}
+        
+        # Fila de ingestão com escritor único (opcional, ver ingestao.py): com ela
+        # ativa, registrar_entrada/registrar_saida só enfileiram e esperam o resultado
+        self.ingestao = None
+        
+        # Versão do estado: incrementada a cada mudança (usada como ETag)
+        self.versao = 0
+        
+        # Ouvintes notificados (fora do lock) a cada mudança, com um delta em dict.
+        # Os deltas vão para a fila de entrega com o lock, na ordem das versões, e
+        # um escritor de cada vez entrega a fila (ver `_notificar`)
+        self.ouvintes: List[Callable[[Dict], None]] = []
+        self._deltas_pendentes: List[Dict] = []
+        self._fila_notificacao: deque = deque()
+        self._lock_notificacao = threading.Lock()
+        
+        # Eventos em lote com horário do leitor: quanto à frente do relógio do servidor aceitar
+        self.tolerancia_futuro = datetime.timedelta(minutes=5)
+        # Horário do evento mais novo; um anterior a ele (atrasado) não usa a lotação de agora
+        # no pico do dia, que é refeito com os eventos do próprio dia antes de publicar
+        self._ultimo_horario: Optional[datetime.datetime] = None
+        self._picos_pendentes: set = set()
         
-        self.lock = threading.Lock()
+        # Persistência (opcional): diário de eventos + snapshots
+        self.diario = diario
+        self.eventos_por_snapshot = eventos_por_snapshot
+        self._snapshot_em_andamento = False
+        # Um snapshot por vez (automático, do arquivamento ou do encerramento), na ordem das gerações
+        self._lock_snapshot = threading.Lock()
+        if self.diario:
+            self._recuperar()
+        else:
+            self._publicar()
     
-    def registrar_entrada(self, rfid: str) -> Dict:
+    def registrar_entrada(self, rfid: str, catraca: Optional[str] = None) -> Dict:
+        if self.ingestao is not None and self.ingestao.ativo:
+            return self.ingestao.enviar('ENTRADA', rfid, catraca)
         with self.lock:
-            timestamp = datetime.datetime.now()
-            
-            if rfid in self.pessoas_dentro:
-                return {
-                    'sucesso': False,
-                    'mensagem': 'Pessoa já está dentro do restaurante',
-                    'rfid': rfid
-                }
-            
-            self.pessoas_dentro.add(rfid)
-            registro = Registro(rfid, timestamp, 'entrada')
-            self.historico.append(registro)
-            
-            self.horarios_entrada[rfid] = timestamp
-            
-            data_hoje = timestamp.date().isoformat()
-            stats = self.estatisticas_diarias[data_hoje]
-            stats['total_entradas'] += 1
-            
-            pessoas_atual = len(self.pessoas_dentro)
-            if pessoas_atual > stats['pico_pessoas']:
-                stats['pico_pessoas'] = pessoas_atual
-                stats['horarios_pico'] = [timestamp.strftime('%H:%M:%S')]
-            elif pessoas_atual == stats['pico_pessoas']:
-                stats['horarios_pico'].append(timestamp.strftime('%H:%M:%S'))
-            
-            print(f"ENTRADA registrada: {rfid} | Pessoas dentro: {pessoas_atual}")
-            
-            return {
-                'sucesso': True,
-                'mensagem': 'Entrada registrada com sucesso',
-                'rfid': rfid,
-                'timestamp': timestamp.isoformat(),
-                'pessoas_dentro': pessoas_atual
-            }
+            resultado = self._registrar_entrada(rfid, datetime.datetime.now(), catraca)
+            self._publicar()
+            self._enfileirar_deltas()
+        self._notificar()
+        _registrar_no_log('ENTRADA', resultado, logging.INFO)
+        return resultado
     
-    def registrar_saida(self, rfid: str) -> Dict:
+    def registrar_saida(self, rfid: str, catraca: Optional[str] = None) -> Dict:
+        if self.ingestao is not None and self.ingestao.ativo:
+            return self.ingestao.enviar('SAIDA', rfid, catraca)
         with self.lock:
-            timestamp = datetime.datetime.now()
-            
-            if rfid not in self.pessoas_dentro:
-                return {
-                    'sucesso': False,
-                    'mensagem': 'Pessoa não está dentro do restaurante',
-                    'rfid': rfid
-                }
-            
-            self.pessoas_dentro.remove(rfid)
-            registro = Registro(rfid, timestamp, 'saida')
-            self.historico.append(registro)
-            
-            tempo_permanencia = None
-            if rfid in self.horarios_entrada:
-                entrada = self.horarios_entrada[rfid]
-                duracao = timestamp - entrada
-                tempo_permanencia = {
-                    'rfid': rfid,
-                    'entrada': entrada.isoformat(),
-                    'saida': timestamp.isoformat(),
-                    'duracao_segundos': int(duracao.total_seconds()),
-                    'duracao_formatada': self._formatar_duracao(duracao)
-                }
+            resultado = self._registrar_saida(rfid, datetime.datetime.now(), catraca)
+            self._publicar()
+            self._enfileirar_deltas()
+        self._notificar()
+        _registrar_no_log('SAÍDA', resultado, logging.INFO)
+        return resultado
+    
+    def registrar_grupo(self, batidas: List[Tuple[str, str, Optional[str]]]) -> List[Dict]:
+        """
+        Aplica batidas (tipo, rfid, catraca) na ordem, cada uma com o horário
+        em que é aplicada, sob uma única aquisição do lock
+        
+        Usado pelo escritor da fila de ingestão; o resultado de cada batida é o
+        mesmo de `registrar_entrada`/`registrar_saida`.
+        """
+        with self.lock:
+            resultados = []
+            for tipo, rfid, catraca in batidas:
+                agora = datetime.datetime.now()
+                if tipo == 'ENTRADA':
+                    resultados.append(self._registrar_entrada(rfid, agora, catraca))
+                else:
+                    resultados.append(self._registrar_saida(rfid, agora, catraca))
+            self._publicar()
+            self._enfileirar_deltas()
+        
+        self._notificar()
+        for (tipo, _, _), resultado in zip(batidas, resultados):
+            _registrar_no_log('ENTRADA' if tipo == 'ENTRADA' else 'SAÍDA', resultado, logging.INFO)
+        return resultados
+    
+    def registrar_lote(self, eventos: List[Dict]) -> List[Dict]:
+        """
+        Registra vários eventos de uma vez, com os horários informados pelo leitor
+        
+        Cada evento é {"tipo": "ENTRADA"|"SAIDA", "rfid": "...", "timestamp": ...},
+        com timestamp em ISO 8601 ou epoch (ausente = agora) e, opcionalmente,
+        "catraca" com a identificação do leitor. Os eventos são
+        aplicados em ordem cronológica sob uma única aquisição do lock, e
+        eventos atrasados entram na posição certa do histórico e nas
+        estatísticas do próprio dia (o pico do dia é refeito com os eventos
+        dele, não com a lotação de agora). Retorna um resultado por evento,
+        na mesma ordem da entrada.
+        """
+        agora = datetime.datetime.now()
+        resultados: List[Optional[Dict]] = [None] * len(eventos)
+        validos = []
+        
+        for indice, evento in enumerate(eventos):
+            try:
+                tipo, rfid, timestamp, catraca = self._interpretar_evento(evento, agora)
+            except ValueError as e:
+                rfid = evento.get('rfid') if isinstance(evento, dict) else None
+                resultados[indice] = {'sucesso': False, 'mensagem': str(e), 'rfid': rfid}
+            else:
+                validos.append((timestamp, indice, tipo, rfid, catraca))
+        
+        validos.sort(key=lambda evento: (evento[0], evento[1]))
+        
+        with self.lock:
+            for timestamp, indice, tipo, rfid, catraca in validos:
+                if tipo == 'ENTRADA':
+                    resultados[indice] = self._registrar_entrada(rfid, timestamp, catraca)
+                else:
+                    resultados[indice] = self._registrar_saida(rfid, timestamp, catraca)
+            self._publicar()
+            self._enfileirar_deltas()
+        
+        self._notificar()
+        if logger.isEnabledFor(logging.DEBUG):
+            for _, indice, tipo, _, _ in validos:
+                _registrar_no_log('ENTRADA' if tipo == 'ENTRADA' else 'SAÍDA',
+                                  resultados[indice], logging.DEBUG)
+        aceitos = sum(1 for resultado in resultados if resultado['sucesso'])
+        logger.info("Lote registrado: %d de %d eventos aceitos", aceitos, len(eventos))
+        return resultados
+    
+    def _interpretar_evento(self, evento, agora: datetime.datetime):
+        """Valida um evento do lote e converte seu timestamp (levanta ValueError)"""
+        if not isinstance(evento, dict):
+            raise ValueError('Evento inválido')
+        
+        tipo = str(evento.get('tipo', '')).upper()
+        rfid = evento.get('rfid')
+        if not rfid or not isinstance(rfid, str) or tipo not in ('ENTRADA', 'SAIDA'):
+            raise ValueError("Campos 'tipo' ou 'rfid' inválidos")
+        
+        bruto = evento.get('timestamp')
+        timestamp = agora if bruto is None else converter_timestamp(bruto)
+        
+        if timestamp - agora > self.tolerancia_futuro:
+            raise ValueError('Timestamp no futuro')
+        
+        catraca = evento.get('catraca')
+        return tipo, rfid, timestamp, str(catraca) if catraca is not None else None
+    
+    def _registrar_entrada(self, rfid: str, timestamp: datetime.datetime,
+                           catraca: Optional[str] = None) -> Dict:
+        """Valida, aplica e anota uma entrada (chamar com o lock)"""
+        if rfid in self.pessoas_dentro:
+            return _com_catraca({
+                'sucesso': False,
+                'mensagem': 'Pessoa já está dentro do restaurante',
+                'rfid': rfid
+            }, catraca)
+        
+        pessoas_atual = self._aplicar_entrada(rfid, timestamp)
+        self._anotar_no_diario('E', timestamp, rfid)
+        self._preparar_delta('entrada', **_com_catraca(
+            {'rfid': rfid, 'timestamp': timestamp.isoformat()}, catraca))
+        
+        return _com_catraca({
+            'sucesso': True,
+            'mensagem': 'Entrada registrada com sucesso',
+            'rfid': rfid,
+            'timestamp': timestamp.isoformat(),
+            'pessoas_dentro': pessoas_atual
+        }, catraca)
+    
+    def _registrar_saida(self, rfid: str, timestamp: datetime.datetime,
+                         catraca: Optional[str] = None) -> Dict:
+        """Valida, aplica e anota uma saída (chamar com o lock)"""
+        if rfid not in self.pessoas_dentro:
+            return _com_catraca({
+                'sucesso': False,
+                'mensagem': 'Pessoa não está dentro do restaurante',
+                'rfid': rfid
+            }, catraca)
+        
+        entrada = self.horarios_entrada.get(rfid)
+        if entrada and timestamp < entrada:
+            return _com_catraca({
+                'sucesso': False,
+                'mensagem': 'Saída anterior à entrada registrada',
+                'rfid': rfid
+            }, catraca)
+        
+        tempo_permanencia = self._aplicar_saida(rfid, timestamp)
+        self._anotar_no_diario('S', timestamp, rfid)
+        self._preparar_delta('saida', **_com_catraca(
+            {'rfid': rfid, 'timestamp': timestamp.isoformat(),
+             'tempo_permanencia': tempo_permanencia}, catraca))
+        
+        pessoas_atual = len(self.pessoas_dentro)
+        
+        return _com_catraca({
+            'sucesso': True,
+            'mensagem': 'Saída registrada com sucesso',
+            'rfid': rfid,
+            'timestamp': timestamp.isoformat(),
+            'pessoas_dentro': pessoas_atual,
+            'tempo_permanencia': tempo_permanencia
+        }, catraca)
+    
+    def _aplicar_entrada(self, rfid: str, timestamp: datetime.datetime) -> int:
+        """Aplica uma entrada já validada ao estado (chamar com o lock)"""
+        self.versao += 1
+        self.pessoas_dentro.add(rfid)
+        self.historico.anexar(rfid, timestamp, 'entrada')
+        
+        self.horarios_entrada[rfid] = timestamp
+        self.cartoes[rfid] = self._cartao(rfid)._replace(entrada=timestamp)
+        self._alterado.add('dentro')
+        
+        data = timestamp.date().isoformat()
+        stats = self._alterar_dia(data)
+        stats['total_entradas'] += 1
+        
+        pessoas_atual = len(self.pessoas_dentro)
+        if self._atrasado(timestamp):
+            self._picos_pendentes.add(data)
+        elif pessoas_atual > stats['pico_pessoas']:
+            stats['pico_pessoas'] = pessoas_atual
+            stats['horarios_pico'] = [timestamp.strftime('%H:%M:%S')]
+        elif pessoas_atual == stats['pico_pessoas']:
+            stats['horarios_pico'].append(timestamp.strftime('%H:%M:%S'))
+        
+        return pessoas_atual
+    
+    def _aplicar_saida(self, rfid: str, timestamp: datetime.datetime) -> Optional[Dict]:
+        """Aplica uma saída já validada ao estado (chamar com o lock)"""
+        self.versao += 1
+        self.pessoas_dentro.remove(rfid)
+        self.historico.anexar(rfid, timestamp, 'saida')
+        
+        tempo_permanencia = None
+        cartao = self.cartoes.get(rfid)
+        visitas_rfid = cartao.visitas if cartao else ()
+        if rfid in self.horarios_entrada:
+            entrada = self.horarios_entrada[rfid]
+            duracao = timestamp - entrada
+            tempo_permanencia = {
+                'rfid': rfid,
+                'entrada': entrada.isoformat(),
+                'saida': timestamp.isoformat(),
+                'duracao_segundos': int(duracao.total_seconds()),
+                'duracao_formatada': self._formatar_duracao(duracao)
+            }
+            # Em ordem de saída; eventos atrasados (lote) entram na posição certa,
+            # numa cópia da lista, já que os leitores podem estar percorrendo a publicada
+            if self.tempos_permanencia and tempo_permanencia['saida'] < self.tempos_permanencia[-1]['saida']:
+                self.tempos_permanencia = list(self.tempos_permanencia)
+                bisect.insort(self.tempos_permanencia, tempo_permanencia, key=_chave_saida)
+            else:
                 self.tempos_permanencia.append(tempo_permanencia)
-                del self.horarios_entrada[rfid]
-                
-                print(f"Tempo de permanência: {tempo_permanencia['duracao_formatada']}")
+            if visitas_rfid and tempo_permanencia['saida'] < visitas_rfid[-1]['saida']:
+                visitas = list(visitas_rfid)
+                bisect.insort(visitas, tempo_permanencia, key=_chave_saida)
+                visitas_rfid = tuple(visitas)
+            else:
+                visitas_rfid += (tempo_permanencia,)
+            del self.horarios_entrada[rfid]
             
-            data_hoje = timestamp.date().isoformat()
-            stats = self.estatisticas_diarias[data_hoje]
-            stats['total_saidas'] += 1
+            # Agregados já publicados são trocados por cópias, nunca alterados
+            segundos = tempo_permanencia['duracao_segundos']
+            data = timestamp.date().isoformat()
+            publicado = self._estado
+            if publicado and self.estatisticas_tempo is publicado.estatisticas_tempo:
+                self.estatisticas_tempo = self.estatisticas_tempo.copiar()
+            self.estatisticas_tempo.adicionar(segundos)
+            diaria = self.estatisticas_tempo_diarias.get(data)
+            if diaria is None:
+                diaria = EstatisticasDuracao()
+            elif publicado and diaria is publicado.estatisticas_tempo_diarias.get(data):
+                diaria = diaria.copiar()
+            diaria.adicionar(segundos)
+            self.estatisticas_tempo_diarias[data] = diaria
+            self._alterado.add('tempos')
+        
+        self.cartoes[rfid] = Cartao(visitas_rfid, None, cartao.arquivadas if cartao else 0)
+        self._alterado.add('dentro')
+        
+        data = timestamp.date().isoformat()
+        stats = self._alterar_dia(data)
+        stats['total_saidas'] += 1
+        if self._atrasado(timestamp):
+            self._picos_pendentes.add(data)  # a lotação do resto do dia muda
+        
+        return tempo_permanencia
+    
+    def _atrasado(self, timestamp: datetime.datetime) -> bool:
+        """O evento é anterior ao mais novo já registrado? (chamar com o lock)"""
+        if self._ultimo_horario is not None and timestamp < self._ultimo_horario:
+            return True
+        self._ultimo_horario = timestamp
+        return False
+    
+    def _recalcular_picos(self):
+        """
+        Refaz o pico dos dias que receberam eventos atrasados (chamar com o lock)
+        
+        A lotação de um dia sai dos eventos do próprio dia no histórico; quem
+        entrou antes da meia-noite só aparece saindo, então o menor saldo
+        negativo é quem já estava dentro. Se parte do dia já saiu do
+        histórico (buffer sem diretório), o pico registrado fica como está.
+        """
+        historico = self.historico
+        for data in sorted(self._picos_pendentes):
+            meia_noite = datetime.datetime.fromisoformat(data)
+            fim_dia = meia_noite + datetime.timedelta(days=1)
+            eventos = historico.intervalo(historico.buscar_seq(meia_noite.timestamp()),
+                                          historico.buscar_seq(fim_dia.timestamp()))
+            stats = self.estatisticas_diarias[data]
+            if len(eventos) < stats['total_entradas'] + stats['total_saidas']:
+                continue
             
-            pessoas_atual = len(self.pessoas_dentro)
-            print(f"SAÍDA registrada: {rfid} | Pessoas dentro: {pessoas_atual}")
+            eventos.sort(key=lambda evento: evento[1])
+            saldos = list(itertools.accumulate(1 if tipo == 'entrada' else -1 for _, _, tipo in eventos))
+            ja_dentro = -min(0, min(saldos, default=0))
+            pico, horarios = 0, []
+            for (_, epoch, tipo), saldo in zip(eventos, saldos):
+                if tipo != 'entrada':
+                    continue
+                pessoas = saldo + ja_dentro
+                if pessoas > pico:
+                    pico, horarios = pessoas, []
+                if pessoas == pico:
+                    horarios.append(datetime.datetime.fromtimestamp(epoch).strftime('%H:%M:%S'))
             
-            return {
-                'sucesso': True,
-                'mensagem': 'Saída registrada com sucesso',
-                'rfid': rfid,
-                'timestamp': timestamp.isoformat(),
-                'pessoas_dentro': pessoas_atual,
-                'tempo_permanencia': tempo_permanencia
-            }
+            stats = self._alterar_dia(data)
+            stats['pico_pessoas'] = pico
+            stats['horarios_pico'] = horarios
+        self._picos_pendentes = set()
+    
+    def _alterar_dia(self, data: str) -> Dict:
+        """Estatísticas do dia que podem ser alteradas: copia as já publicadas (chamar com o lock)"""
+        atual = self.estatisticas_diarias.get(data)
+        if atual is None:
+            stats = {'total_entradas': 0, 'total_saidas': 0, 'pico_pessoas': 0, 'horarios_pico': []}
+        elif self._estado and atual is self._estado.estatisticas_diarias.get(data):
+            stats = dict(atual, horarios_pico=list(atual['horarios_pico']))
+        else:
+            return atual
+        self.estatisticas_diarias[data] = stats
+        self._alterado.add('dias')
+        return stats
+    
+    def _publicar(self):
+        """
+        Publica o estado para as consultas (chamar com o lock, ao fim de cada alteração)
+        
+        Só o que mudou é copiado: quem está dentro (O(pessoas dentro)) e os
+        índices por dia (O(dias)). Um lote inteiro publica uma vez só, e os
+        picos dos dias com eventos atrasados são refeitos uma vez antes.
+        """
+        if self._picos_pendentes:
+            self._recalcular_picos()
+        
+        anterior = self._estado
+        alterado = self._alterado
+        self._estado = EstadoLeitura(
+            versao=self.versao,
+            dentro=dict(self.horarios_entrada) if 'dentro' in alterado else anterior.dentro,
+            filas=self.filas,
+            pessoas_na_fila=self.pessoas_na_fila,
+            ultima_atualizacao_fila=self.ultima_atualizacao_fila,
+            estatisticas_diarias=dict(self.estatisticas_diarias) if 'dias' in alterado
+            else anterior.estatisticas_diarias,
+            tempos=self.tempos_permanencia,
+            total_tempos=len(self.tempos_permanencia),
+            estatisticas_tempo=self.estatisticas_tempo,
+            estatisticas_tempo_diarias=dict(self.estatisticas_tempo_diarias) if 'tempos' in alterado
+            else anterior.estatisticas_tempo_diarias,
+            tempos_arquivados=self.tempos_arquivados
+        )
+        self._alterado = set()
+        
+        # Virada do dia: os dias que saíram da janela em memória vão para o acervo
+        if self.acervo and not self._arquivamento_em_andamento and self._dia_arquivamento != datetime.date.today():
+            self._dia_arquivamento = datetime.date.today()
+            self._arquivamento_em_andamento = True
+            threading.Thread(target=self.arquivar_dias_antigos, daemon=True).start()
+    
+    @property
+    def estado(self) -> EstadoLeitura:
+        """Último estado publicado (leitura sem lock)"""
+        return self._estado
     
     def obter_status_atual(self) -> Dict:
-        with self.lock:
-            data_hoje = datetime.date.today().isoformat()
-            stats = self.estatisticas_diarias.get(data_hoje, {
-                'total_entradas': 0,
-                'total_saidas': 0,
-                'pico_pessoas': 0,
-                'horarios_pico': []
-            })
-            
-            return {
-                'pessoas_dentro': len(self.pessoas_dentro),
-                'rfids_dentro': list(self.pessoas_dentro),
-                'pessoas_na_fila': self.pessoas_na_fila,
-                'entradas_hoje': stats['total_entradas'],
-                'saidas_hoje': stats['total_saidas'],
-                'ultima_atualizacao_fila': self.ultima_atualizacao_fila.isoformat()
-                if self.ultima_atualizacao_fila else None,
-                'timestamp': datetime.datetime.now().isoformat()
-            }
+        return self._status_atual(self._estado)
+    
+    def _status_atual(self, estado: EstadoLeitura) -> Dict:
+        data_hoje = datetime.date.today().isoformat()
+        stats = estado.estatisticas_diarias.get(data_hoje, {
+            'total_entradas': 0,
+            'total_saidas': 0,
+            'pico_pessoas': 0,
+            'horarios_pico': []
+        })
+        
+        return {
+            'pessoas_dentro': len(estado.dentro),
+            'rfids_dentro': list(estado.dentro),
+            'pessoas_na_fila': estado.pessoas_na_fila,
+            'filas': dict(estado.filas),
+            'entradas_hoje': stats['total_entradas'],
+            'saidas_hoje': stats['total_saidas'],
+            'ultima_atualizacao_fila': estado.ultima_atualizacao_fila.isoformat()
+            if estado.ultima_atualizacao_fila else None,
+            'timestamp': datetime.datetime.now().isoformat()
+        }
+    
+    def obter_snapshot(self, limite_tempos: int = 20) -> Dict:
+        """
+        Retorna numa única consulta tudo o que o dashboard exibe
+        
+        Inclui o status, as visitas mais recentes e quem está dentro com o
+        horário de entrada, junto com a versão do estado (`versao`), que
+        muda a cada entrada, saída ou atualização da fila.
+        """
+        estado = self._estado
+        total = estado.total_tempos
+        tempos = estado.tempos[max(0, total - limite_tempos):total] if limite_tempos > 0 else []
+        entradas = list(estado.dentro.items())
+        
+        return {
+            'versao': estado.versao,
+            'status': self._status_atual(estado),
+            'tempos_recentes': tempos,
+            'pessoas_dentro': [{'rfid': rfid, 'entrada': entrada.isoformat()}
+                               for rfid, entrada in entradas]
+        }
     
     def obter_estatisticas(self, data: Optional[str] = None) -> Dict:
         if data is None:
             data = datetime.date.today().isoformat()
         
-        with self.lock:
-            stats = self.estatisticas_diarias.get(data, {
-                'total_entradas': 0,
-                'total_saidas': 0,
-                'pico_pessoas': 0,
-                'horarios_pico': []
-            })
-            
-            return {
-                'data': data,
-                'estatisticas': stats,
-                'pessoas_dentro_agora': len(self.pessoas_dentro),
-                'pessoas_na_fila_agora': self.pessoas_na_fila
-            }
+        estado = self._estado
+        stats = estado.estatisticas_diarias.get(data, {
+            'total_entradas': 0,
+            'total_saidas': 0,
+            'pico_pessoas': 0,
+            'horarios_pico': []
+        })
+        
+        return {
+            'data': data,
+            'estatisticas': stats,
+            'pessoas_dentro_agora': len(estado.dentro),
+            'pessoas_na_fila_agora': estado.pessoas_na_fila
+        }
     
     def obter_historico(self, limite: int = 100) -> List[Dict]:
-        with self.lock:
-            return [reg.to_dict() for reg in self.historico[-limite:]]
+        # O histórico tem leitura própria sem lock (ver HistoricoEventos)
+        eventos = self.historico.ultimos(limite)
+        
+        fromtimestamp = datetime.datetime.fromtimestamp
+        return [Registro(rfid, fromtimestamp(epoch), tipo).to_dict()
+                for rfid, epoch, tipo in eventos]
     
-    def atualizar_fila(self, qtd: int):
+    def consultar_historico(self, inicio: Optional[datetime.datetime] = None,
+                            fim: Optional[datetime.datetime] = None,
+                            cursor: Optional[int] = None,
+                            limite: int = 100) -> Dict:
+        """
+        Retorna eventos com timestamp em [inicio, fim), em ordem cronológica
+        
+        As pontas do intervalo são localizadas por busca binária no histórico.
+        Se houver mais eventos que `limite`, `proximo_cursor` indica de onde
+        continuar (repassado em `cursor` na próxima chamada).
+        """
+        primeiro = self.historico.buscar_seq(inicio.timestamp()) if inicio else self.historico.primeiro_seq()
+        if cursor is not None:
+            primeiro = max(primeiro, cursor)
+        ultimo = self.historico.buscar_seq(fim.timestamp()) if fim else self.historico.total
+        fim_pagina = min(ultimo, primeiro + max(0, limite))
+        eventos = self.historico.intervalo(primeiro, fim_pagina)
+        
+        fromtimestamp = datetime.datetime.fromtimestamp
+        return {
+            'eventos': [Registro(rfid, fromtimestamp(epoch), tipo).to_dict()
+                        for rfid, epoch, tipo in eventos],
+            'proximo_cursor': fim_pagina if fim_pagina < ultimo else None
+        }
+    
+    def atualizar_fila(self, qtd: int, fila: str = FILA_PADRAO):
+        """Atualiza a contagem de uma linha de atendimento; `pessoas_na_fila` é a soma"""
         with self.lock:
-            self.pessoas_na_fila = max(0, int(qtd))
-            self.ultima_atualizacao_fila = datetime.datetime.now()
+            timestamp = datetime.datetime.now()
+            anterior = self.filas.get(fila)
+            self._aplicar_fila(qtd, timestamp, fila)
+            self._anotar_no_diario('F', timestamp, f"{fila}={self.filas[fila]}")
+            if self.filas[fila] != anterior:
+                self._preparar_delta('fila', fila=fila, filas=dict(self.filas),
+                                     timestamp=timestamp.isoformat())
+            self._publicar()
+            self._enfileirar_deltas()
+        self._notificar()
+    
+    def _aplicar_fila(self, qtd: int, timestamp: datetime.datetime, fila: str = FILA_PADRAO):
+        self.versao += 1
+        self.filas = dict(self.filas)  # a publicada continua intacta
+        self.filas[fila] = max(0, int(qtd))
+        self.pessoas_na_fila = sum(self.filas.values())
+        self.ultima_atualizacao_fila = timestamp
     
     def _formatar_duracao(self, duracao: datetime.timedelta) -> str:
         segundos_totais = int(duracao.total_seconds())
@@ -180,57 +658,600 @@ class GerenciadorRestaurante:
         else:
             return f"{segundos}s"
     
-    def obter_tempos_permanencia(self, rfid: Optional[str] = None) -> List[Dict]:
+    def obter_tempos_permanencia(self, rfid: Optional[str] = None,
+                                 limite: Optional[int] = None,
+                                 offset: int = 0) -> List[Dict]:
         """
-        Retorna histórico de tempos de permanência
+        Retorna histórico de tempos de permanência (do mais antigo ao mais novo)
         
         Args:
             rfid: Se especificado, retorna apenas os tempos desse RFID
+            limite: Quantidade máxima de visitas retornadas (None = todas)
+            offset: Quantas das visitas mais recentes pular (paginação)
         """
-        with self.lock:
-            if rfid:
-                return [t for t in self.tempos_permanencia if t['rfid'] == rfid]
-            return self.tempos_permanencia.copy()
+        visitas, total, arquivadas = self._visitas(rfid)
+        fim = max(0, arquivadas + total - max(0, offset))
+        inicio = 0 if limite is None else max(0, fim - max(0, limite))
+        return self._fatia_visitas(rfid, visitas, arquivadas, inicio, fim)
     
-    def obter_estatisticas_tempo(self) -> Dict:
-        """Retorna estatísticas sobre tempos de permanência"""
-        with self.lock:
-            if not self.tempos_permanencia:
-                return {
-                    'total_visitas': 0,
-                    'tempo_medio_segundos': 0,
-                    'tempo_medio_formatado': '0s',
-                    'tempo_minimo': None,
-                    'tempo_maximo': None
-                }
-            
-            duracoes = [t['duracao_segundos'] for t in self.tempos_permanencia]
-            tempo_medio = sum(duracoes) / len(duracoes)
-            
-            return {
-                'total_visitas': len(self.tempos_permanencia),
-                'tempo_medio_segundos': int(tempo_medio),
-                'tempo_medio_formatado': self._formatar_duracao(datetime.timedelta(seconds=tempo_medio)),
-                'tempo_minimo_segundos': min(duracoes),
-                'tempo_minimo_formatado': self._formatar_duracao(datetime.timedelta(seconds=min(duracoes))),
-                'tempo_maximo_segundos': max(duracoes),
-                'tempo_maximo_formatado': self._formatar_duracao(datetime.timedelta(seconds=max(duracoes)))
+    def _cartao(self, rfid: str) -> Cartao:
+        """Registro publicado do cartão; sem visitas em memória, só a contagem do acervo"""
+        cartao = self.cartoes.get(rfid)
+        if cartao is None:
+            return Cartao((), None, self.acervo.contar_visitas(rfid) if self.acervo else 0)
+        return cartao
+    
+    def _visitas(self, rfid: Optional[str]):
+        """Visitas publicadas em memória (de um cartão ou todas), quantas valem e quantas estão no acervo"""
+        if rfid:
+            cartao = self._cartao(rfid)
+            return cartao.visitas, len(cartao.visitas), cartao.arquivadas
+        estado = self._estado
+        return estado.tempos, estado.total_tempos, estado.tempos_arquivados
+    
+    def _fatia_visitas(self, rfid: Optional[str], visitas, arquivadas: int,
+                       inicio: int, fim: int) -> List[Dict]:
+        """Visitas nas posições [inicio, fim): as primeiras `arquivadas` vêm do acervo"""
+        pagina = []
+        if inicio < min(fim, arquivadas):
+            pagina = [self._visita_arquivada(*visita)
+                      for visita in self.acervo.visitas(inicio, min(fim, arquivadas), rfid)]
+        pagina.extend(visitas[max(0, inicio - arquivadas):max(0, fim - arquivadas)])
+        return pagina
+    
+    def _visita_arquivada(self, rfid: str, entrada: float, saida: float, duracao: int) -> Dict:
+        """Visita do acervo no mesmo formato de `tempos_permanencia`"""
+        fromtimestamp = datetime.datetime.fromtimestamp
+        return {
+            'rfid': rfid,
+            'entrada': fromtimestamp(entrada).isoformat(),
+            'saida': fromtimestamp(saida).isoformat(),
+            'duracao_segundos': duracao,
+            'duracao_formatada': self._formatar_duracao(datetime.timedelta(seconds=duracao))
+        }
+    
+    def _posicao_saida(self, rfid: Optional[str], visitas, total: int, arquivadas: int,
+                       momento: datetime.datetime) -> int:
+        """Posição da primeira visita com saída >= `momento` (no acervo só se não estiver em memória)"""
+        posicao = bisect.bisect_left(visitas, momento.isoformat(), 0, total, key=_chave_saida)
+        if posicao or not arquivadas:
+            return arquivadas + posicao
+        return min(self.acervo.buscar_saida(momento.timestamp(), rfid), arquivadas)
+    
+    def consultar_tempos_permanencia(self, rfid: Optional[str] = None,
+                                     inicio: Optional[datetime.datetime] = None,
+                                     fim: Optional[datetime.datetime] = None,
+                                     cursor: Optional[int] = None,
+                                     limite: int = 100) -> Dict:
+        """
+        Retorna visitas com saída em [inicio, fim), em ordem cronológica
+        
+        As visitas já ficam ordenadas pela saída, então as pontas do intervalo
+        são achadas por busca binária (no acervo, só nos dias das pontas).
+        Paginação igual a `consultar_historico`.
+        """
+        visitas, total, arquivadas = self._visitas(rfid)
+        primeiro = self._posicao_saida(rfid, visitas, total, arquivadas, inicio) if inicio else 0
+        if cursor is not None:
+            primeiro = max(primeiro, cursor)
+        ultimo = self._posicao_saida(rfid, visitas, total, arquivadas, fim) if fim else arquivadas + total
+        fim_pagina = min(ultimo, primeiro + max(0, limite))
+        pagina = self._fatia_visitas(rfid, visitas, arquivadas, primeiro, fim_pagina)
+        
+        return {
+            'tempos': pagina,
+            'proximo_cursor': fim_pagina if fim_pagina < ultimo else None
+        }
+    
+    def contar_tempos_permanencia(self, rfid: Optional[str] = None) -> int:
+        _, total, arquivadas = self._visitas(rfid)
+        return arquivadas + total
+    
+    def obter_historico_rfid(self, rfid: str, limite: int = 100, offset: int = 0) -> Dict:
+        """
+        Retorna as entradas e saídas de um cartão, paginadas a partir das mais recentes
+        
+        Os eventos são montados a partir das visitas do próprio cartão (cada
+        visita é uma entrada e uma saída), então o custo não depende do
+        tamanho do histórico geral.
+        """
+        # Visitas e entrada em aberto vêm do mesmo registro, trocado de uma vez pelo escritor
+        visitas, entrada_aberta, arquivadas = self._cartao(rfid)
+        quantidade = arquivadas + len(visitas)
+        
+        total = 2 * quantidade + (1 if entrada_aberta else 0)
+        fim = max(0, total - max(0, offset))
+        inicio = max(0, fim - max(0, limite))
+        primeira = inicio // 2
+        pagina = self._fatia_visitas(rfid, visitas, arquivadas, primeira, min(quantidade, (fim + 1) // 2))
+        
+        eventos = []
+        for k in range(inicio, fim):
+            visita, saida = divmod(k, 2)
+            if visita == quantidade:
+                eventos.append({'rfid': rfid, 'timestamp': entrada_aberta.isoformat(), 'tipo': 'entrada'})
+            elif saida:
+                eventos.append({'rfid': rfid, 'timestamp': pagina[visita - primeira]['saida'], 'tipo': 'saida'})
+            else:
+                eventos.append({'rfid': rfid, 'timestamp': pagina[visita - primeira]['entrada'], 'tipo': 'entrada'})
+        
+        return {
+            'rfid': rfid,
+            'dentro': entrada_aberta is not None,
+            'total': total,
+            'offset': offset,
+            'limite': limite,
+            'eventos': eventos
+        }
+    
+    def obter_estatisticas_tempo(self, data: Optional[str] = None) -> Dict:
+        """
+        Retorna estatísticas sobre tempos de permanência
+        
+        Args:
+            data: Se especificada (YYYY-MM-DD), considera apenas as saídas desse dia
+        """
+        return self._estatisticas_tempo(self._estado, data)
+    
+    def _estatisticas_tempo(self, estado: EstadoLeitura, data: Optional[str] = None) -> Dict:
+        if data is None:
+            agregados = estado.estatisticas_tempo
+        else:
+            agregados = estado.estatisticas_tempo_diarias.get(data)
+        
+        if not agregados or not agregados.contagem:
+            resumo = None
+        else:
+            resumo = {
+                'total_visitas': agregados.contagem,
+                'medio': agregados.media,
+                'minimo': agregados.minimo,
+                'maximo': agregados.maximo,
+                'p50': agregados.percentil(50),
+                'p90': agregados.percentil(90),
+                'p99': agregados.percentil(99)
             }
+        
+        if resumo is None:
+            resultado = {
+                'total_visitas': 0,
+                'tempo_medio_segundos': 0,
+                'tempo_medio_formatado': '0s',
+                'tempo_minimo': None,
+                'tempo_maximo': None
+            }
+        else:
+            formatar = lambda segundos: self._formatar_duracao(datetime.timedelta(seconds=segundos))
+            resultado = {
+                'total_visitas': resumo['total_visitas'],
+                'tempo_medio_segundos': int(resumo['medio']),
+                'tempo_medio_formatado': formatar(resumo['medio']),
+                'tempo_minimo_segundos': resumo['minimo'],
+                'tempo_minimo_formatado': formatar(resumo['minimo']),
+                'tempo_maximo_segundos': resumo['maximo'],
+                'tempo_maximo_formatado': formatar(resumo['maximo'])
+            }
+            for p in ('p50', 'p90', 'p99'):
+                resultado[f'tempo_{p}_segundos'] = resumo[p]
+                resultado[f'tempo_{p}_formatado'] = formatar(resumo[p])
+        
+        if data is not None:
+            resultado['data'] = data
+        return resultado
+    
+    def gerar_exportacao(self) -> Iterator[str]:
+        """
+        Exportação completa em NDJSON, gerada aos poucos (ver exportacao.py)
+        
+        Sob o lock só se guarda o estado publicado e até onde vai o histórico,
+        então a exportação é um corte consistente e as batidas seguem enquanto
+        as linhas são geradas. Cada linha tem "registro": "exportacao" (a
+        primeira, com o estado atual), "evento", "permanencia",
+        "estatisticas_dia" ou "estatisticas_tempo" (a última).
+        """
+        with self.lock:
+            estado = self._estado
+            primeiro = self.historico.primeiro_seq()
+            ate = self.historico.total
+        
+        dumps = json.dumps
+        yield dumps({
+            'registro': 'exportacao',
+            'exportado_em': datetime.datetime.now().isoformat(),
+            'versao': estado.versao,
+            'pessoas_dentro': list(estado.dentro),
+            'pessoas_na_fila': estado.pessoas_na_fila,
+            'filas': estado.filas,
+            'eventos': ate - primeiro,  # os que ainda podem ser lidos (ver CAPACIDADE_HISTORICO)
+            'total_permanencias': estado.tempos_arquivados + estado.total_tempos
+        }, ensure_ascii=False) + "\n"
+        for registro in self.historico.registros(ate):
+            yield dumps({'registro': 'evento', **registro.to_dict()}, ensure_ascii=False) + "\n"
+        for tempo in itertools.chain(self._visitas_arquivadas(estado),
+                                     itertools.islice(estado.tempos, estado.total_tempos)):
+            yield dumps({'registro': 'permanencia', **tempo}, ensure_ascii=False) + "\n"
+        for data in sorted(estado.estatisticas_diarias):
+            yield dumps({'registro': 'estatisticas_dia', 'data': data, **estado.estatisticas_diarias[data]},
+                        ensure_ascii=False) + "\n"
+        yield dumps({'registro': 'estatisticas_tempo', **self._estatisticas_tempo(estado)},
+                    ensure_ascii=False) + "\n"
     
     def exportar_dados(self, arquivo: str = 'dados_ru.json') -> str:
-        """Exporta todos os dados para JSON"""
+        """Exporta todos os dados para JSON (a partir do estado publicado, sem o lock)"""
+        estado = self._estado
+        dados = {
+            'pessoas_dentro': list(estado.dentro),
+            'historico': [reg.to_dict() for reg in self.historico.registros()],
+            'estatisticas': estado.estatisticas_diarias,
+            'pessoas_na_fila': estado.pessoas_na_fila,
+            'filas': estado.filas,
+            'tempos_permanencia': list(self._visitas_arquivadas(estado)) + estado.tempos[:estado.total_tempos],  # ← NOVO
+            'estatisticas_tempo': self.obter_estatisticas_tempo(),  # ← NOVO
+            'exportado_em': datetime.datetime.now().isoformat()
+        }
+        
+        with open(arquivo, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, indent=2, ensure_ascii=False)
+        
+        return f"Dados exportados para {arquivo}"
+    
+    def _visitas_arquivadas(self, estado: EstadoLeitura) -> Iterator[Dict]:
+        """Visitas do acervo que o estado publicado cobre, um dia por vez"""
+        if not estado.tempos_arquivados:
+            return
+        for visita in self.acervo.percorrer_visitas(estado.tempos_arquivados):
+            yield self._visita_arquivada(*visita)
+    
+    # ---------- Notificações ----------
+    
+    def adicionar_ouvinte(self, ouvinte: Callable[[Dict], None]):
+        """Registra uma função chamada com um delta a cada entrada, saída ou mudança na fila"""
+        self.ouvintes.append(ouvinte)
+    
+    def _preparar_delta(self, evento: str, **dados):
+        """Monta o delta com os contadores atuais (chamar com o lock)"""
+        if not self.ouvintes:
+            return
+        
+        stats = self.estatisticas_diarias.get(datetime.date.today().isoformat())
+        delta = {'evento': evento, 'versao': self.versao}
+        delta.update(dados)
+        delta.update({
+            'pessoas_dentro': len(self.pessoas_dentro),
+            'pessoas_na_fila': self.pessoas_na_fila,
+            'entradas_hoje': stats['total_entradas'] if stats else 0,
+            'saidas_hoje': stats['total_saidas'] if stats else 0
+        })
+        self._deltas_pendentes.append(delta)
+    
+    def _enfileirar_deltas(self):
+        """Passa os deltas acumulados para a fila de entrega (chamar com o lock)"""
+        if not self._deltas_pendentes:
+            return
+        self._fila_notificacao.extend(self._deltas_pendentes)
+        self._deltas_pendentes = []
+    
+    def _notificar(self):
+        """
+        Entrega aos ouvintes os deltas da fila, já fora do lock
+        
+        Só um escritor entrega por vez, então os ouvintes recebem os deltas na
+        ordem das versões mesmo com várias catracas batendo juntas; quem
+        encontra uma entrega em andamento deixa os seus deltas com ela. A fila
+        é conferida de novo depois de soltar a vez, para nenhum delta ficar
+        parado nela.
+        """
+        fila = self._fila_notificacao
+        while fila and self._lock_notificacao.acquire(blocking=False):
+            try:
+                while fila:
+                    delta = fila.popleft()
+                    for ouvinte in self.ouvintes:
+                        try:
+                            ouvinte(delta)
+                        except Exception:
+                            logger.exception("❌ Erro ao notificar ouvinte")
+            finally:
+                self._lock_notificacao.release()
+    
+    # ---------- Acervo ----------
+    
+    def arquivar_dias_antigos(self) -> int:
+        """
+        Move para o acervo os dias anteriores aos últimos `dias_em_memoria` e retorna quantos
+        
+        Um dia por vez: a partição (visitas e eventos do dia) é gravada a
+        partir do estado publicado, sem o lock, e o lock só é tomado para
+        tirar da memória as visitas gravadas e publicar. Eventos atrasados de
+        um dia já arquivado são acrescentados à partição dele na próxima passada.
+        Roda sozinho na virada do dia (ver `_publicar`).
+        """
+        if not self.acervo:
+            return 0
+        
+        limite = (datetime.date.today() - datetime.timedelta(days=self.dias_em_memoria)).isoformat()
+        dias = 0
+        try:
+            with self._lock_arquivamento:
+                while True:
+                    # O dia mais antigo ainda em memória: das visitas ou dos eventos não arquivados
+                    seq = max(self.acervo.eventos_ate_seq, self.historico.primeiro_seq())
+                    proximo = self.historico.intervalo(seq, seq + 1)
+                    estado = self._estado
+                    candidatos = [datetime.date.fromtimestamp(proximo[0][1]).isoformat()] if proximo else []
+                    if estado.total_tempos:
+                        candidatos.append(estado.tempos[0]['saida'][:10])
+                    if not candidatos or min(candidatos) >= limite:
+                        break
+                    
+                    dia = min(candidatos)
+                    fim_dia = datetime.datetime.fromisoformat(dia) + datetime.timedelta(days=1)
+                    # Histórico tem leitura própria sem lock; eventos novos não são deste dia
+                    ate_seq = max(self.historico.buscar_seq(fim_dia.timestamp()), seq + (1 if proximo else 0))
+                    eventos = self.historico.intervalo(seq, ate_seq)
+                    self._arquivar_dia(dia, fim_dia, eventos, ate_seq)
+                    dias += 1
+        finally:
+            self._arquivamento_em_andamento = False
+        
+        if dias:
+            logger.info("📦 %d dia(s) arquivado(s) em %s; %d visitas em memória",
+                        dias, self.acervo.diretorio, len(self.tempos_permanencia))
+            self.gravar_snapshot()
+        return dias
+    
+    def _arquivar_dia(self, dia: str, fim_dia: datetime.datetime,
+                      eventos: List[Tuple[str, float, str]], ate_seq: int):
+        # Visitas com saída até o fim do dia (inclusive atrasadas de dias já arquivados),
+        # do estado publicado: as partições são gravadas sem segurar o lock
+        estado = self._estado
+        quantidade = bisect.bisect_left(estado.tempos, fim_dia.isoformat(), 0, estado.total_tempos,
+                                        key=_chave_saida)
+        visitas = estado.tempos[:quantidade]
+        
+        por_dia: Dict[str, Tuple[list, list]] = defaultdict(lambda: ([], []))
+        fromtimestamp = datetime.date.fromtimestamp
+        for evento in eventos:
+            por_dia[fromtimestamp(evento[1]).isoformat()][0].append(evento)
+        for visita in visitas:
+            por_dia[visita['saida'][:10]][1].append(visita)
+        # O dia em si por último, já avançando o índice (atrasados de dias anteriores antes)
+        arquivado_ate = fim_dia.date().isoformat()
+        for data in sorted(por_dia):
+            if data == dia:
+                self.acervo.gravar_dia(data, *por_dia[data], arquivado_ate, ate_seq)
+            else:
+                self.acervo.gravar_dia(data, *por_dia[data])
+        if dia not in por_dia:
+            self.acervo.avancar(arquivado_ate, ate_seq)
+        
         with self.lock:
-            dados = {
-                'pessoas_dentro': list(self.pessoas_dentro),
-                'historico': [reg.to_dict() for reg in self.historico],
-                'estatisticas': dict(self.estatisticas_diarias),
-                'pessoas_na_fila': self.pessoas_na_fila,
-                'tempos_permanencia': self.tempos_permanencia,  # ← NOVO
-                'estatisticas_tempo': self.obter_estatisticas_tempo(),  # ← NOVO
-                'exportado_em': datetime.datetime.now().isoformat()
-            }
+            # Saem exatamente as visitas gravadas; uma atrasada que entrou entre elas
+            # enquanto isso continua em memória e vai na próxima passada
+            atual = bisect.bisect_left(self.tempos_permanencia, fim_dia.isoformat(), key=_chave_saida)
+            if atual == quantidade:
+                restantes = self.tempos_permanencia[quantidade:]
+            else:
+                gravadas = {id(visita) for visita in visitas}
+                restantes = [visita for visita in self.tempos_permanencia[:atual] if id(visita) not in gravadas]
+                restantes.extend(self.tempos_permanencia[atual:])
+            # A lista publicada continua intacta para quem a está lendo
+            self.tempos_permanencia = restantes
+            self.tempos_arquivados += quantidade
+            self.arquivado_ate = arquivado_ate
+            for rfid, arquivadas in Counter(visita['rfid'] for visita in visitas).items():
+                cartao = self.cartoes[rfid]
+                if atual == quantidade:
+                    # As visitas de cada cartão também estão em ordem de saída: saem as primeiras
+                    restantes_cartao = cartao.visitas[arquivadas:]
+                else:
+                    restantes_cartao = tuple(visita for visita in cartao.visitas if id(visita) not in gravadas)
+                self.cartoes[rfid] = cartao._replace(visitas=restantes_cartao,
+                                                     arquivadas=cartao.arquivadas + arquivadas)
+            self._publicar()
+    
+    # ---------- Persistência ----------
+    
+    def _anotar_no_diario(self, tipo: str, timestamp: datetime.datetime, valor):
+        """Registra o evento no diário (chamar com o lock; não faz I/O)"""
+        if not self.diario:
+            return
+        self.diario.anexar(tipo, timestamp, valor)
+        
+        if (self.diario.eventos_desde_snapshot >= self.eventos_por_snapshot
+                and not self._snapshot_em_andamento):
+            self._snapshot_em_andamento = True
+            threading.Thread(target=self.gravar_snapshot, daemon=True).start()
+    
+    def gravar_snapshot(self):
+        """
+        Grava um snapshot do estado e descarta o diário que ele cobre
+        
+        Chamadas simultâneas (o automático, o do arquivamento e o do
+        encerramento) gravam uma de cada vez, na ordem das gerações.
+        """
+        if not self.diario:
+            return
+        
+        with self._lock_snapshot:
+            try:
+                # Sob o lock apenas copiamos o estado; a serialização é feita fora
+                with self.lock:
+                    estado = {
+                        'historico': self.historico.exportar_estado(),
+                        'pessoas_dentro': list(self.pessoas_dentro),
+                        'horarios_entrada': {rfid: ts.timestamp()
+                                             for rfid, ts in self.horarios_entrada.items()},
+                        'estatisticas_diarias': {data: dict(stats, horarios_pico=list(stats['horarios_pico']))
+                                                 for data, stats in self.estatisticas_diarias.items()},
+                        'tempos_permanencia': list(self.tempos_permanencia),
+                        'estatisticas_tempo': self.estatisticas_tempo.exportar_estado(),
+                        'estatisticas_tempo_diarias': {data: agregados.exportar_estado()
+                                                       for data, agregados in self.estatisticas_tempo_diarias.items()},
+                        'pessoas_na_fila': self.pessoas_na_fila,
+                        'filas': dict(self.filas),
+                        'arquivado_ate': self.arquivado_ate,
+                        'ultima_atualizacao_fila': self.ultima_atualizacao_fila.timestamp()
+                        if self.ultima_atualizacao_fila else None
+                    }
+                    geracao = self.diario.rotacionar()
+                
+                # Eventos que já saíram do buffer precisam estar em disco antes do snapshot
+                self.historico.descarregar(sincronizar=True)
+                self.diario.gravar_snapshot(estado, geracao)
+            except Exception:
+                logger.exception("❌ Erro ao gravar snapshot")
+            finally:
+                self._snapshot_em_andamento = False
+    
+    def _recuperar(self):
+        """Reconstrói o estado a partir do último snapshot + diário"""
+        snapshot, eventos = self.diario.carregar()
+        
+        with self.lock:
+            if snapshot:
+                # Centenas de milhares de visitas e cartões de uma vez: sem o coletor de ciclos
+                gc.disable()
+                try:
+                    self._restaurar_snapshot(snapshot)
+                finally:
+                    gc.enable()
             
-            with open(arquivo, 'w', encoding='utf-8') as f:
-                json.dump(dados, f, indent=2, ensure_ascii=False)
+            total = 0
+            for tipo, timestamp, valor in eventos:
+                if tipo == 'E':
+                    if valor not in self.pessoas_dentro:
+                        self._aplicar_entrada(valor, timestamp)
+                elif tipo == 'S':
+                    if valor in self.pessoas_dentro:
+                        self._aplicar_saida(valor, timestamp)
+                elif tipo == 'F':
+                    # "linha=qtd"; diários antigos têm só a quantidade (fila única)
+                    fila, _, qtd = valor.rpartition('=')
+                    self._aplicar_fila(int(qtd), timestamp, fila or FILA_PADRAO)
+                total += 1
+            self.diario.eventos_desde_snapshot = total
             
-            return f"Dados exportados para {arquivo}"
\ No newline at end of file
+            # Queda entre arquivar um dia e gravar o snapshot: as visitas dele já estão no acervo
+            arquivado_ate = self.acervo.arquivado_ate if self.acervo else None
+            if arquivado_ate and (snapshot or {}).get('arquivado_ate') != arquivado_ate:
+                self._descartar_arquivadas(arquivado_ate)
+            self.arquivado_ate = arquivado_ate
+            self._alterado.update(('dentro', 'dias', 'tempos'))
+            self._publicar()
+        
+        if snapshot or total:
+            logger.info("Estado recuperado do diário: %d eventos, %d pessoas dentro",
+                        len(self.historico), len(self.pessoas_dentro))
+    
+    def importar_exportacao(self, dados: Dict) -> int:
+        """
+        Carrega uma exportação anterior num gerenciador vazio e retorna quantos eventos vieram
+        
+        `dados` tem o formato de `exportar_dados` (dados_ru.json); para ler um
+        arquivo, inclusive as exportações NDJSON, use `exportacao.ler_exportacao`.
+        É o caminho para a primeira partida sem snapshot: a exportação vira um
+        snapshot do formato antigo, e com diário o snapshot binário é gravado
+        em seguida, então as próximas partidas já são rápidas.
+        """
+        colunas: Dict[str, list] = {'rfid': [], 'timestamp': [], 'tipo': []}
+        entradas: Dict[str, float] = {}
+        for evento in dados.get('historico', []):
+            epoch = datetime.datetime.fromisoformat(evento['timestamp']).timestamp()
+            colunas['rfid'].append(evento['rfid'])
+            colunas['timestamp'].append(epoch)
+            colunas['tipo'].append('E' if evento['tipo'] == 'entrada' else 'S')
+            if evento['tipo'] == 'entrada':
+                entradas[evento['rfid']] = epoch
+        
+        exportado_em = dados.get('exportado_em')
+        exportado_em = converter_timestamp(exportado_em) if exportado_em else datetime.datetime.now()
+        dentro = list(dados.get('pessoas_dentro', []))
+        filas = dados.get('filas') or {FILA_PADRAO: dados.get('pessoas_na_fila', 0)}
+        snapshot = {
+            'historico': colunas,
+            'pessoas_dentro': dentro,
+            # Sem o horário da entrada (fora do histórico exportado): conta a partir da exportação
+            'horarios_entrada': {rfid: entradas.get(rfid, exportado_em.timestamp()) for rfid in dentro},
+            'estatisticas_diarias': {data: dict(stats, horarios_pico=list(stats.get('horarios_pico', [])))
+                                     for data, stats in dados.get('estatisticas', {}).items()},
+            'tempos_permanencia': sorted(dados.get('tempos_permanencia', []), key=_chave_saida),
+            'filas': filas,
+            'pessoas_na_fila': sum(filas.values()),
+            'ultima_atualizacao_fila': None
+        }
+        
+        with self.lock:
+            if self.versao or len(self.historico):
+                raise ValueError('A importação só é feita num estado vazio')
+            gc.disable()
+            try:
+                self._restaurar_snapshot(snapshot)
+            finally:
+                gc.enable()
+            self.versao += 1
+            self._alterado.update(('dentro', 'dias', 'tempos'))
+            self._publicar()
+        
+        self.gravar_snapshot()
+        logger.info("Exportação importada: %d eventos, %d visitas, %d pessoas dentro",
+                    len(colunas['rfid']), len(snapshot['tempos_permanencia']), len(dentro))
+        return len(colunas['rfid'])
+    
+    def _restaurar_snapshot(self, snapshot: Dict):
+        fromtimestamp = datetime.datetime.fromtimestamp
+        
+        colunas = snapshot['historico']
+        if 'nomes' in colunas:
+            self.historico.restaurar_estado(colunas)
+        else:
+            # Snapshot antigo, com o histórico completo em colunas de texto
+            tipos = {'E': 'entrada', 'S': 'saida'}
+            for rfid, ts, tipo in zip(colunas['rfid'], colunas['timestamp'], colunas['tipo']):
+                self.historico.anexar(rfid, fromtimestamp(ts), tipos[tipo])
+        
+        self.pessoas_dentro = set(snapshot['pessoas_dentro'])
+        self.horarios_entrada = {rfid: fromtimestamp(ts)
+                                 for rfid, ts in snapshot['horarios_entrada'].items()}
+        self.estatisticas_diarias = dict(snapshot['estatisticas_diarias'])
+        self.tempos_permanencia = snapshot['tempos_permanencia']
+        visitas_por_rfid = defaultdict(list)
+        for tempo in self.tempos_permanencia:
+            visitas_por_rfid[tempo['rfid']].append(tempo)
+        contar_arquivadas = self.acervo.contar_visitas if self.acervo else (lambda rfid: 0)
+        self.cartoes = {rfid: Cartao(tuple(visitas), self.horarios_entrada.get(rfid), contar_arquivadas(rfid))
+                        for rfid, visitas in visitas_por_rfid.items()}
+        for rfid, entrada in self.horarios_entrada.items():
+            if rfid not in self.cartoes:
+                self.cartoes[rfid] = Cartao((), entrada, contar_arquivadas(rfid))
+        
+        if 'estatisticas_tempo' in snapshot:
+            self.estatisticas_tempo = EstatisticasDuracao.restaurar_estado(snapshot['estatisticas_tempo'])
+            self.estatisticas_tempo_diarias.clear()
+            for data, estado in snapshot['estatisticas_tempo_diarias'].items():
+                self.estatisticas_tempo_diarias[data] = EstatisticasDuracao.restaurar_estado(estado)
+        else:
+            # Snapshot anterior aos agregados: recalcula os de cada dia e soma para o geral
+            for tempo in self.tempos_permanencia:
+                self.estatisticas_tempo_diarias[tempo['saida'][:10]].adicionar(tempo['duracao_segundos'])
+            for agregados in self.estatisticas_tempo_diarias.values():
+                self.estatisticas_tempo.mesclar(agregados)
+        self.filas = dict(snapshot.get('filas', {FILA_PADRAO: snapshot['pessoas_na_fila']}))
+        self.pessoas_na_fila = sum(self.filas.values())
+        if snapshot['ultima_atualizacao_fila'] is not None:
+            self.ultima_atualizacao_fila = fromtimestamp(snapshot['ultima_atualizacao_fila'])
+        
+        ultimo = self.historico.ultimos(1)
+        self._ultimo_horario = fromtimestamp(ultimo[0][1]) if ultimo else None
+    
+    def _descartar_arquivadas(self, arquivado_ate: str):
+        """Tira da memória as visitas de dias anteriores a `arquivado_ate` (chamar com o lock)"""
+        quantidade = bisect.bisect_left(self.tempos_permanencia, arquivado_ate, key=_chave_saida)
+        if not quantidade:
+            return
+        for rfid in {visita['rfid'] for visita in self.tempos_permanencia[:quantidade]}:
+            cartao = self.cartoes[rfid]
+            self.cartoes[rfid] = cartao._replace(
+                visitas=tuple(visita for visita in cartao.visitas if visita['saida'] >= arquivado_ate))
+        self.tempos_permanencia = self.tempos_permanencia[quantidade:]
+        logger.info("%d visitas já arquivadas descartadas da recuperação", quantidade)
@@ -0,0 +1,369 @@
+"""
+Histórico de eventos em buffer circular com transbordo para disco
+
+Os eventos recentes ficam em arrays paralelos de tamanho fixo (id do RFID,
+timestamp em epoch e um byte com o tipo), então a memória não cresce com o
+tempo de execução. Quando o buffer enche, o evento mais antigo é gravado em
+segmentos binários de registros de tamanho fixo: o evento de número `seq`
+fica no segmento `seq // eventos_por_segmento`, na posição
+`(seq % eventos_por_segmento) * TAMANHO_REGISTRO`, o que permite ler
+qualquer trecho do histórico sem percorrer o restante.
+
+Leituras não precisam do lock de quem escreve: o escritor publica a
+`_vista` (início, tamanho, total) depois de gravar cada evento, e o leitor
+usa só o que ela cobre. Se durante a leitura um escritor sobrescreveu uma
+posição lida (evento mais antigo saindo do buffer cheio, ou eventos
+deslocados por uma inserção atrasada), a leitura é refeita.
+"""
+
+import datetime
+import os
+import struct
+import threading
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from diario import sincronizar_diretorio
+from models import Registro
+
+
+TIPOS = ('entrada', 'saida')
+CODIGOS_TIPO = {tipo: codigo for codigo, tipo in enumerate(TIPOS)}
+
+FORMATO_REGISTRO = struct.Struct('<IdB')  # id do RFID, epoch, tipo
+TAMANHO_REGISTRO = FORMATO_REGISTRO.size
+
+
+class HistoricoEventos:
+    """Buffer circular de eventos com arrays compactos e segmentos em disco"""
+
+    def __init__(self, capacidade: int = 10000,
+                 diretorio: Optional[str] = None,
+                 eventos_por_segmento: int = 100000):
+        self.capacidade = capacidade
+        self.diretorio = diretorio
+        self.eventos_por_segmento = eventos_por_segmento
+
+        self._rfids = array('I', [0]) * capacidade
+        self._timestamps = array('d', [0.0]) * capacidade
+        self._tipos = array('B', [0]) * capacidade
+        self._inicio = 0   # posição física do evento mais antigo no buffer
+        self._tamanho = 0
+        self.total = 0     # eventos já registrados (seq do próximo evento)
+
+        # O que os leitores enxergam: (início, tamanho, total), trocada de uma vez
+        self._vista = (0, 0, 0)
+        # Total contando o evento sendo gravado, publicado antes de mexer no buffer
+        self._reservado = 0
+        # Ímpar enquanto uma inserção atrasada desloca eventos já publicados
+        self._deslocamentos = 0
+
+        # Tabela de RFIDs internados: id -> texto e texto -> id
+        self._ids: Dict[str, int] = {}
+        self._nomes: List[str] = []
+
+        # Eventos que saíram do buffer e ainda não foram gravados
+        self._pendentes_disco = bytearray()
+        self._seq_pendentes = 0
+        self._lock_disco = threading.Lock()
+        # Segmentos gravados desde o último descarregar(sincronizar=True), ainda sem fsync
+        self._segmentos_sem_fsync = set()
+
+        if self.diretorio:
+            os.makedirs(self.diretorio, exist_ok=True)
+
+    def __len__(self) -> int:
+        """Quantidade de eventos que ainda podem ser lidos"""
+        _, tamanho, total = self._vista
+        return total if self.diretorio else tamanho
+
+    # ---------- Escrita ----------
+
+    def anexar(self, rfid: str, timestamp: datetime.datetime, tipo: str):
+        """
+        Adiciona um evento mantendo o histórico em ordem cronológica
+
+        No caso comum (evento mais novo que todos) o evento vai para o fim.
+        Eventos atrasados são encaixados na posição certa do buffer; se forem
+        mais antigos que tudo o que está em memória, entram no início dele.
+        """
+        id_rfid = self._internar(rfid)
+        epoch = timestamp.timestamp()
+        self._reservado = self.total + 1
+
+        posicao = self._tamanho
+        if self._tamanho and epoch < self._timestamps[self._fisica(self._tamanho - 1)]:
+            posicao = self._buscar(epoch)
+
+        if self._tamanho == self.capacidade:
+            self._transbordar(self._inicio)
+            self._inicio = (self._inicio + 1) % self.capacidade
+            self._tamanho -= 1
+            posicao = max(0, posicao - 1)
+
+        deslocar = posicao < self._tamanho
+        if deslocar:
+            self._deslocamentos += 1
+
+        # Desloca uma casa para a direita os eventos depois da posição
+        for i in range(self._tamanho, posicao, -1):
+            destino, origem = self._fisica(i), self._fisica(i - 1)
+            self._rfids[destino] = self._rfids[origem]
+            self._timestamps[destino] = self._timestamps[origem]
+            self._tipos[destino] = self._tipos[origem]
+
+        destino = self._fisica(posicao)
+        self._rfids[destino] = id_rfid
+        self._timestamps[destino] = epoch
+        self._tipos[destino] = CODIGOS_TIPO[tipo]
+        self._tamanho += 1
+        self.total += 1
+
+        if deslocar:
+            self._deslocamentos += 1
+        self._vista = (self._inicio, self._tamanho, self.total)
+
+    def _fisica(self, indice: int) -> int:
+        """Converte a posição lógica no buffer (0 = mais antigo) na posição do array"""
+        return (self._inicio + indice) % self.capacidade
+
+    def _buscar(self, epoch: float) -> int:
+        """Busca binária: primeira posição lógica com timestamp maior que `epoch`"""
+        inicio, fim = 0, self._tamanho
+        while inicio < fim:
+            meio = (inicio + fim) // 2
+            if self._timestamps[self._fisica(meio)] <= epoch:
+                inicio = meio + 1
+            else:
+                fim = meio
+        return inicio
+
+    def _internar(self, rfid: str) -> int:
+        id_rfid = self._ids.get(rfid)
+        if id_rfid is None:
+            id_rfid = len(self._nomes)
+            self._ids[rfid] = id_rfid
+            self._nomes.append(rfid)
+        return id_rfid
+
+    def _transbordar(self, posicao: int):
+        """Manda o evento mais antigo do buffer para o disco (ou o descarta)"""
+        if not self.diretorio:
+            return
+
+        seq = self.total - self._tamanho
+        with self._lock_disco:
+            if not self._pendentes_disco:
+                self._seq_pendentes = seq
+            self._pendentes_disco += FORMATO_REGISTRO.pack(
+                self._rfids[posicao], self._timestamps[posicao], self._tipos[posicao])
+            cheio = len(self._pendentes_disco) >= 64 * 1024
+
+        if cheio:
+            self.descarregar()
+
+    def descarregar(self, sincronizar: bool = False):
+        """
+        Grava nos segmentos os eventos que saíram do buffer
+
+        As gravações do dia a dia não fazem fsync; com `sincronizar` (antes
+        de um snapshot, que apaga o diário que cobria esses eventos) todos os
+        segmentos gravados desde a última sincronização vão para o disco,
+        junto com o diretório.
+        """
+        with self._lock_disco:
+            dados = self._pendentes_disco
+            seq = self._seq_pendentes
+            self._pendentes_disco = bytearray()
+
+            deslocamento = 0
+            while deslocamento < len(dados):
+                segmento, indice = divmod(seq, self.eventos_por_segmento)
+                quantidade = min(self.eventos_por_segmento - indice,
+                                 (len(dados) - deslocamento) // TAMANHO_REGISTRO)
+                fim = deslocamento + quantidade * TAMANHO_REGISTRO
+
+                caminho = self._caminho_segmento(segmento)
+                with open(caminho, 'r+b' if os.path.exists(caminho) else 'wb') as f:
+                    f.seek(indice * TAMANHO_REGISTRO)
+                    f.write(dados[deslocamento:fim])
+                self._segmentos_sem_fsync.add(segmento)
+
+                seq += quantidade
+                deslocamento = fim
+
+            if sincronizar and self._segmentos_sem_fsync:
+                for segmento in sorted(self._segmentos_sem_fsync):
+                    with open(self._caminho_segmento(segmento), 'r+b') as f:
+                        os.fsync(f.fileno())
+                sincronizar_diretorio(self.diretorio)
+                self._segmentos_sem_fsync = set()
+
+    # ---------- Leitura ----------
+
+    def _ler_sem_lock(self, ler):
+        """
+        Roda `ler(vista)` até obter uma leitura que nenhum escritor atrapalhou
+
+        `ler` devolve (resultado, menor posição lógica lida no buffer ou None).
+        Anexar no fim de um buffer com espaço não atrapalha ninguém; com o
+        buffer cheio, cada evento novo sobrescreve o mais antigo, então só
+        leituras que chegam perto do início do buffer podem precisar repetir.
+        """
+        while True:
+            deslocamentos = self._deslocamentos
+            vista = self._vista
+            if deslocamentos % 2 == 0:
+                resultado, menor_posicao = ler(vista)
+                if self._deslocamentos == deslocamentos and (
+                        menor_posicao is None
+                        or vista[1] + self._reservado - vista[2] - self.capacidade <= menor_posicao):
+                    return resultado
+            time.sleep(0)  # cede a vez ao escritor
+
+    def ultimos(self, limite: int) -> List[Tuple[str, float, str]]:
+        """
+        Retorna os `limite` eventos mais recentes como (rfid, epoch, tipo),
+        do mais antigo para o mais novo. O custo depende só de `limite`.
+        """
+        return self._ler_sem_lock(
+            lambda vista: self._intervalo(vista, max(0, vista[2] - max(0, limite)), vista[2]))
+
+    def intervalo(self, inicio: int, fim: int) -> List[Tuple[str, float, str]]:
+        """Retorna os eventos com seq em [inicio, fim)"""
+        return self._ler_sem_lock(lambda vista: self._intervalo(vista, inicio, fim))
+
+    def _intervalo(self, vista, inicio: int, fim: int):
+        posicao_inicio, tamanho, total = vista
+        primeiro_em_memoria = total - tamanho
+        inicio = max(inicio, 0 if self.diretorio else primeiro_em_memoria)
+        fim = min(fim, total)
+        if inicio >= fim:
+            return [], None
+
+        eventos = []
+        if inicio < primeiro_em_memoria:
+            eventos.extend(self._ler_disco(inicio, min(fim, primeiro_em_memoria)))
+            inicio = primeiro_em_memoria
+
+        nomes = self._nomes
+        for seq in range(inicio, fim):
+            posicao = (posicao_inicio + seq - primeiro_em_memoria) % self.capacidade
+            eventos.append((nomes[self._rfids[posicao]],
+                            self._timestamps[posicao],
+                            TIPOS[self._tipos[posicao]]))
+        return eventos, (inicio - primeiro_em_memoria if inicio < fim else None)
+
+    def primeiro_seq(self) -> int:
+        """Seq do evento mais antigo que ainda pode ser lido"""
+        _, tamanho, total = self._vista
+        return 0 if self.diretorio else total - tamanho
+
+    def buscar_seq(self, epoch: float) -> int:
+        """
+        Busca binária: seq do primeiro evento com timestamp >= `epoch`
+
+        Usa o buffer em memória e, para eventos mais antigos, lê um registro
+        por passo dos segmentos: O(log n) leituras, sem varrer o histórico.
+        """
+        return self._ler_sem_lock(lambda vista: self._buscar_seq(vista, epoch))
+
+    def _buscar_seq(self, vista, epoch: float):
+        posicao_inicio, tamanho, total = vista
+        primeiro_em_memoria = total - tamanho
+        menor_posicao = None
+
+        inicio, fim = 0 if self.diretorio else primeiro_em_memoria, total
+        while inicio < fim:
+            meio = (inicio + fim) // 2
+            if meio >= primeiro_em_memoria:
+                logica = meio - primeiro_em_memoria
+                menor_posicao = logica if menor_posicao is None else min(menor_posicao, logica)
+                timestamp = self._timestamps[(posicao_inicio + logica) % self.capacidade]
+            else:
+                eventos = self._ler_disco(meio, meio + 1)
+                timestamp = eventos[0][1] if eventos else float('-inf')
+            if timestamp < epoch:
+                inicio = meio + 1
+            else:
+                fim = meio
+        return inicio, menor_posicao
+
+    def _ler_disco(self, inicio: int, fim: int) -> List[Tuple[str, float, str]]:
+        # Eventos ainda no buffer de escrita precisam estar no arquivo
+        if self._pendentes_disco:
+            self.descarregar()
+
+        eventos = []
+        nomes = self._nomes
+        seq = inicio
+        while seq < fim:
+            segmento, indice = divmod(seq, self.eventos_por_segmento)
+            quantidade = min(self.eventos_por_segmento - indice, fim - seq)
+            caminho = self._caminho_segmento(segmento)
+            if not os.path.exists(caminho):
+                seq += quantidade
+                continue
+
+            with open(caminho, 'rb') as f:
+                f.seek(indice * TAMANHO_REGISTRO)
+                dados = f.read(quantidade * TAMANHO_REGISTRO)
+            for id_rfid, epoch, codigo in FORMATO_REGISTRO.iter_unpack(dados):
+                eventos.append((nomes[id_rfid], epoch, TIPOS[codigo]))
+            seq += quantidade
+        return eventos
+
+    def registros(self, ate: Optional[int] = None) -> Iterator[Registro]:
+        """Percorre os eventos disponíveis, do mais antigo ao mais novo (até o seq `ate`, exclusivo)"""
+        fromtimestamp = datetime.datetime.fromtimestamp
+        passo = self.eventos_por_segmento
+        fim = self.total if ate is None else ate
+        for inicio in range(0, fim, passo):
+            for rfid, epoch, tipo in self.intervalo(inicio, min(fim, inicio + passo)):
+                yield Registro(rfid, fromtimestamp(epoch), tipo)
+
+    # ---------- Snapshot ----------
+
+    def exportar_estado(self) -> Dict:
+        """Estado do buffer em memória (os segmentos já estão em disco)"""
+        ordem = [(self._inicio + i) % self.capacidade for i in range(self._tamanho)]
+        return {
+            'total': self.total,
+            'nomes': list(self._nomes),
+            'rfid': [self._rfids[p] for p in ordem],
+            'timestamp': [self._timestamps[p] for p in ordem],
+            'tipo': bytes(self._tipos[p] for p in ordem).hex()
+        }
+
+    def restaurar_estado(self, estado: Dict):
+        self._nomes = list(estado['nomes'])
+        self._ids = {rfid: i for i, rfid in enumerate(self._nomes)}
+
+        rfids, timestamps = estado['rfid'], estado['timestamp']
+        tipos = bytes.fromhex(estado['tipo'])
+        excedente = len(rfids) - self.capacidade
+        if excedente > 0:
+            # Capacidade menor que a do snapshot: os mais antigos transbordam
+            # para os segmentos, como no anexar, em vez de sumirem do total
+            if self.diretorio:
+                with self._lock_disco:
+                    if not self._pendentes_disco:
+                        self._seq_pendentes = estado['total'] - len(rfids)
+                    for registro in zip(rfids[:excedente], timestamps[:excedente], tipos[:excedente]):
+                        self._pendentes_disco += FORMATO_REGISTRO.pack(*registro)
+                self.descarregar()
+            rfids, timestamps, tipos = rfids[excedente:], timestamps[excedente:], tipos[excedente:]
+
+        self._deslocamentos += 1
+        self._inicio = 0
+        self._tamanho = len(rfids)
+        self._rfids[:self._tamanho] = array('I', rfids)
+        self._timestamps[:self._tamanho] = array('d', timestamps)
+        self._tipos[:self._tamanho] = array('B', tipos)
+        self.total = self._reservado = estado['total']
+        self._deslocamentos += 1
+        self._vista = (self._inicio, self._tamanho, self.total)
+
+    def _caminho_segmento(self, segmento: int) -> str:
+        return os.path.join(self.diretorio, f"segmento_{segmento:06d}.bin")
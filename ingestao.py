@@ -0,0 +1,173 @@
+"""
+Fila de ingestão com um único escritor (modo opcional)
+
+Sem a fila, cada thread produtora (workers do Flask, serial, UDP,
+simulador) chama `registrar_entrada`/`registrar_saida` e disputa o lock do
+gerenciador. Com ela, as batidas entram numa fila limitada e uma thread
+escritora as retira em grupos: aplica o grupo inteiro sob uma única
+aquisição do lock (uma publicação do estado, uma notificação aos ouvintes)
+e entrega a cada produtor o seu resultado por um `Resultado` (um future
+mínimo).
+
+A fila cheia não acumula threads esperando: depois de `espera_maxima`
+segundos o produtor recebe `FilaCheia` (a API responde 503 com
+Retry-After, a serial e o UDP respondem "ocupado" para o leitor repetir).
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metricas import REGISTRO
+
+logger = logging.getLogger(__name__)
+
+# (tipo, rfid, catraca) de uma batida
+Batida = Tuple[str, str, Optional[str]]
+
+INGESTAO_GRUPO = REGISTRO.histograma(
+    'ingestao_grupo_eventos', 'Batidas aplicadas por aquisição do lock na fila de ingestão',
+    limites=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+INGESTAO_ESPERA = REGISTRO.histograma(
+    'ingestao_espera_segundos', 'Da entrada na fila de ingestão até o resultado')
+INGESTAO_RECUSADAS = REGISTRO.contador(
+    'ingestao_recusadas_total', 'Batidas recusadas com a fila de ingestão cheia')
+
+
+class FilaCheia(Exception):
+    """A fila de ingestão está cheia; o produtor deve tentar de novo mais tarde"""
+
+
+class Resultado:
+    """
+    Future mínimo de uma batida: o produtor bloqueia num lock que o escritor libera
+
+    Faz o papel de `concurrent.futures.Future`, que usa uma Condition por
+    objeto e custa bem mais na rajada (cada batida cria um).
+    """
+
+    __slots__ = ('_pronto', '_valor', '_erro')
+
+    def __init__(self):
+        self._pronto = threading.Lock()
+        self._pronto.acquire()
+        self._valor = None
+        self._erro = None
+
+    def definir(self, valor: Dict):
+        self._valor = valor
+        self._pronto.release()
+
+    def falhar(self, erro: BaseException):
+        self._erro = erro
+        self._pronto.release()
+
+    def obter(self) -> Dict:
+        self._pronto.acquire()
+        if self._erro is not None:
+            raise self._erro
+        return self._valor
+
+
+class FilaIngestao:
+    """Fila limitada de batidas e a thread que as aplica em grupos"""
+
+    def __init__(self, aplicar: Callable[[List[Batida]], List[Dict]],
+                 capacidade: int = 1000,
+                 maximo_grupo: int = 256,
+                 espera_maxima: float = 0.05):
+        """
+        `aplicar` recebe um grupo de batidas e devolve um resultado por batida
+        (ex.: `GerenciadorRestaurante.registrar_grupo`).
+        """
+        self.aplicar = aplicar
+        self.maximo_grupo = maximo_grupo
+        self.espera_maxima = espera_maxima
+        self.ativo = False
+        self._fila: queue.Queue = queue.Queue(maxsize=capacidade)
+        self._thread = None
+
+    def iniciar(self):
+        self.ativo = True
+        self._thread = threading.Thread(target=self._loop_escrita, daemon=True)
+        self._thread.start()
+        REGISTRO.coletor('ingestao', self._coletar_metricas)
+        logger.info("✓ Fila de ingestão ativa (capacidade %d, grupos de até %d)",
+                    self._fila.maxsize, self.maximo_grupo)
+
+    def enviar(self, tipo: str, rfid: str, catraca: Optional[str] = None) -> Dict:
+        """Enfileira uma batida e espera o resultado (levanta FilaCheia)"""
+        futuro = Resultado()
+        try:
+            self._fila.put(((tipo, rfid, catraca), futuro, time.perf_counter()), timeout=self.espera_maxima)
+        except queue.Full:
+            INGESTAO_RECUSADAS.incrementar()
+            raise FilaCheia(f"Fila de ingestão cheia ({self._fila.maxsize} batidas)")
+        return futuro.obter()
+
+    # ---------- Escritor ----------
+
+    def _loop_escrita(self):
+        """Única thread que aplica batidas: espera a primeira e leva junto as que já estão na fila"""
+        encerrar = False
+        while not encerrar or not self._fila.empty():
+            try:
+                item = self._fila.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            grupo = []
+            while True:
+                if item is None:
+                    encerrar = True  # sinal de parar; o que já está na fila ainda é aplicado
+                else:
+                    grupo.append(item)
+                if len(grupo) >= self.maximo_grupo:
+                    break
+                try:
+                    item = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+
+            if grupo:
+                self._aplicar_grupo(grupo)
+
+    def _aplicar_grupo(self, grupo: List):
+        INGESTAO_GRUPO.observar(len(grupo))
+        try:
+            resultados = self.aplicar([batida for batida, _, _ in grupo])
+        except Exception as e:
+            logger.exception("❌ Erro ao aplicar grupo de %d batidas", len(grupo))
+            for _, futuro, _ in grupo:
+                futuro.falhar(e)
+            return
+
+        agora = time.perf_counter()
+        for (_, futuro, enfileirada), resultado in zip(grupo, resultados):
+            futuro.definir(resultado)
+            INGESTAO_ESPERA.observar(agora - enfileirada)
+
+    def _coletar_metricas(self):
+        yield ('ingestao_fila_batidas', 'gauge', 'Batidas esperando na fila de ingestão',
+               [({}, self._fila.qsize())])
+
+    def parar(self):
+        """Aplica o que já está na fila e encerra o escritor"""
+        if not self.ativo:
+            return
+        self.ativo = False
+        self._fila.put(None)
+        self._thread.join(timeout=5)
+
+        # Quem enfileirou junto com o sinal de parar não fica esperando para sempre
+        while True:
+            try:
+                item = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].falhar(FilaCheia("Fila de ingestão encerrada"))
+        REGISTRO.coletor('ingestao', None)
+        logger.info("Fila de ingestão encerrada.")
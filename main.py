@@ -5,33 +5,89 @@ Integração com ESP32 (RFID) + Câmera (Fila)
 Arquivo principal que orquestra todos os módulos do sistema
 """
 
+import os
 import time
 
 from config import Config
+from configuracao_log import configurar_log, encerrar_log
+from diario import DiarioEventos
 from gerenciador import GerenciadorRestaurante
+from historico import HistoricoEventos
+from acervo import AcervoHistorico
+from ingestao import FilaIngestao
+from exportacao import ExportadorPeriodico, ler_exportacao
 from esp32_serial import IntegradorESP32Serial
-from camera_monitor import MonitorFilaCamera
+from receptor_udp import ReceptorUDP
+from camera_monitor import MonitorFilaCamera, PoolDeteccao
 from api import criar_app
 
 
 def main():
     """Ponto de entrada do sistema"""
     
+    configurar_log(Config.NIVEL_LOG, Config.NIVEIS_LOG_MODULOS, Config.FORMATO_LOG, Config.ARQUIVO_LOG)
+    
     print("\n" + "="*60)
     print("  SISTEMA DE CONTROLE - RESTAURANTE UNIVERSITÁRIO")
     print("="*60 + "\n")
     
-    # Inicializa gerenciador
-    gerenciador = GerenciadorRestaurante()
+    # Inicializa gerenciador (recuperando o estado do diário, se houver)
+    diario = None
+    diretorio_historico = None
+    acervo = None
+    if Config.HABILITAR_DIARIO:
+        diario = DiarioEventos(Config.DIRETORIO_DADOS, Config.INTERVALO_FSYNC_SEGUNDOS)
+        diretorio_historico = os.path.join(Config.DIRETORIO_DADOS, "historico")
+        if Config.HABILITAR_ACERVO:
+            acervo = AcervoHistorico(Config.DIRETORIO_ACERVO)
+    
+    historico = HistoricoEventos(
+        Config.CAPACIDADE_HISTORICO,
+        diretorio_historico,
+        Config.EVENTOS_POR_SEGMENTO
+    )
+    gerenciador = GerenciadorRestaurante(diario, Config.EVENTOS_POR_SNAPSHOT, historico,
+                                         acervo, Config.DIAS_EM_MEMORIA)
+    if diario:
+        diario.iniciar()
+    
+    # Primeira partida (nada no diário): recomeça da última exportação, se houver
+    if (Config.IMPORTAR_EXPORTACAO_NA_PARTIDA and gerenciador.versao == 0
+            and os.path.exists(Config.ARQUIVO_EXPORTACAO)):
+        try:
+            gerenciador.importar_exportacao(ler_exportacao(Config.ARQUIVO_EXPORTACAO))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Não foi possível importar {Config.ARQUIVO_EXPORTACAO}: {e}\n")
+    
+    if Config.FILA_INGESTAO:
+        gerenciador.ingestao = FilaIngestao(
+            gerenciador.registrar_grupo,
+            Config.CAPACIDADE_FILA_INGESTAO,
+            Config.GRUPO_MAXIMO_INGESTAO,
+            Config.ESPERA_FILA_INGESTAO
+        )
+        gerenciador.ingestao.iniciar()
     print("Gerenciador inicializado\n")
     
+    exportador = None
+    if Config.EXPORTACAO_PERIODICA_MINUTOS > 0:
+        exportador = ExportadorPeriodico(
+            gerenciador,
+            Config.DIRETORIO_EXPORTACOES,
+            Config.EXPORTACAO_PERIODICA_MINUTOS * 60,
+            Config.EXPORTACOES_MANTIDAS,
+            Config.COMPACTAR_EXPORTACOES
+        )
+        exportador.iniciar()
+    
     # ==== INTEGRAÇÃO COM ESP32 ====
     
+    integrador = None
     if Config.MODO_ESP32 == "serial":
         print("Modo: SERIAL (USB)")
         integrador = IntegradorESP32Serial(
             gerenciador, 
-            Config.PORTA_SERIAL, 
+            Config.PORTAS_SERIAIS, 
             Config.BAUDRATE
         )
         if not integrador.iniciar():
@@ -44,19 +100,46 @@ def main():
     else:
         print("Modo: ESP32 desabilitado\n")
     
+    receptor_udp = None
+    if Config.HABILITAR_UDP:
+        receptor_udp = ReceptorUDP(
+            gerenciador,
+            Config.HTTP_HOST,
+            Config.UDP_PORTA,
+            Config.UDP_JANELA_DEDUPLICACAO
+        )
+        if not receptor_udp.iniciar():
+            receptor_udp = None
+    
     # ==== MONITOR DE CÂMERA (FILA) ====
     
-    monitor = MonitorFilaCamera(
-        gerenciador, 
-        Config.CAMERA_INDEX,
-        Config.INTERVALO_CAMERA_SEGUNDOS,
-        Config.HABILITAR_CAMERA
-    )
-    monitor.iniciar()
+    pool_deteccao = PoolDeteccao(Config.PROCESSOS_DETECCAO)
+    monitores = [
+        MonitorFilaCamera(
+            gerenciador,
+            camera["fonte"],
+            camera.get("intervalo", Config.INTERVALO_CAMERA_SEGUNDOS),
+            Config.HABILITAR_CAMERA,
+            Config.FPS_DETECCAO,
+            Config.FPS_STREAM,
+            Config.AREA_MINIMA_PESSOA,
+            Config.DETECCAO_POR_MOVIMENTO,
+            Config.DETECCAO_SOMENTE_REGIAO,
+            Config.INTERVALO_DETECCAO_COMPLETA,
+            nome=camera["nome"],
+            roi=camera.get("roi"),
+            pool=pool_deteccao,
+            quadros_por_deteccao=Config.QUADROS_POR_DETECCAO,
+            rastreamento=Config.RASTREAMENTO
+        )
+        for camera in Config.CAMERAS
+    ]
+    for monitor in monitores:
+        monitor.iniciar()
     
     # ==== API HTTP ====
 
-    app = criar_app(gerenciador, monitor)
+    app = criar_app(gerenciador, monitores, integrador)
     
     print(f"Iniciando API HTTP em http://{Config.HTTP_HOST}:{Config.HTTP_PORT}")
     print(f"   Acesse http://localhost:{Config.HTTP_PORT}/status para ver o status\n")
@@ -75,8 +158,22 @@ def main():
     except KeyboardInterrupt:
         print("\n\nEncerrando sistema...")
     
-    monitor.parar()
+    if integrador:
+        integrador.parar()
+    if receptor_udp:
+        receptor_udp.parar()
+    for monitor in monitores:
+        monitor.parar()
+    pool_deteccao.parar()
+    if exportador:
+        exportador.parar()
+    if gerenciador.ingestao:
+        gerenciador.ingestao.parar()
     print(gerenciador.exportar_dados(Config.ARQUIVO_EXPORTACAO))
+    if diario:
+        gerenciador.gravar_snapshot()
+        diario.fechar()
+    encerrar_log()  # escreve o que ainda estava na fila do log
     print("Sistema encerrado.\n")
 
 
@@ -0,0 +1,273 @@
+"""
+Métricas internas do sistema (contadores, medidores e histogramas)
+
+Cada módulo cria suas métricas uma vez, no `REGISTRO` global, e só
+incrementa/observa no caminho quente: uma soma sob um lock próprio da
+métrica, sem I/O e sem alocação. Os histogramas têm faixas fixas, então
+observar é uma busca binária e um incremento.
+
+`/metrics` chama `REGISTRO.exportar()`, que monta o texto no formato do
+Prometheus. Valores que já existem em outros objetos (contadores da serial,
+pessoas dentro...) entram por coletores, funções chamadas só na exportação.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Segundos; cobre de uma requisição em memória até uma detecção HOG lenta
+LIMITES_PADRAO = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                  0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# (nome, tipo, ajuda, [(rótulos, valor), ...]) devolvido por um coletor
+Amostras = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class Contador:
+    """Valor que só cresce (eventos, erros, frames)"""
+
+    def __init__(self):
+        self.valor = 0.0
+        self._lock = threading.Lock()
+
+    def incrementar(self, quantidade: float = 1):
+        with self._lock:
+            self.valor += quantidade
+
+
+class Medidor:
+    """Valor que sobe e desce (FPS, pessoas na fila)"""
+
+    def __init__(self):
+        self.valor = 0.0
+
+    def definir(self, valor: float):
+        self.valor = valor
+
+
+class Histograma:
+    """Distribuição em faixas fixas (latências), com soma e total"""
+
+    def __init__(self, limites: Sequence[float] = LIMITES_PADRAO):
+        self.limites = tuple(limites)
+        self.contagens = [0] * (len(self.limites) + 1)  # a última é a faixa +Inf
+        self.soma = 0.0
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float):
+        indice = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            self.contagens[indice] += 1
+            self.soma += valor
+
+    def ler(self) -> Tuple[List[int], float]:
+        """Contagens por faixa (não acumuladas) e soma, lidas juntas"""
+        with self._lock:
+            return list(self.contagens), self.soma
+
+
+class FamiliaMetricas:
+    """
+    Uma métrica com nome e ajuda, e uma instância por combinação de rótulos
+
+    Sem rótulos a própria família repassa `incrementar`, `definir` e
+    `observar` para a instância única. Com rótulos, `rotulos(...)` devolve
+    a instância daquela combinação; guarde o resultado em vez de chamar a
+    cada evento.
+    """
+
+    def __init__(self, nome: str, tipo: str, ajuda: str, nomes_rotulos: Sequence[str], fabrica: Callable):
+        self.nome = nome
+        self.tipo = tipo
+        self.ajuda = ajuda
+        self.nomes_rotulos = tuple(nomes_rotulos)
+        self._fabrica = fabrica
+        self._instancias: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        self._unica = None if self.nomes_rotulos else self.rotulos()
+
+    def rotulos(self, *valores):
+        if len(valores) != len(self.nomes_rotulos):
+            raise ValueError(f"{self.nome} espera os rótulos {self.nomes_rotulos}")
+        chave = tuple(str(valor) for valor in valores)
+        instancia = self._instancias.get(chave)
+        if instancia is None:
+            with self._lock:
+                instancia = self._instancias.setdefault(chave, self._fabrica())
+        return instancia
+
+    def incrementar(self, quantidade: float = 1):
+        self._unica.incrementar(quantidade)
+
+    def definir(self, valor: float):
+        self._unica.definir(valor)
+
+    def observar(self, valor: float):
+        self._unica.observar(valor)
+
+    def amostras(self) -> List[Tuple[Dict[str, str], object]]:
+        with self._lock:
+            itens = list(self._instancias.items())
+        return [(dict(zip(self.nomes_rotulos, chave)), instancia) for chave, instancia in itens]
+
+
+class LockMedido:
+    """
+    Lock que mede quanto tempo ele fica tomado e quanto se espera por ele
+
+    Toda aquisição entra em `posse`. Sem disputa, a aquisição custa só uma
+    tentativa sem bloqueio a mais; quando o lock está ocupado, a espera é
+    cronometrada e entra em `espera`, então a contagem de `espera` dividida
+    pela de `posse` é a fração de aquisições com contenção. As observações
+    são feitas depois de liberar, fora da seção crítica. Serve no lugar de
+    `threading.Lock` em `with`.
+    """
+
+    def __init__(self, espera: Histograma, posse: Histograma):
+        self._lock = threading.Lock()
+        self._espera = espera
+        self._posse = posse
+        self._adquirido = 0.0
+        self._esperou = None
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            esperou = None
+        elif not blocking:
+            return False
+        else:
+            inicio = time.perf_counter()
+            if not self._lock.acquire(True, timeout):
+                return False
+            esperou = time.perf_counter() - inicio
+        self._adquirido = time.perf_counter()
+        self._esperou = esperou
+        return True
+
+    def release(self):
+        posse = time.perf_counter() - self._adquirido
+        esperou = self._esperou
+        self._lock.release()
+        self._posse.observar(posse)
+        if esperou is not None:
+            self._espera.observar(esperou)
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class RegistroMetricas:
+    """Todas as métricas do processo e a exportação no formato do Prometheus"""
+
+    def __init__(self):
+        self._familias: Dict[str, FamiliaMetricas] = {}
+        self._coletores: Dict[str, Callable[[], Iterable[Amostras]]] = {}
+        self._lock = threading.Lock()
+
+    def _familia(self, nome: str, tipo: str, ajuda: str, rotulos: Sequence[str], fabrica: Callable):
+        # Criar de novo devolve a mesma família (ex.: duas instâncias de um módulo)
+        with self._lock:
+            familia = self._familias.get(nome)
+            if familia is None:
+                familia = FamiliaMetricas(nome, tipo, ajuda, rotulos, fabrica)
+                self._familias[nome] = familia
+            return familia
+
+    def contador(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> FamiliaMetricas:
+        return self._familia(nome, 'counter', ajuda, rotulos, Contador)
+
+    def medidor(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> FamiliaMetricas:
+        return self._familia(nome, 'gauge', ajuda, rotulos, Medidor)
+
+    def histograma(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                   limites: Sequence[float] = LIMITES_PADRAO) -> FamiliaMetricas:
+        return self._familia(nome, 'histogram', ajuda, rotulos, lambda: Histograma(limites))
+
+    def lock_medido(self, nome: str, ajuda: str) -> LockMedido:
+        """Lock com os histogramas `<nome>_posse_segundos` e `<nome>_espera_segundos`"""
+        return LockMedido(
+            self.histograma(f"{nome}_espera_segundos",
+                            f"Espera pelo {ajuda} (só aquisições que o encontraram ocupado)").rotulos(),
+            self.histograma(f"{nome}_posse_segundos", f"Tempo com o {ajuda} tomado").rotulos()
+        )
+
+    def coletor(self, nome: str, funcao: Optional[Callable[[], Iterable[Amostras]]]):
+        """Registra (ou substitui, ou remove com None) uma função chamada na exportação"""
+        with self._lock:
+            if funcao is None:
+                self._coletores.pop(nome, None)
+            else:
+                self._coletores[nome] = funcao
+
+    # ---------- Exportação ----------
+
+    def exportar(self) -> str:
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+        with self._lock:
+            familias = list(self._familias.values())
+            coletores = list(self._coletores.values())
+
+        linhas = []
+        for familia in familias:
+            linhas.append(f"# HELP {familia.nome} {_escapar_ajuda(familia.ajuda)}")
+            linhas.append(f"# TYPE {familia.nome} {familia.tipo}")
+            for rotulos, instancia in familia.amostras():
+                if familia.tipo == 'histogram':
+                    _exportar_histograma(linhas, familia.nome, rotulos, instancia)
+                else:
+                    linhas.append(f"{familia.nome}{_formatar_rotulos(rotulos)} {_formatar_valor(instancia.valor)}")
+
+        for coletor in coletores:
+            for nome, tipo, ajuda, amostras in coletor():
+                linhas.append(f"# HELP {nome} {_escapar_ajuda(ajuda)}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                for rotulos, valor in amostras:
+                    linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {_formatar_valor(valor)}")
+
+        return "\n".join(linhas) + "\n"
+
+
+def _exportar_histograma(linhas: List[str], nome: str, rotulos: Dict[str, str], histograma: Histograma):
+    contagens, soma = histograma.ler()
+    acumulado = 0
+    for limite, contagem in zip(histograma.limites + (float('inf'),), contagens):
+        acumulado += contagem
+        faixa = dict(rotulos, le='+Inf' if limite == float('inf') else repr(limite))
+        linhas.append(f"{nome}_bucket{_formatar_rotulos(faixa)} {acumulado}")
+    linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {_formatar_valor(soma)}")
+    linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {acumulado}")
+
+
+def _formatar_rotulos(rotulos: Dict[str, str]) -> str:
+    if not rotulos:
+        return ""
+    pares = ",".join(f'{chave}="{_escapar_rotulo(str(valor))}"' for chave, valor in rotulos.items())
+    return "{" + pares + "}"
+
+
+def _escapar_rotulo(valor: str) -> str:
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _escapar_ajuda(texto: str) -> str:
+    return texto.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _formatar_valor(valor) -> str:
+    if isinstance(valor, bool):
+        return "1" if valor else "0"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+# Registro do processo, compartilhado por todos os módulos
+REGISTRO = RegistroMetricas()
@@ -0,0 +1,154 @@
+"""
+Recepção de eventos dos leitores RFID por UDP
+
+Alternativa leve ao POST /evento: cada batida é um datagrama com uma linha
+no mesmo formato da serial, precedida de um número de sequência:
+
+    42 ENTRADA:RFID_123
+
+e o servidor responde com um datagrama de confirmação, com a mesma
+resposta JSON que a serial enviaria:
+
+    ACK 42 {"sucesso": true, "mensagem": "Entrada registrada com sucesso", ...}
+
+Sem confirmação o leitor retransmite com o mesmo número. Respostas ficam
+guardadas por `janela_deduplicacao` segundos por (endereço, sequência),
+então uma retransmissão recebe a confirmação original sem registrar o
+evento de novo. Um datagrama pode ter várias linhas (uma confirmação por
+linha). Linhas sem número de sequência são aceitas, mas sem deduplicação.
+Com a fila de ingestão cheia a resposta é `"ocupado": true`, que não é
+guardada: a retransmissão seguinte é processada de verdade.
+"""
+
+import json
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from esp32_serial import processar_comando
+from gerenciador import GerenciadorRestaurante
+
+logger = logging.getLogger(__name__)
+
+
+class ReceptorUDP:
+    """Escuta datagramas `SEQ TIPO:RFID` e confirma cada um com `ACK SEQ <json>`"""
+
+    TAMANHO_MAXIMO_DATAGRAMA = 65507
+    MAXIMO_RESPOSTAS_GUARDADAS = 100000
+
+    def __init__(self, gerenciador: GerenciadorRestaurante,
+                 host: str = '0.0.0.0',
+                 porta: int = 5005,
+                 janela_deduplicacao: float = 30):
+        self.gerenciador = gerenciador
+        self.host = host
+        self.porta = porta
+        self.janela_deduplicacao = janela_deduplicacao
+        self.ativo = False
+        self.socket = None
+        self._thread = None
+
+        # (endereço, seq) -> resposta já enviada, expirando em ordem de chegada
+        self._respostas: Dict = {}
+        self._expiracao = deque()
+
+        self.contadores = {'datagramas': 0, 'eventos': 0, 'duplicados': 0, 'invalidos': 0}
+
+    def iniciar(self) -> bool:
+        try:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # Buffer maior para absorver rajadas enquanto um evento é processado
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            self.socket.bind((self.host, self.porta))
+            self.socket.settimeout(0.5)
+        except OSError as e:
+            logger.error("❌ Erro ao abrir porta UDP %s: %s", self.porta, e)
+            return False
+
+        self.porta = self.socket.getsockname()[1]
+        self.ativo = True
+        self._thread = threading.Thread(target=self._loop_recepcao, daemon=True)
+        self._thread.start()
+        logger.info("✓ Recebendo eventos por UDP na porta %d", self.porta)
+        return True
+
+    def _loop_recepcao(self):
+        while self.ativo:
+            try:
+                dados, endereco = self.socket.recvfrom(self.TAMANHO_MAXIMO_DATAGRAMA)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self.ativo:
+                    time.sleep(0.1)
+                continue
+
+            self.contadores['datagramas'] += 1
+            respostas = [self._processar_linha(linha.strip(), endereco)
+                         for linha in dados.decode('utf-8', errors='replace').splitlines()
+                         if linha.strip()]
+            if respostas:
+                try:
+                    self.socket.sendto('\n'.join(respostas).encode('utf-8'), endereco)
+                except OSError as e:
+                    logger.error("❌ Erro ao confirmar evento UDP para %s: %s", endereco[0], e)
+
+    def _processar_linha(self, linha: str, endereco) -> str:
+        """Processa uma linha e devolve a confirmação (reaproveitada se for retransmissão)"""
+        seq, _, comando = linha.partition(' ')
+        if not comando or not seq.isdigit():
+            seq, comando = None, linha
+
+        agora = time.monotonic()
+        self._expirar(agora)
+
+        chave = (endereco, seq)
+        if seq is not None and chave in self._respostas:
+            self.contadores['duplicados'] += 1
+            return self._respostas[chave]
+
+        resposta = self._executar(comando, endereco[0])
+        confirmacao = f"ACK {seq} {json.dumps(resposta, ensure_ascii=False)}" if seq is not None \
+            else json.dumps(resposta, ensure_ascii=False)
+
+        # "Ocupado" (fila de ingestão cheia) não é guardado: a retransmissão tenta de novo
+        if seq is not None and not resposta.get('ocupado'):
+            self._respostas[chave] = confirmacao
+            self._expiracao.append((agora, chave))
+        return confirmacao
+
+    def _executar(self, comando: str, catraca: str) -> Dict:
+        try:
+            resposta: Optional[Dict] = processar_comando(self.gerenciador, comando, catraca)
+        except Exception:
+            logger.exception("❌ Erro ao processar evento UDP de %s", catraca)
+            resposta = None
+
+        if resposta is None:
+            self.contadores['invalidos'] += 1
+            return {'sucesso': False, 'mensagem': 'Comando inválido'}
+        self.contadores['eventos'] += 1
+        return resposta
+
+    def _expirar(self, agora: float):
+        limite = agora - self.janela_deduplicacao
+        while self._expiracao and (self._expiracao[0][0] < limite
+                                   or len(self._expiracao) > self.MAXIMO_RESPOSTAS_GUARDADAS):
+            _, chave = self._expiracao.popleft()
+            self._respostas.pop(chave, None)
+
+    def obter_estatisticas(self) -> Dict:
+        return {'porta': self.porta, 'ativo': self.ativo, **self.contadores,
+                'respostas_guardadas': len(self._respostas)}
+
+    def parar(self):
+        self.ativo = False
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self.socket:
+            self.socket.close()
+        logger.info("Receptor UDP encerrado.")
@@ -1,8 +1,12 @@
-﻿import time
+﻿import logging
+import time
 import threading
 import random
 from gerenciador import GerenciadorRestaurante
 
+logger = logging.getLogger(__name__)
+
+
 class SimuladorRestaurante:
 
     def __init__(self, gerenciador: GerenciadorRestaurante):
@@ -18,29 +22,29 @@ class SimuladorRestaurante:
         while rfid in self.gerenciador.pessoas_dentro:
             rfid = self.gerar_rfid_aleatorio()
 
-        print(f"🤖 [SIMULADOR] Tentando entrar: {rfid}")
+        logger.debug("🤖 [SIMULADOR] Tentando entrar: %s", rfid)
         return self.gerenciador.registrar_entrada(rfid)
 
     def simular_saida(self):
         pessoas_dentro = list(self.gerenciador.pessoas_dentro)
 
         if not pessoas_dentro:
-            print("🤖 [SIMULADOR] Ninguém dentro para sair.")
+            logger.debug("🤖 [SIMULADOR] Ninguém dentro para sair.")
             return {'sucesso': False, 'mensagem': 'Restaurante vazio'}
 
         rfid_saida = random.choice(pessoas_dentro)
-        print(f"🤖 [SIMULADOR] Tentando sair: {rfid_saida}")
+        logger.debug("🤖 [SIMULADOR] Tentando sair: %s", rfid_saida)
         return self.gerenciador.registrar_saida(rfid_saida)
 
     def simular_fila(self, quantidade: int):
-        print(f"🤖 [SIMULADOR] Fila alterada para: {quantidade}")
+        logger.info("🤖 [SIMULADOR] Fila alterada para: %d", quantidade)
         self.gerenciador.atualizar_fila(quantidade)
 
     def iniciar_modo_automatico(self, intervalo=2.0):
         self.ativo = True
         self.thread = threading.Thread(target=self._loop_auto, args=(intervalo,), daemon=True)
         self.thread.start()
-        print("🤖 [SIMULADOR] Modo automático iniciado.")
+        logger.info("🤖 [SIMULADOR] Modo automático iniciado.")
 
     def _loop_auto(self, intervalo):
         while self.ativo:
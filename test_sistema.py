@@ -0,0 +1,1337 @@
+"""
+Testes do sistema
+
+A comunicação serial é testada com um pseudo-terminal no lugar do ESP32:
+o integrador abre o lado escravo como se fosse a porta USB e o teste
+escreve e lê pelo lado mestre, como o firmware faria.
+"""
+
+import datetime
+import gzip
+import io
+import json
+import logging
+import marshal
+import os
+import random
+import select
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from acervo import AcervoHistorico
+from analise import AnaliseHistorica
+from api import criar_app
+from configuracao_log import configurar_log, encerrar_log
+from diario import DiarioEventos
+from esp32_serial import IntegradorESP32Serial
+from estatisticas import EstatisticasDuracao
+from eventos_push import DifusorEventos
+from exportacao import comprimir_gzip, exportar_ndjson, ler_exportacao
+from gerenciador import GerenciadorRestaurante
+from historico import HistoricoEventos
+from ingestao import FilaCheia, FilaIngestao
+from metricas import RegistroMetricas
+from receptor_udp import ReceptorUDP
+
+try:
+    import cv2
+    from camera_monitor import (ContagemSuavizada, DetectorMovimento, DifusorFrames, MonitorFilaCamera,
+                                PoolDeteccao, RastreadorCaixas)
+    from fontes_video import abrir_fonte
+    CAMERA_DISPONIVEL = True
+except ImportError:
+    CAMERA_DISPONIVEL = False
+
+try:
+    import pty  # noqa: F401  (só existe em sistemas POSIX)
+    import serial  # noqa: F401
+    PTY_DISPONIVEL = True
+except ImportError:
+    PTY_DISPONIVEL = False
+
+
+class ESP32Simulado:
+    """Lado mestre do pseudo-terminal: envia batidas e lê as respostas"""
+
+    def __init__(self):
+        self.mestre, self._escravo = os.openpty()
+        self.porta = os.ttyname(self._escravo)
+        self._buffer = b''
+
+    def enviar(self, texto: str):
+        os.write(self.mestre, texto.encode('utf-8'))
+
+    def ler_linha(self, timeout: float = 2.0):
+        """Próxima linha recebida (sem o '\\n'), ou None se nada chegar a tempo"""
+        limite = time.monotonic() + timeout
+        while b'\n' not in self._buffer:
+            restante = limite - time.monotonic()
+            if restante <= 0 or not select.select([self.mestre], [], [], restante)[0]:
+                return None
+            self._buffer += os.read(self.mestre, 4096)
+        linha, self._buffer = self._buffer.split(b'\n', 1)
+        return linha.decode('utf-8')
+
+    def fechar(self):
+        """Fecha os dois lados, como se o cabo USB fosse desconectado"""
+        if self.mestre is None:
+            return
+        os.close(self.mestre)
+        os.close(self._escravo)
+        self.mestre = None
+
+
+@unittest.skipUnless(PTY_DISPONIVEL, "requer pty (POSIX) e pyserial")
+class TestSerialESP32(unittest.TestCase):
+
+    def setUp(self):
+        self.esp32 = ESP32Simulado()
+        self.gerenciador = GerenciadorRestaurante()
+        self.integrador = IntegradorESP32Serial(self.gerenciador, self.esp32.porta)
+        self.assertTrue(self.integrador.iniciar())
+
+    def tearDown(self):
+        self.integrador.parar()
+        self.esp32.fechar()
+
+    def test_latencia_batida_resposta(self):
+        """A resposta sai assim que a linha chega, sem esperar um ciclo de polling"""
+        latencias = []
+        for i in range(40):
+            tipo = 'ENTRADA' if i % 2 == 0 else 'SAIDA'
+            inicio = time.perf_counter()
+            self.esp32.enviar(f"{tipo}:RFID_{i // 2}\n")
+            resposta = self.esp32.ler_linha()
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+            self.assertIsNotNone(resposta, f"sem resposta para a batida {i}")
+            self.assertTrue(json.loads(resposta)['sucesso'])
+
+        mediana = statistics.median(latencias)
+        p95 = sorted(latencias)[int(0.95 * len(latencias))]
+
+        # O laço antigo dormia 50 ms por volta (média ~25 ms só de espera)
+        self.assertLess(mediana, 10)
+        self.assertLess(p95, 50)
+
+    def test_linha_partida_entre_timeouts(self):
+        """Uma linha que chega em dois pedaços, com timeout no meio, é processada inteira"""
+        self.esp32.enviar("ENTR")
+        time.sleep(IntegradorESP32Serial.TIMEOUT_LEITURA * 2)
+        self.esp32.enviar("ADA:RFID_PARTIDO\n")
+
+        resposta = json.loads(self.esp32.ler_linha())
+        self.assertTrue(resposta['sucesso'])
+        self.assertIn('RFID_PARTIDO', self.gerenciador.pessoas_dentro)
+
+    def test_comandos_e_respostas_nao_se_misturam(self):
+        """Comandos e respostas escritos ao mesmo tempo chegam como linhas inteiras"""
+        for i in range(20):
+            self.integrador.enviar_comando_esp32("E\n")
+            self.esp32.enviar(f"ENTRADA:RFID_{i}\n")
+
+        respostas = comandos = 0
+        while respostas < 20 or comandos < 20:
+            linha = self.esp32.ler_linha()
+            self.assertIsNotNone(linha, "mensagens faltando")
+            if linha == "E":
+                comandos += 1
+            else:
+                self.assertTrue(json.loads(linha)['sucesso'])
+                respostas += 1
+
+
+@unittest.skipUnless(PTY_DISPONIVEL, "requer pty (POSIX) e pyserial")
+class TestVariasCatracas(unittest.TestCase):
+    """Cada catraca abre um link simbólico, que o teste aponta para outro pty ao "religar"""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.esp32 = {'norte': ESP32Simulado(), 'sul': ESP32Simulado()}
+        self.links = {}
+        for catraca, esp32 in self.esp32.items():
+            self.links[catraca] = os.path.join(self.diretorio.name, catraca)
+            os.symlink(esp32.porta, self.links[catraca])
+
+        self.gerenciador = GerenciadorRestaurante()
+        self.integrador = IntegradorESP32Serial(
+            self.gerenciador,
+            [{'catraca': catraca, 'porta': link} for catraca, link in self.links.items()])
+        for canal in self.integrador.canais:
+            canal.RECONEXAO_MINIMA = 0.05
+        self.assertTrue(self.integrador.iniciar())
+
+    def tearDown(self):
+        self.integrador.parar()
+        for esp32 in self.esp32.values():
+            esp32.fechar()
+        self.diretorio.cleanup()
+
+    def estatisticas(self, catraca):
+        return next(e for e in self.integrador.obter_estatisticas() if e['catraca'] == catraca)
+
+    def esperar(self, condicao, timeout=3.0):
+        limite = time.monotonic() + timeout
+        while not condicao():
+            if time.monotonic() > limite:
+                self.fail("condição não atingida a tempo")
+            time.sleep(0.02)
+
+    def test_eventos_marcados_com_a_catraca(self):
+        self.esp32['norte'].enviar("ENTRADA:RFID_N\n")
+        self.esp32['sul'].enviar("ENTRADA:RFID_S\n")
+
+        self.assertEqual(json.loads(self.esp32['norte'].ler_linha())['catraca'], 'norte')
+        self.assertEqual(json.loads(self.esp32['sul'].ler_linha())['catraca'], 'sul')
+        self.assertEqual(self.estatisticas('norte')['eventos'], 1)
+        self.assertEqual(self.estatisticas('sul')['respostas'], 1)
+
+    def test_catraca_desconectada_nao_afeta_as_outras(self):
+        self.esp32['sul'].fechar()
+        self.esperar(lambda: not self.estatisticas('sul')['conectado'])
+
+        latencias = []
+        for i in range(10):
+            inicio = time.perf_counter()
+            self.esp32['norte'].enviar(f"ENTRADA:RFID_{i}\n")
+            self.assertIsNotNone(self.esp32['norte'].ler_linha())
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+        self.assertLess(max(latencias), 50)
+        self.assertEqual(self.estatisticas('norte')['erros_leitura'], 0)
+        self.assertGreaterEqual(self.estatisticas('sul')['erros_leitura'], 1)
+
+    def test_reconecta_quando_a_porta_volta(self):
+        self.esp32['sul'].fechar()
+        self.esperar(lambda: not self.estatisticas('sul')['conectado'])
+
+        # "Religa" o ESP32: novo pty no mesmo caminho
+        self.esp32['sul'] = ESP32Simulado()
+        os.remove(self.links['sul'])
+        os.symlink(self.esp32['sul'].porta, self.links['sul'])
+        self.esperar(lambda: self.estatisticas('sul')['conectado'])
+
+        self.esp32['sul'].enviar("ENTRADA:RFID_VOLTOU\n")
+        self.assertTrue(json.loads(self.esp32['sul'].ler_linha())['sucesso'])
+        self.assertEqual(self.estatisticas('sul')['reconexoes'], 1)
+
+
+
+@unittest.skipUnless(CAMERA_DISPONIVEL, "requer OpenCV")
+class TestRastreamento(unittest.TestCase):
+
+    def test_trilhas_seguem_as_caixas(self):
+        rastreador = RastreadorCaixas(iou_minimo=0.3, max_perdidos=2, horizonte=1.0)
+        rastreador.atualizar([(0, 0, 50, 100), (200, 0, 50, 100)], 0.0)
+        ids = {trilha['caixa']: trilha['id'] for trilha in rastreador.trilhas}
+
+        # Ordem trocada: a primeira por sobreposição, a segunda (andou 40 px) pelo centro
+        rastreador.atualizar([(240, 0, 50, 100), (10, 0, 50, 100)], 1.0)
+        novos = {trilha['caixa']: trilha['id'] for trilha in rastreador.trilhas}
+        self.assertEqual(novos, {(10, 0, 50, 100): ids[(0, 0, 50, 100)],
+                                 (240, 0, 50, 100): ids[(200, 0, 50, 100)]})
+
+        # Entre detecções a caixa segue a velocidade medida, até o horizonte
+        self.assertEqual(sorted(rastreador.caixas(1.5)), [(12, 0, 50, 100), (250, 0, 50, 100)])
+        self.assertEqual(sorted(rastreador.caixas(9.0)), [(15, 0, 50, 100), (260, 0, 50, 100)])
+        rastreador.parado()
+        self.assertEqual(sorted(rastreador.caixas(9.0)), [(10, 0, 50, 100), (240, 0, 50, 100)])
+
+        # Longe demais de qualquer trilha: pessoa nova
+        rastreador.atualizar([(10, 0, 50, 100), (240, 0, 50, 100), (400, 0, 50, 100)], 2.0)
+        self.assertEqual(len(rastreador), 3)
+
+    def test_trilha_sem_deteccao_expira(self):
+        rastreador = RastreadorCaixas(max_perdidos=2)
+        rastreador.atualizar([(0, 0, 50, 100)], 0.0)
+        for agora in (1.0, 2.0):
+            rastreador.atualizar([], agora)  # o HOG falhou: a trilha continua
+            self.assertEqual(len(rastreador), 1)
+        rastreador.atualizar([], 3.0)
+        self.assertEqual(len(rastreador), 0)
+
+    def test_contagem_suavizada_com_histerese(self):
+        suavizada = ContagemSuavizada(alfa=0.3, histerese=0.7)
+        self.assertEqual(suavizada.atualizar(3), 3)
+
+        # 3 e 4 alternando não chega ao dashboard
+        publicadas = {suavizada.atualizar(bruta) for bruta in [4, 3] * 10}
+        self.assertEqual(publicadas, {3})
+
+        # Uma mudança que se mantém chega, sem passar do valor real
+        publicadas = [suavizada.atualizar(5) for _ in range(10)]
+        self.assertEqual(publicadas[-1], 5)
+        self.assertEqual(publicadas, sorted(publicadas))
+        self.assertLess(publicadas[0], 5)  # um único quadro com 5 não basta
+
+
+@unittest.skipUnless(CAMERA_DISPONIVEL, "requer OpenCV")
+class TestPipelineCamera(unittest.TestCase):
+
+    def setUp(self):
+        self.gerenciador = GerenciadorRestaurante()
+        self.fonte = abrir_fonte("sintetico:3")
+        self.monitores = []
+        self.pool = None
+
+    def tearDown(self):
+        for monitor in self.monitores:
+            monitor.parar()
+        if self.pool is not None:
+            self.pool.parar()
+
+    def frame(self):
+        """Próximo frame do gerador, no tamanho que a captura entrega à detecção"""
+        _, frame = self.fonte.read()
+        largura = MonitorFilaCamera.LARGURA_ALVO
+        return cv2.resize(frame, (largura, frame.shape[0] * largura // frame.shape[1]))
+
+    def monitor(self, pool, **opcoes):
+        """Monitor sem as threads de captura e codificação: o teste agenda cada detecção"""
+        monitor = MonitorFilaCamera(self.gerenciador, pool=pool, intervalo_segundos=0, **opcoes)
+        monitor._id_pool = pool.registrar(monitor._receber_deteccao)
+        self.monitores.append(monitor)
+        return monitor
+
+    def esperar(self, condicao, timeout=10.0):
+        limite = time.monotonic() + timeout
+        while not condicao():
+            if time.monotonic() > limite:
+                self.fail("condição não atingida a tempo")
+            time.sleep(0.02)
+
+    def test_movimento_detecta_so_o_que_mudou(self):
+        detector = DetectorMovimento(area_minima=1500)
+        primeiro, segundo = self.frame(), self.frame()
+        altura, largura = primeiro.shape[:2]
+
+        self.assertEqual(detector.regiao(primeiro), (0, 0, largura, altura))
+        self.assertIsNone(detector.regiao(primeiro.copy()))
+        x, y, w, h = detector.regiao(segundo)
+        self.assertTrue(w > 0 and h > 0 and x + w <= largura and y + h <= altura)
+
+    def test_cena_parada_nao_roda_o_hog(self):
+        pool = mock.Mock()
+        pool.registrar.return_value = 0
+        monitor = self.monitor(pool, intervalo_deteccao_completa=3600)
+        frame = self.frame()
+
+        monitor._agendar_deteccao(frame, time.time())
+        self.assertEqual(pool.enviar.call_count, 1)
+        monitor._receber_deteccao(1, [(10, 10, 60, 120)], 0.01)
+        self.assertEqual(monitor.contagem, 1)
+
+        for _ in range(3):
+            monitor._agendar_deteccao(frame.copy(), time.time())
+        self.assertEqual(pool.enviar.call_count, 1)
+        self.assertEqual(monitor.deteccoes['reaproveitada'], 3)
+        self.assertEqual(self.gerenciador.obter_status_atual()['pessoas_na_fila'], 1)
+
+    def test_difusor_nao_repete_frame(self):
+        difusor = DifusorFrames()
+        recebidos = []
+
+        def cliente():
+            for parte in difusor.gerar_stream(timeout=0.05):
+                recebidos.append(parte)
+
+        thread = threading.Thread(target=cliente)
+        thread.start()
+        self.assertTrue(difusor.esperar_assinantes(timeout=2))
+        for jpeg in (b'quadro-1', b'quadro-2'):
+            difusor.publicar(jpeg)
+            self.esperar(lambda: len(recebidos) == int(jpeg[-1:]))
+            time.sleep(0.2)  # vários timeouts do cliente sem frame novo
+        difusor.encerrar()
+        thread.join(timeout=2)
+
+        self.assertEqual([parte.split(b'\r\n\r\n')[1] for parte in recebidos],
+                         [b'quadro-1\r\n', b'quadro-2\r\n'])
+        self.assertEqual(difusor.assinantes, 0)
+
+    def test_pool_ida_e_volta_com_trabalhador_morto(self):
+        self.pool = PoolDeteccao(1)
+        self.pool.iniciar()
+        monitor = self.monitor(self.pool, deteccao_por_movimento=False, rastreamento=False)
+        monitor.PRAZO_DETECCAO = 0.5
+
+        monitor._agendar_deteccao(self.frame(), time.time())
+        self.esperar(lambda: monitor._pendente is None)
+        self.assertEqual(monitor.deteccoes['completa'], 1)
+        self.assertGreater(monitor.contagem, 0)
+        self.assertEqual(self.gerenciador.obter_status_atual()['pessoas_na_fila'], monitor.contagem)
+
+        # O trabalhador morre com a tarefa seguinte na fila: o pool é recomeçado...
+        trabalhador = self.pool._trabalhadores[0]
+        trabalhador.kill()
+        trabalhador.join()
+        monitor._agendar_deteccao(self.frame(), time.time())
+        memoria_antiga = monitor._memoria.name
+        self.esperar(lambda: self.pool.reinicios == 1)
+
+        # ...e a câmera, passado o prazo, refaz a detecção em outro bloco de memória
+        time.sleep(monitor.PRAZO_DETECCAO)
+        monitor._agendar_deteccao(self.frame(), time.time())
+        self.assertEqual(monitor.deteccoes['expirada'], 1)
+        self.assertNotEqual(monitor._memoria.name, memoria_antiga)
+        self.esperar(lambda: monitor._pendente is None)
+        self.assertEqual(monitor.deteccoes['completa'], 2)
+
+
+class TestReceptorUDP(unittest.TestCase):
+
+    def setUp(self):
+        self.gerenciador = GerenciadorRestaurante()
+        self.receptor = ReceptorUDP(self.gerenciador, '127.0.0.1', 0)
+        self.assertTrue(self.receptor.iniciar())
+        self.cliente = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.cliente.settimeout(2)
+
+    def tearDown(self):
+        self.cliente.close()
+        self.receptor.parar()
+
+    def trocar(self, texto: str) -> str:
+        self.cliente.sendto(texto.encode('utf-8'), ('127.0.0.1', self.receptor.porta))
+        return self.cliente.recvfrom(65535)[0].decode('utf-8')
+
+    def test_retransmissao_nao_registra_de_novo(self):
+        primeira = self.trocar("7 ENTRADA:RFID_UDP")
+        repetida = self.trocar("7 ENTRADA:RFID_UDP")
+
+        self.assertTrue(primeira.startswith("ACK 7 "))
+        self.assertEqual(primeira, repetida)
+        self.assertTrue(json.loads(primeira.split(' ', 2)[2])['sucesso'])
+        self.assertEqual(len(self.gerenciador.historico), 1)
+        self.assertEqual(self.receptor.contadores['duplicados'], 1)
+
+        # Nova sequência é um evento novo (aqui, recusado: a pessoa já está dentro)
+        self.assertFalse(json.loads(self.trocar("8 ENTRADA:RFID_UDP").split(' ', 2)[2])['sucesso'])
+
+    def test_varias_linhas_e_linha_invalida(self):
+        resposta = self.trocar("1 ENTRADA:A\n2 ENTRADA:B\n3 lixo").splitlines()
+
+        self.assertEqual([linha.split(' ', 2)[1] for linha in resposta], ['1', '2', '3'])
+        self.assertFalse(json.loads(resposta[2].split(' ', 2)[2])['sucesso'])
+        self.assertEqual(self.gerenciador.pessoas_dentro, {'A', 'B'})
+
+
+class TestHistorico(unittest.TestCase):
+    """Buffer circular pequeno (8 eventos) com segmentos de 5 eventos em disco"""
+
+    INICIO = 1_700_000_000
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.historico = self.novo()
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def novo(self):
+        return HistoricoEventos(8, self.diretorio.name, 5)
+
+    def anexar(self, historico, segundos, rfid="RFID_0"):
+        historico.anexar(rfid, datetime.datetime.fromtimestamp(self.INICIO + segundos), 'entrada')
+
+    def segundos(self, eventos):
+        return [epoch - self.INICIO for _, epoch, _ in eventos]
+
+    def test_transbordo_e_paginas_entre_disco_e_memoria(self):
+        for i in range(30):
+            self.anexar(self.historico, i, f"RFID_{i % 3}")
+
+        self.assertEqual(len(self.historico), 30)
+        self.assertEqual(self.segundos(self.historico.intervalo(0, 30)), list(range(30)))
+        # Em memória ficam os seq 22..29; as páginas atravessam a fronteira
+        for inicio in range(0, 30, 7):
+            self.assertEqual(self.segundos(self.historico.intervalo(inicio, inicio + 7)),
+                             list(range(inicio, min(30, inicio + 7))))
+        self.assertEqual(self.segundos(self.historico.ultimos(10)), list(range(20, 30)))
+        self.assertEqual(self.historico.intervalo(4, 6)[0][0], "RFID_1")
+        self.assertEqual(self.historico.buscar_seq(self.INICIO + 12.5), 13)
+        self.assertEqual(len(os.listdir(self.diretorio.name)), 5)
+
+        sem_disco = HistoricoEventos(8)
+        for i in range(30):
+            self.anexar(sem_disco, i)
+        self.assertEqual((len(sem_disco), sem_disco.primeiro_seq()), (8, 22))
+        self.assertEqual(self.segundos(sem_disco.intervalo(0, 30)), list(range(22, 30)))
+
+    def test_eventos_atrasados(self):
+        for i in range(10):
+            self.anexar(self.historico, i)
+        self.anexar(self.historico, 7.5)  # cabe no buffer: vai para o lugar certo
+        self.anexar(self.historico, -1)   # mais antigo que o buffer inteiro: entra no início dele
+
+        self.assertEqual(self.segundos(self.historico.intervalo(0, 12)),
+                         [0, 1, 2, 3, -1, 4, 5, 6, 7, 7.5, 8, 9])
+
+    def test_segmentos_relidos_depois_de_reiniciar(self):
+        for i in range(30):
+            self.anexar(self.historico, i)
+        estado = self.historico.exportar_estado()
+        self.historico.descarregar(sincronizar=True)
+
+        reiniciado = self.novo()
+        reiniciado.restaurar_estado(estado)
+        self.assertEqual(reiniciado.intervalo(0, 30), self.historico.intervalo(0, 30))
+        self.anexar(reiniciado, 30)
+        self.assertEqual(self.segundos(reiniciado.intervalo(20, 31)), list(range(20, 31)))
+
+    def test_restaurar_com_capacidade_menor(self):
+        for i in range(12):
+            self.anexar(self.historico, i, f"RFID_{i % 3}")
+        estado = self.historico.exportar_estado()  # seq 4..11 em memória
+        self.historico.descarregar(sincronizar=True)
+
+        menor = HistoricoEventos(3, self.diretorio.name, 5)
+        menor.restaurar_estado(estado)
+        self.assertEqual((len(menor), menor.primeiro_seq()), (12, 0))
+        self.assertEqual(menor.intervalo(0, 12), self.historico.intervalo(0, 12))
+        self.assertEqual(menor.buscar_seq(self.INICIO + 6.5), 7)
+        self.anexar(menor, 12)
+        self.assertEqual(self.segundos(menor.intervalo(0, 13)), list(range(13)))
+
+    def test_sincronizar_faz_fsync_de_todos_os_segmentos(self):
+        for i in range(20):
+            self.anexar(self.historico, i)
+        self.historico.descarregar()  # gravação periódica, sem fsync
+        for i in range(20, 25):
+            self.anexar(self.historico, i)
+
+        with mock.patch('os.fsync') as fsync:
+            self.historico.descarregar(sincronizar=True)
+        # Segmentos 0..3 (seq 0..16), contando os da gravação sem fsync, e o diretório
+        self.assertEqual(fsync.call_count, 4 + (os.name != 'nt'))
+
+
+class TestEstatisticasDuracao(unittest.TestCase):
+
+    def test_percentis_perto_do_calculo_exato(self):
+        gerador = random.Random(7)
+        duracoes = [int(gerador.lognormvariate(7.3, 0.6)) for _ in range(5000)]
+        agregados = EstatisticasDuracao()
+        for segundos in duracoes:
+            agregados.adicionar(segundos)
+
+        ordenadas = sorted(duracoes)
+        for p in (50, 90, 99):
+            exato = ordenadas[max(0, int(p / 100 * len(ordenadas)) - 1)]
+            largura = 15 if exato <= 3600 else 300  # largura da faixa do histograma
+            self.assertLessEqual(abs(agregados.percentil(p) - exato), largura, f"p{p}")
+        self.assertEqual((agregados.minimo, agregados.maximo), (ordenadas[0], ordenadas[-1]))
+        self.assertAlmostEqual(agregados.media, statistics.mean(duracoes))
+
+    def test_agregados_por_dia_somam_o_geral(self):
+        gerenciador = GerenciadorRestaurante()
+        inicio = datetime.datetime.combine(datetime.date.today(), datetime.time(11)) - datetime.timedelta(days=3)
+        lote, por_dia = [], {}
+        for dia in range(3):
+            for i in range(10):
+                entrada = inicio + datetime.timedelta(days=dia, minutes=i)
+                minutos = 5 + 7 * i + dia
+                lote.append({'tipo': 'ENTRADA', 'rfid': f"RFID_{i}", 'timestamp': entrada.isoformat()})
+                lote.append({'tipo': 'SAIDA', 'rfid': f"RFID_{i}",
+                             'timestamp': (entrada + datetime.timedelta(minutes=minutos)).isoformat()})
+                por_dia.setdefault(entrada.date().isoformat(), []).append(minutos * 60)
+        gerenciador.registrar_lote(lote)
+
+        for data, duracoes in por_dia.items():
+            resumo = gerenciador.obter_estatisticas_tempo(data)
+            self.assertEqual(resumo['total_visitas'], len(duracoes))
+            self.assertEqual(resumo['tempo_minimo_segundos'], min(duracoes))
+            self.assertEqual(resumo['tempo_maximo_segundos'], max(duracoes))
+            self.assertEqual(resumo['tempo_medio_segundos'], int(statistics.mean(duracoes)))
+
+        geral = EstatisticasDuracao()
+        for agregados in gerenciador.estatisticas_tempo_diarias.values():
+            geral.mesclar(agregados)
+        geral.mesclar(EstatisticasDuracao())  # período sem visitas não muda nada
+        self.assertEqual(geral.exportar_estado(), gerenciador.estatisticas_tempo.exportar_estado())
+
+        # Exportação sem agregados: o geral é refeito somando os dias
+        importado = GerenciadorRestaurante()
+        with tempfile.TemporaryDirectory() as diretorio:
+            arquivo = os.path.join(diretorio, 'dados_ru.json')
+            gerenciador.exportar_dados(arquivo)
+            importado.importar_exportacao(ler_exportacao(arquivo))
+        self.assertEqual(importado.obter_estatisticas_tempo(), gerenciador.obter_estatisticas_tempo())
+
+
+class TestLoteAtrasado(unittest.TestCase):
+
+    def test_pico_de_dia_passado_vem_dos_eventos_do_dia(self):
+        gerenciador = GerenciadorRestaurante()
+        for i in range(5):
+            gerenciador.registrar_entrada(f"HOJE_{i}")
+
+        hoje = datetime.date.today()
+        ontem, anteontem = hoje - datetime.timedelta(days=1), hoje - datetime.timedelta(days=2)
+
+        def evento(tipo, rfid, dia, hora, minuto):
+            return {'tipo': tipo, 'rfid': rfid,
+                    'timestamp': datetime.datetime.combine(dia, datetime.time(hora, minuto)).isoformat()}
+
+        # Fora de ordem e misturando dias: ontem chegam a ficar 2 dentro (11:10), anteontem 1;
+        # hoje, uma visita de madrugada que não muda o pico de 5
+        lote = [
+            evento('SAIDA', 'A', ontem, 11, 30),
+            evento('ENTRADA', 'C', anteontem, 12, 0),
+            evento('ENTRADA', 'B', ontem, 11, 10),
+            evento('ENTRADA', 'X', hoje, 0, 0),
+            evento('ENTRADA', 'A', ontem, 11, 0),
+            evento('SAIDA', 'B', ontem, 11, 20),
+            evento('SAIDA', 'X', hoje, 0, 0),
+            evento('SAIDA', 'C', anteontem, 12, 30),
+            evento('ENTRADA', 'B', ontem, 11, 40),
+        ]
+        self.assertTrue(all(resultado['sucesso'] for resultado in gerenciador.registrar_lote(lote)))
+
+        estatisticas = gerenciador.obter_estatisticas(ontem.isoformat())['estatisticas']
+        self.assertEqual((estatisticas['pico_pessoas'], estatisticas['horarios_pico']), (2, ['11:10:00']))
+        self.assertEqual((estatisticas['total_entradas'], estatisticas['total_saidas']), (3, 2))
+        estatisticas = gerenciador.obter_estatisticas(anteontem.isoformat())['estatisticas']
+        self.assertEqual((estatisticas['pico_pessoas'], estatisticas['horarios_pico']), (1, ['12:00:00']))
+        self.assertEqual(gerenciador.obter_estatisticas()['estatisticas']['pico_pessoas'], 5)
+
+        # A batida seguinte, ao vivo, volta a usar a lotação de agora
+        gerenciador.registrar_entrada("HOJE_5")
+        self.assertEqual(gerenciador.obter_estatisticas()['estatisticas']['pico_pessoas'], 7)
+
+
+class TestIndiceCartoes(unittest.TestCase):
+
+    def setUp(self):
+        self.gerenciador = GerenciadorRestaurante()
+        # RFID_A: três visitas e uma entrada em aberto; RFID_B: uma visita no meio
+        for rfid in ("RFID_A", "RFID_B", "RFID_A", "RFID_A"):
+            self.gerenciador.registrar_entrada(rfid)
+            self.gerenciador.registrar_saida(rfid)
+        self.gerenciador.registrar_entrada("RFID_A")
+
+    def test_historico_do_cartao_paginado(self):
+        completo = self.gerenciador.obter_historico_rfid("RFID_A")
+        self.assertTrue(completo['dentro'])
+        self.assertEqual(completo['total'], 7)
+        self.assertEqual([evento['tipo'] for evento in completo['eventos']],
+                         ['entrada', 'saida'] * 3 + ['entrada'])
+        esperado = [evento for evento in self.gerenciador.obter_historico() if evento['rfid'] == "RFID_A"]
+        self.assertEqual([evento['timestamp'] for evento in completo['eventos']],
+                         [evento['timestamp'] for evento in esperado])
+
+        # Páginas a partir do mais recente: a primeira começa na entrada em aberto
+        self.assertEqual(self.gerenciador.obter_historico_rfid("RFID_A", 2)['eventos'], completo['eventos'][-2:])
+        self.assertEqual(self.gerenciador.obter_historico_rfid("RFID_A", 3, 2)['eventos'], completo['eventos'][2:5])
+        self.assertEqual(self.gerenciador.obter_historico_rfid("RFID_A", 5, 4)['eventos'], completo['eventos'][:3])
+        self.assertEqual(self.gerenciador.obter_historico_rfid("RFID_A", 5, 7)['eventos'], [])
+        self.assertEqual(self.gerenciador.obter_historico_rfid("RFID_A", 5, 50)['eventos'], [])
+        self.assertEqual(self.gerenciador.obter_historico_rfid("RFID_A", 0)['eventos'], [])
+
+        desconhecido = self.gerenciador.obter_historico_rfid("RFID_X", 10, 3)
+        self.assertEqual((desconhecido['dentro'], desconhecido['total'], desconhecido['eventos']), (False, 0, []))
+
+    def test_visitas_do_cartao_paginadas(self):
+        todas = self.gerenciador.obter_tempos_permanencia("RFID_A")
+        self.assertEqual(len(todas), 3)
+        self.assertTrue(all(visita['rfid'] == "RFID_A" for visita in todas))
+        self.assertEqual(self.gerenciador.obter_tempos_permanencia("RFID_A", limite=2), todas[1:])
+        self.assertEqual(self.gerenciador.obter_tempos_permanencia("RFID_A", limite=2, offset=2), todas[:1])
+        self.assertEqual(self.gerenciador.obter_tempos_permanencia("RFID_A", limite=2, offset=9), [])
+        self.assertEqual(self.gerenciador.contar_tempos_permanencia("RFID_B"), 1)
+        self.assertEqual(self.gerenciador.obter_tempos_permanencia("RFID_X"), [])
+        self.assertEqual(self.gerenciador.contar_tempos_permanencia("RFID_X"), 0)
+
+
+class TestLeituraSemLock(unittest.TestCase):
+
+    def test_consultas_consistentes_durante_escritas(self):
+        """Com o buffer dando voltas, cada página lida sem lock é contígua e ordenada"""
+        gerenciador = GerenciadorRestaurante(historico=HistoricoEventos(capacidade=64))
+        problemas = []
+        parar = threading.Event()
+
+        def ler():
+            while not parar.is_set():
+                status = gerenciador.obter_status_atual()
+                if status['pessoas_dentro'] != len(status['rfids_dentro']):
+                    problemas.append(status)
+                eventos = gerenciador.obter_historico(64)
+                horarios = [evento['timestamp'] for evento in eventos]
+                if horarios != sorted(horarios):
+                    problemas.append(horarios)
+                visitas = gerenciador.obter_tempos_permanencia(limite=20)
+                if any('saida' not in visita for visita in visitas):
+                    problemas.append(visitas)
+
+        leitores = [threading.Thread(target=ler) for _ in range(3)]
+        for leitor in leitores:
+            leitor.start()
+        for i in range(3000):
+            rfid = f"RFID_{i % 50}"
+            if (i // 50) % 2 == 0:
+                gerenciador.registrar_entrada(rfid)
+            else:
+                gerenciador.registrar_saida(rfid)
+        parar.set()
+        for leitor in leitores:
+            leitor.join()
+
+        self.assertEqual(problemas, [])
+        self.assertEqual(gerenciador.contar_tempos_permanencia(), 1500)
+        self.assertEqual(gerenciador.obter_estatisticas_tempo()['total_visitas'], 1500)
+
+
+class TestNotificacoes(unittest.TestCase):
+
+    def test_stream_em_ordem_de_versao_com_escritores_concorrentes(self):
+        gerenciador = GerenciadorRestaurante()
+        difusor = DifusorEventos(tamanho_buffer=10000)
+        gerenciador.adicionar_ouvinte(difusor.publicar)
+        stream = difusor.gerar_stream(intervalo_keepalive=0.05)
+        self.assertEqual(next(stream), "retry: 3000\n\n")  # já assinado
+
+        def catraca(nome):
+            for i in range(250):
+                gerenciador.registrar_entrada(f"{nome}_{i % 10}")
+                gerenciador.registrar_saida(f"{nome}_{i % 10}")
+
+        catracas = [threading.Thread(target=catraca, args=(f"C{n}",)) for n in range(4)]
+        for thread in catracas:
+            thread.start()
+        for thread in catracas:
+            thread.join()
+
+        versoes = []
+        while len(versoes) < 2000:
+            bloco = next(stream)
+            self.assertNotIn("resync", bloco)
+            versoes += [json.loads(linha[len("data: "):])['versao']
+                        for linha in bloco.splitlines() if linha.startswith("data: ")]
+        stream.close()
+        self.assertEqual(versoes, list(range(1, 2001)))
+        self.assertEqual(difusor.total_assinantes, 0)
+
+
+class TestAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.gerenciador = GerenciadorRestaurante()
+        self.cliente = criar_app(self.gerenciador).test_client()
+
+    def test_snapshot_com_etag(self):
+        self.gerenciador.registrar_entrada("RFID_1")
+        resposta = self.cliente.get("/snapshot")
+        etag = resposta.headers['ETag']
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.get_json()['pessoas_dentro'][0]['rfid'], "RFID_1")
+
+        # Nada mudou: 304 sem corpo, com a mesma ETag
+        resposta = self.cliente.get("/snapshot", headers={'If-None-Match': etag})
+        self.assertEqual((resposta.status_code, resposta.data), (304, b''))
+        self.assertEqual(resposta.headers['ETag'], etag)
+
+        self.gerenciador.registrar_saida("RFID_1")
+        resposta = self.cliente.get("/snapshot", headers={'If-None-Match': etag})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta.headers['ETag'], etag)
+        self.assertEqual(resposta.get_json()['pessoas_dentro'], [])
+
+    def test_stream_de_eventos(self):
+        resposta = self.cliente.get("/eventos/stream", buffered=False)
+        self.assertEqual(resposta.mimetype, 'text/event-stream')
+        partes = iter(resposta.response)
+        self.assertEqual(next(partes), b"retry: 3000\n\n")
+
+        self.gerenciador.registrar_entrada("RFID_1")
+        self.gerenciador.atualizar_fila(4)
+        mensagens = next(partes).decode('utf-8').split("\n\n")
+        resposta.close()
+
+        self.assertEqual([mensagem.split("\n")[0] for mensagem in mensagens[:2]],
+                         ["event: entrada", "event: fila"])
+        entrada = json.loads(mensagens[0].split("data: ", 1)[1])
+        self.assertEqual((entrada['rfid'], entrada['pessoas_dentro'], entrada['versao']), ("RFID_1", 1, 1))
+        self.assertEqual(json.loads(mensagens[1].split("data: ", 1)[1])['pessoas_na_fila'], 4)
+
+    def registrar_manha(self):
+        """Ontem: seis visitas, entradas às 10:00..10:05 e saídas às 10:30..10:35"""
+        self.ontem = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=1),
+                                               datetime.time(10))
+        lote = []
+        for i in range(6):
+            entrada = self.ontem + datetime.timedelta(minutes=i)
+            lote.append({'tipo': 'ENTRADA', 'rfid': f"RFID_{i}", 'timestamp': entrada.isoformat()})
+            lote.append({'tipo': 'SAIDA', 'rfid': f"RFID_{i}",
+                         'timestamp': (entrada + datetime.timedelta(minutes=30)).isoformat()})
+        self.gerenciador.registrar_lote(lote)
+
+    def horario(self, minutos):
+        return (self.ontem + datetime.timedelta(minutes=minutos)).isoformat()
+
+    def test_historico_por_intervalo_com_cursor(self):
+        self.registrar_manha()
+        # [10:02, 10:32): entradas 2..5 e saídas 0..1, em páginas de 4
+        consulta = {'inicio': self.horario(2), 'fim': self.horario(32), 'limite': 4}
+        primeira = self.cliente.get("/historico", query_string=consulta).get_json()
+        self.assertEqual(len(primeira['eventos']), 4)
+        self.assertIsNotNone(primeira['proximo_cursor'])
+        segunda = self.cliente.get("/historico", query_string=dict(
+            consulta, cursor=primeira['proximo_cursor'])).get_json()
+        self.assertIsNone(segunda['proximo_cursor'])
+
+        eventos = primeira['eventos'] + segunda['eventos']
+        self.assertEqual([(evento['rfid'], evento['tipo']) for evento in eventos],
+                         [(f"RFID_{i}", 'entrada') for i in range(2, 6)] + [("RFID_0", 'saida'), ("RFID_1", 'saida')])
+        self.assertEqual([evento['timestamp'] for evento in eventos],
+                         [self.horario(m) for m in (2, 3, 4, 5, 30, 31)])
+
+        # Em NDJSON o intervalo vem inteiro, igual às páginas juntas
+        resposta = self.cliente.get("/historico", query_string={
+            'inicio': self.horario(2), 'fim': self.horario(32), 'formato': 'ndjson'})
+        self.assertEqual(resposta.mimetype, 'application/x-ndjson')
+        self.assertEqual([json.loads(linha) for linha in resposta.data.decode('utf-8').splitlines()], eventos)
+
+        # Epoch também vale; o intervalo é semiaberto
+        epoch = (self.ontem + datetime.timedelta(minutes=5)).timestamp()
+        pagina = self.cliente.get("/historico", query_string={'inicio': epoch, 'fim': epoch + 1}).get_json()
+        self.assertEqual([evento['rfid'] for evento in pagina['eventos']], ["RFID_5"])
+
+    def test_intervalos_vazios_e_invalidos(self):
+        self.registrar_manha()
+        for rota, chave in (("/historico", 'eventos'), ("/tempos", 'tempos')):
+            vazio = self.cliente.get(rota, query_string={'inicio': self.horario(10), 'fim': self.horario(20)})
+            self.assertEqual(vazio.get_json(), {chave: [], 'proximo_cursor': None})
+            invertido = self.cliente.get(rota, query_string={'inicio': self.horario(40), 'fim': self.horario(0)})
+            self.assertEqual(invertido.get_json(), {chave: [], 'proximo_cursor': None})
+            ndjson = self.cliente.get(rota, query_string={'inicio': self.horario(40), 'fim': self.horario(0),
+                                                          'formato': 'ndjson'})
+            self.assertEqual(ndjson.data, b'')
+
+            self.assertEqual(self.cliente.get(rota, query_string={'inicio': 'ontem'}).status_code, 400)
+            self.assertEqual(self.cliente.get(rota, query_string={'cursor': '-3'}).status_code, 400)
+
+    def test_tempos_por_saida_com_cursor(self):
+        self.registrar_manha()
+        consulta = {'inicio': self.horario(31), 'limite': 2}
+        paginas = []
+        while True:
+            pagina = self.cliente.get("/tempos", query_string=consulta).get_json()
+            paginas.append(pagina['tempos'])
+            if pagina['proximo_cursor'] is None:
+                break
+            consulta['cursor'] = pagina['proximo_cursor']
+        self.assertEqual([len(pagina) for pagina in paginas], [2, 2, 1])
+        self.assertEqual([visita['rfid'] for pagina in paginas for visita in pagina],
+                         [f"RFID_{i}" for i in range(1, 6)])
+
+        resposta = self.cliente.get("/tempos", query_string={'rfid': "RFID_3", 'formato': 'ndjson'})
+        visitas = [json.loads(linha) for linha in resposta.data.decode('utf-8').splitlines()]
+        self.assertEqual([(visita['rfid'], visita['duracao_segundos']) for visita in visitas], [("RFID_3", 1800)])
+
+
+class TestFilaIngestao(unittest.TestCase):
+
+    def setUp(self):
+        self.gerenciador = GerenciadorRestaurante()
+        self.liberar = threading.Event()
+        self.grupos = []
+
+        def aplicar(batidas):
+            self.liberar.wait()
+            self.grupos.append(len(batidas))
+            return self.gerenciador.registrar_grupo(batidas)
+
+        self.gerenciador.ingestao = FilaIngestao(aplicar, capacidade=4, espera_maxima=0.01)
+        self.gerenciador.ingestao.iniciar()
+
+    def tearDown(self):
+        self.liberar.set()
+        self.gerenciador.ingestao.parar()
+
+    def test_grupo_e_fila_cheia(self):
+        resultados = {}
+        produtores = [threading.Thread(target=lambda i=i: resultados.__setitem__(
+            i, self.gerenciador.registrar_entrada(f"RFID_{i}"))) for i in range(5)]
+        for produtor in produtores:
+            produtor.start()
+            time.sleep(0.01)
+
+        # Uma batida está com o escritor (parado) e quatro ocupam a fila
+        inicio = time.perf_counter()
+        with self.assertRaises(FilaCheia):
+            self.gerenciador.registrar_entrada("RFID_EXTRA")
+        self.assertLess(time.perf_counter() - inicio, 0.5)
+
+        self.liberar.set()
+        for produtor in produtores:
+            produtor.join()
+        self.assertTrue(all(resultado['sucesso'] for resultado in resultados.values()))
+        self.assertEqual(self.grupos, [1, 4])
+        self.assertEqual(self.gerenciador.obter_status_atual()['pessoas_dentro'], 5)
+        self.assertFalse(self.gerenciador.registrar_entrada("RFID_0")['sucesso'])
+
+
+class TestExportacao(unittest.TestCase):
+
+    def test_ndjson_em_arquivo_e_stream(self):
+        gerenciador = GerenciadorRestaurante()
+        for i in range(3):
+            gerenciador.registrar_entrada(f"RFID_{i}")
+        gerenciador.registrar_saida("RFID_0")
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            arquivo = os.path.join(diretorio, 'exportacao.ndjson.gz')
+            self.assertEqual(exportar_ndjson(gerenciador, arquivo), 8)
+            with gzip.open(arquivo, 'rt', encoding='utf-8') as f:
+                linhas = [json.loads(linha) for linha in f]
+            self.assertEqual(os.listdir(diretorio), ['exportacao.ndjson.gz'])
+
+        registros = [linha['registro'] for linha in linhas]
+        self.assertEqual(registros, ['exportacao'] + ['evento'] * 4 +
+                         ['permanencia', 'estatisticas_dia', 'estatisticas_tempo'])
+        self.assertEqual(sorted(linhas[0]['pessoas_dentro']), ['RFID_1', 'RFID_2'])
+        self.assertEqual(linhas[0]['eventos'], 4)
+
+        stream = gzip.decompress(b''.join(comprimir_gzip(gerenciador.gerar_exportacao())))
+        self.assertEqual(len(stream.decode('utf-8').splitlines()), 8)
+
+
+class TestDiario(unittest.TestCase):
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.dados = os.path.join(self.diretorio.name, 'dados')
+        # Snapshot só quando o teste pede
+        self.gerenciador = GerenciadorRestaurante(DiarioEventos(self.dados), eventos_por_snapshot=10 ** 6)
+        for i in range(4):
+            self.gerenciador.registrar_entrada(f"RFID_{i}")
+        self.gerenciador.registrar_saida("RFID_0")
+        self.gerenciador.atualizar_fila(3)
+        self.gerenciador.diario.sincronizar()  # o commit em grupo já passou
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def reiniciar(self):
+        """Novo processo sobre o mesmo diretório (o anterior caiu sem fechar o diário)"""
+        return GerenciadorRestaurante(DiarioEventos(self.dados))
+
+    def test_queda_sem_snapshot_reaplica_o_diario(self):
+        self.assertFalse(os.path.exists(os.path.join(self.dados, DiarioEventos.ARQUIVO_SNAPSHOT)))
+
+        recuperado = self.reiniciar()
+        self.assertEqual(recuperado.pessoas_dentro, {'RFID_1', 'RFID_2', 'RFID_3'})
+        self.assertEqual(len(recuperado.historico), 5)
+        self.assertEqual(recuperado.obter_tempos_permanencia(), self.gerenciador.obter_tempos_permanencia())
+        self.assertEqual(recuperado.obter_status_atual()['pessoas_na_fila'], 3)
+        self.assertEqual(recuperado.diario.eventos_desde_snapshot, 6)
+        recuperado.diario.fechar()
+
+    def test_ultima_linha_incompleta_e_descartada(self):
+        arquivo = os.path.join(self.dados, 'diario_00000001.log')
+        with open(arquivo, 'a', encoding='utf-8') as f:
+            f.write("S\t1700000000.0\tRFID_")  # queda no meio da escrita
+
+        recuperado = self.reiniciar()
+        self.assertIn('RFID_1', recuperado.pessoas_dentro)
+        self.assertEqual(len(recuperado.historico), 5)
+
+        # O evento seguinte não é emendado na linha cortada
+        recuperado.registrar_saida("RFID_1")
+        recuperado.diario.sincronizar()
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            linhas = f.read().splitlines()
+        self.assertEqual(len(linhas), 7)
+        self.assertTrue(linhas[-1].startswith("S\t") and linhas[-1].endswith("\tRFID_1"))
+        self.assertEqual(self.reiniciar().pessoas_dentro, {'RFID_2', 'RFID_3'})
+
+    def test_snapshot_rotaciona_e_apaga_geracoes_cobertas(self):
+        self.gerenciador.gravar_snapshot()
+        self.gerenciador.registrar_saida("RFID_1")
+        self.gerenciador.diario.sincronizar()
+        self.assertEqual(self.gerenciador.diario._geracoes_existentes(), [2])
+
+        recuperado = self.reiniciar()
+        self.assertEqual(recuperado.pessoas_dentro, {'RFID_2', 'RFID_3'})
+        self.assertEqual(recuperado.contar_tempos_permanencia(), 2)
+        self.assertEqual(recuperado.diario.eventos_desde_snapshot, 1)
+
+    def test_snapshots_simultaneos_gravam_um_de_cada_vez(self):
+        diario = self.gerenciador.diario
+        gravar_snapshot = diario.gravar_snapshot
+        ativos, geracoes = [], []
+
+        def gravar_devagar(estado, geracao):
+            ativos.append(geracao)
+            self.assertEqual(len(ativos), 1, "dois snapshots gravando ao mesmo tempo")
+            time.sleep(0.02)
+            gravar_snapshot(estado, geracao)
+            geracoes.append(geracao)
+            ativos.remove(geracao)
+
+        with mock.patch.object(diario, 'gravar_snapshot', side_effect=gravar_devagar):
+            threads = [threading.Thread(target=self.gerenciador.gravar_snapshot) for _ in range(4)]
+            for i, thread in enumerate(threads):
+                thread.start()
+                self.gerenciador.registrar_entrada(f"RFID_NOVO_{i}")
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(geracoes, sorted(geracoes))
+        self.assertEqual(len(geracoes), 4)
+        self.assertEqual([nome for nome in os.listdir(self.dados) if nome.endswith('.tmp')], [])
+        diario.sincronizar()
+        recuperado = self.reiniciar()
+        self.assertEqual(recuperado.pessoas_dentro, self.gerenciador.pessoas_dentro)
+        recuperado.diario.fechar()
+
+    def test_snapshot_marshal_de_versao_anterior(self):
+        self.gerenciador.gravar_snapshot()
+        caminho = os.path.join(self.dados, DiarioEventos.ARQUIVO_SNAPSHOT)
+        estado, _ = self.gerenciador.diario.carregar()
+        with open(caminho, 'wb') as f:
+            f.write(DiarioEventos.CABECALHO_SNAPSHOT_MARSHAL + marshal.dumps(estado))
+        self.assertEqual(self.reiniciar().pessoas_dentro, {'RFID_1', 'RFID_2', 'RFID_3'})
+
+        # Marshal de outro Python: segue só com o diário em vez de não iniciar
+        with open(caminho, 'wb') as f:
+            f.write(DiarioEventos.CABECALHO_SNAPSHOT_MARSHAL + b"\xff\x00corrompido")
+        self.gerenciador.registrar_entrada("RFID_9")
+        self.gerenciador.diario.sincronizar()
+        self.assertEqual(self.reiniciar().pessoas_dentro, {'RFID_9'})
+
+    def test_partida_so_com_diario(self):
+        """Reaplicar o diário de um dia cheio, sem snapshot, não atrasa a partida"""
+        for i in range(10000):
+            rfid = f"RFID_{i % 200}"
+            if (i // 200) % 2 == 0:
+                self.gerenciador.registrar_entrada(rfid)
+            else:
+                self.gerenciador.registrar_saida(rfid)
+        self.gerenciador.diario.sincronizar()
+
+        inicio = time.perf_counter()
+        recuperado = self.reiniciar()
+        duracao = time.perf_counter() - inicio
+
+        self.assertEqual(recuperado.pessoas_dentro, self.gerenciador.pessoas_dentro)
+        self.assertEqual(recuperado.contar_tempos_permanencia(), self.gerenciador.contar_tempos_permanencia())
+        self.assertLess(duracao, 2.0)
+
+
+class TestPartida(unittest.TestCase):
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.gerenciador = GerenciadorRestaurante()
+        for i in range(4):
+            self.gerenciador.registrar_entrada(f"RFID_{i}")
+        self.gerenciador.registrar_saida("RFID_0")
+        self.gerenciador.atualizar_fila(3)
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def conferir(self, recuperado):
+        self.assertEqual(recuperado.pessoas_dentro, {'RFID_1', 'RFID_2', 'RFID_3'})
+        self.assertEqual(recuperado.contar_tempos_permanencia('RFID_0'), 1)
+        self.assertEqual(len(recuperado.historico), 5)
+        self.assertEqual(recuperado.obter_status_atual()['pessoas_na_fila'], 3)
+        self.assertEqual(recuperado.obter_estatisticas_tempo()['total_visitas'], 1)
+
+    def test_snapshot_binario(self):
+        dados = os.path.join(self.diretorio.name, 'dados')
+        gerenciador = GerenciadorRestaurante(DiarioEventos(dados))
+        gerenciador.importar_exportacao(ler_exportacao(self.exportar('dados_ru.json')))
+        gerenciador.diario.fechar()
+
+        self.assertTrue(os.path.exists(os.path.join(dados, DiarioEventos.ARQUIVO_SNAPSHOT)))
+        diario = DiarioEventos(dados)
+        self.conferir(GerenciadorRestaurante(diario))
+        diario.fechar()
+
+    def test_importa_exportacao_ndjson(self):
+        arquivo = os.path.join(self.diretorio.name, 'exportacao.ndjson.gz')
+        exportar_ndjson(self.gerenciador, arquivo)
+        importado = GerenciadorRestaurante()
+        self.assertEqual(importado.importar_exportacao(ler_exportacao(arquivo)), 5)
+        self.conferir(importado)
+
+        with self.assertRaises(ValueError):
+            importado.importar_exportacao(ler_exportacao(arquivo))
+
+    def exportar(self, nome):
+        arquivo = os.path.join(self.diretorio.name, nome)
+        self.gerenciador.exportar_dados(arquivo)
+        return arquivo
+
+
+class TestAcervo(unittest.TestCase):
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        dados = os.path.join(self.diretorio.name, 'dados')
+        self.gerenciador = GerenciadorRestaurante(
+            DiarioEventos(dados), historico=HistoricoEventos(50, os.path.join(dados, 'historico'), 100),
+            acervo=AcervoHistorico(os.path.join(dados, 'acervo')), dias_em_memoria=2)
+        self.referencia = GerenciadorRestaurante()
+
+        # Dez dias de visitas de 5 cartões, terminando ontem
+        inicio = datetime.datetime.combine(datetime.date.today(), datetime.time(11)) - datetime.timedelta(days=10)
+        lote = []
+        for dia in range(10):
+            for i in range(12):
+                entrada = inicio + datetime.timedelta(days=dia, minutes=7 * i)
+                saida = entrada + datetime.timedelta(minutes=20 + i)
+                lote.append({'tipo': 'ENTRADA', 'rfid': f"RFID_{i % 5}", 'timestamp': entrada.isoformat()})
+                lote.append({'tipo': 'SAIDA', 'rfid': f"RFID_{i % 5}", 'timestamp': saida.isoformat()})
+        self.inicio = inicio
+        for gerenciador in (self.gerenciador, self.referencia):
+            gerenciador.registrar_lote(lote)
+            gerenciador.registrar_entrada("RFID_1")
+
+    def tearDown(self):
+        self.gerenciador.diario.fechar()
+        self.diretorio.cleanup()
+
+    def conferir(self, gerenciador):
+        """As consultas juntando acervo e memória respondem como se tudo estivesse em memória"""
+        referencia = self.referencia
+        self.assertEqual(gerenciador.obter_tempos_permanencia(), referencia.obter_tempos_permanencia())
+        self.assertEqual(gerenciador.obter_tempos_permanencia(limite=10, offset=25),
+                         referencia.obter_tempos_permanencia(limite=10, offset=25))
+        inicio, fim = self.inicio + datetime.timedelta(days=3, hours=1), self.inicio + datetime.timedelta(days=9)
+        for rfid in (None, "RFID_1", "RFID_9"):
+            self.assertEqual(gerenciador.contar_tempos_permanencia(rfid), referencia.contar_tempos_permanencia(rfid))
+            self.assertEqual(gerenciador.consultar_tempos_permanencia(rfid, inicio, fim, limite=7),
+                             referencia.consultar_tempos_permanencia(rfid, inicio, fim, limite=7))
+        self.assertEqual(gerenciador.obter_historico_rfid("RFID_1", 9, 30),
+                         referencia.obter_historico_rfid("RFID_1", 9, 30))
+
+    def test_dias_antigos_saem_da_memoria(self):
+        self.gerenciador.arquivar_dias_antigos()
+
+        acervo = self.gerenciador.acervo
+        self.assertEqual(len(acervo.dias), 8)
+        self.assertEqual(acervo.total_visitas, 96)
+        self.assertEqual(len(self.gerenciador.tempos_permanencia), 24)
+        self.conferir(self.gerenciador)
+
+        # Reiniciado, parte do snapshot (só os dias recentes) e do mesmo acervo
+        self.gerenciador.diario.fechar()
+        dados = os.path.join(self.diretorio.name, 'dados')
+        self.gerenciador = GerenciadorRestaurante(
+            DiarioEventos(dados), historico=HistoricoEventos(50, os.path.join(dados, 'historico'), 100),
+            acervo=AcervoHistorico(os.path.join(dados, 'acervo')), dias_em_memoria=2)
+        self.assertEqual(len(self.gerenciador.tempos_permanencia), 24)
+        self.conferir(self.gerenciador)
+
+    def test_consulta_por_cartao_usa_o_indice_por_cartao(self):
+        self.gerenciador.arquivar_dias_antigos()
+        acervo = self.gerenciador.acervo
+        acervo._cache.clear()
+        self.assertEqual(self.gerenciador.obter_tempos_permanencia("RFID_3"),
+                         self.referencia.obter_tempos_permanencia("RFID_3"))
+        self.assertNotIn('rfid', {nome for _, tabela, nome in acervo._cache if tabela == 'visitas'})
+
+        # Partições gravadas antes do índice por cartão montam o índice ao abrir
+        for dia in acervo.dias[:3]:
+            for nome in ('id', 'inicio', 'linha'):
+                os.remove(os.path.join(acervo.diretorio, dia, f"cartoes_{nome}.npy"))
+        self.gerenciador.acervo = AcervoHistorico(acervo.diretorio)
+        self.conferir(self.gerenciador)
+
+    def test_particao_gravada_sem_o_lock(self):
+        """Um lote atrasado chega enquanto a partição é gravada: não espera e não se perde"""
+        acervo = self.gerenciador.acervo
+        gravar_dia = acervo.gravar_dia
+        entrada = self.inicio.replace(hour=15)
+        atrasado = [{'tipo': 'ENTRADA', 'rfid': "RFID_7", 'timestamp': entrada.isoformat()},
+                    {'tipo': 'SAIDA', 'rfid': "RFID_7",
+                     'timestamp': (entrada + datetime.timedelta(minutes=5)).isoformat()}]
+        self.referencia.registrar_lote(atrasado)
+
+        def gravar_com_lote_chegando(*args):
+            if gravar_dia.__self__.total_visitas == 0:
+                lote = threading.Thread(target=self.gerenciador.registrar_lote, args=(atrasado,))
+                lote.start()
+                lote.join(timeout=2)
+                self.assertFalse(lote.is_alive(), "registro esperou a gravação da partição")
+            gravar_dia(*args)
+
+        with mock.patch.object(acervo, 'gravar_dia', side_effect=gravar_com_lote_chegando):
+            self.gerenciador.arquivar_dias_antigos()
+
+        self.assertEqual(acervo.total_visitas, 97)
+        self.assertEqual(self.gerenciador.tempos_arquivados, 97)
+        self.assertEqual(len(self.gerenciador.tempos_permanencia), 24)
+        self.conferir(self.gerenciador)
+
+    def test_atrasado_de_dia_arquivado_grava_nova_versao(self):
+        self.gerenciador.arquivar_dias_antigos()
+        acervo = self.gerenciador.acervo
+        dia = acervo.dias[0]
+        saidas = acervo.coluna(dia, 'visitas', 'saida')  # mapeada antes do acréscimo
+
+        entrada = self.inicio.replace(hour=15)
+        atrasado = [{'tipo': 'ENTRADA', 'rfid': "RFID_7", 'timestamp': entrada.isoformat()},
+                    {'tipo': 'SAIDA', 'rfid': "RFID_7",
+                     'timestamp': (entrada + datetime.timedelta(minutes=5)).isoformat()}]
+        for gerenciador in (self.gerenciador, self.referencia):
+            gerenciador.registrar_lote(atrasado)
+        self.gerenciador.arquivar_dias_antigos()
+
+        self.assertEqual(acervo.contagem(dia)['visitas'], 13)
+        particoes = [nome for nome in os.listdir(acervo.diretorio) if nome.startswith(dia)]
+        self.assertEqual(particoes, [acervo._pasta(dia)])
+        self.assertNotEqual(particoes, [dia])
+        self.assertEqual(len(saidas), 12)  # quem já lia continua com a partição antiga
+        self.conferir(self.gerenciador)
+
+        # Restos de uma gravação interrompida somem ao abrir o acervo
+        os.makedirs(os.path.join(acervo.diretorio, f"{dia}.v9.tmp"))
+        reaberto = AcervoHistorico(acervo.diretorio)
+        self.assertNotIn(f"{dia}.v9.tmp", os.listdir(acervo.diretorio))
+        self.assertEqual(reaberto.total_visitas, 97)
+
+
+class TestAnalise(unittest.TestCase):
+
+    def setUp(self):
+        self.gerenciador = GerenciadorRestaurante()
+        self.analise = AnaliseHistorica(self.gerenciador)
+        self.ontem = datetime.date.today() - datetime.timedelta(days=1)
+        # Ontem: 3 pessoas às 11:00, 11:10 e 11:20, cada uma fica 30 minutos
+        self.registrar([(f"RFID_{i}", datetime.time(11, 10 * i), 30) for i in range(3)])
+
+    def registrar(self, visitas):
+        lote = []
+        for rfid, horario, minutos in visitas:
+            entrada = datetime.datetime.combine(self.ontem, horario)
+            lote.append({'tipo': 'ENTRADA', 'rfid': rfid, 'timestamp': entrada.isoformat()})
+            lote.append({'tipo': 'SAIDA', 'rfid': rfid,
+                         'timestamp': (entrada + datetime.timedelta(minutes=minutos)).isoformat()})
+        self.gerenciador.registrar_lote(lote)
+
+    def test_curvas_do_periodo(self):
+        chegadas = self.analise.chegadas(self.ontem, self.ontem, resolucao=60)
+        self.assertEqual(chegadas['total_chegadas'], 3)
+        self.assertEqual(chegadas['faixas'][11], {'horario': '11:00', 'chegadas': 3, 'media_por_dia': 3.0})
+
+        ocupacao = self.analise.ocupacao(self.ontem, self.ontem)['por_dia'][0]
+        self.assertEqual((ocupacao['pico'], ocupacao['horario_pico']), (3, '11:20'))
+
+        permanencia = self.analise.permanencia(self.ontem, self.ontem, faixa=15)
+        self.assertEqual(permanencia['faixas'][2], {'de_minutos': 30, 'ate_minutos': 45, 'visitas': 3})
+        self.assertEqual(permanencia['p50_minutos'], 30)
+
+        semana = self.analise.dias_da_semana(self.ontem, datetime.date.today())['dias_da_semana']
+        self.assertEqual(semana[self.ontem.weekday()]['entradas_media'], 3)
+
+        with self.assertRaises(ValueError):
+            self.analise.chegadas(self.ontem, self.ontem, resolucao=7)
+
+    def test_evento_atrasado_refaz_o_dia_em_cache(self):
+        self.assertEqual(self.analise.chegadas(self.ontem, self.ontem)['total_chegadas'], 3)
+        self.registrar([("RFID_ATRASADO", datetime.time(12, 0), 5)])
+        self.assertEqual(self.analise.chegadas(self.ontem, self.ontem)['total_chegadas'], 4)
+
+
+class TestMetricas(unittest.TestCase):
+
+    def test_histograma_exportado_acumulado(self):
+        registro = RegistroMetricas()
+        latencia = registro.histograma('teste_segundos', 'Latência', ('rota',), limites=(0.01, 0.1))
+        for valor in (0.005, 0.05, 0.05, 3):
+            latencia.rotulos('/evento').observar(valor)
+
+        texto = registro.exportar()
+        self.assertIn('# TYPE teste_segundos histogram', texto)
+        self.assertIn('teste_segundos_bucket{rota="/evento",le="0.01"} 1', texto)
+        self.assertIn('teste_segundos_bucket{rota="/evento",le="0.1"} 3', texto)
+        self.assertIn('teste_segundos_bucket{rota="/evento",le="+Inf"} 4', texto)
+        self.assertIn('teste_segundos_count{rota="/evento"} 4', texto)
+
+    def test_lock_medido_conta_so_esperas_com_disputa(self):
+        registro = RegistroMetricas()
+        lock = registro.lock_medido('teste_lock', 'lock de teste')
+        with lock:
+            pass
+
+        tomado = threading.Event()
+
+        def segurar():
+            with lock:
+                tomado.set()
+                time.sleep(0.05)
+
+        thread = threading.Thread(target=segurar)
+        thread.start()
+        tomado.wait()
+        with lock:
+            pass
+        thread.join()
+
+        texto = registro.exportar()
+        self.assertIn('teste_lock_posse_segundos_count 3', texto)
+        self.assertIn('teste_lock_espera_segundos_count 1', texto)
+        self.assertIn('teste_lock_espera_segundos_bucket{le="0.025"} 0', texto)
+
+
+class TestLog(unittest.TestCase):
+    """Log assíncrono: o registro só entra na fila; o ouvinte formata e escreve"""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.arquivo = os.path.join(self.diretorio.name, 'sistema.log')
+        raiz = logging.getLogger()
+        self.anterior = (list(raiz.handlers), raiz.level, logging.getLogger('werkzeug').level)
+        with mock.patch('sys.stdout', new=io.StringIO()):
+            configurar_log("INFO", formato="json", arquivo=self.arquivo)
+        self.logger = logging.getLogger('teste_log')
+
+    def tearDown(self):
+        encerrar_log()
+        raiz = logging.getLogger()
+        handlers, nivel, nivel_werkzeug = self.anterior
+        for handler in list(raiz.handlers):
+            raiz.removeHandler(handler)
+            handler.close()
+        for handler in handlers:
+            raiz.addHandler(handler)
+        raiz.setLevel(nivel)
+        logging.getLogger('werkzeug').setLevel(nivel_werkzeug)
+        self.diretorio.cleanup()
+
+    def registros(self):
+        with open(self.arquivo, encoding='utf-8') as f:
+            return [json.loads(linha) for linha in f]
+
+    def test_debug_desligado_nao_e_formatado(self):
+        argumento = mock.Mock()
+        argumento.__str__ = mock.Mock(return_value="caro")
+        self.logger.debug("estado: %s", argumento)
+        encerrar_log()
+
+        argumento.__str__.assert_not_called()
+        self.assertEqual(self.registros(), [])
+
+    def test_registros_chegam_em_ordem_ao_parar(self):
+        for i in range(2000):
+            self.logger.info("evento %d", i, extra={'seq': i})
+        encerrar_log()  # escreve o que ainda estava na fila
+
+        registros = self.registros()
+        self.assertEqual([registro['seq'] for registro in registros], list(range(2000)))
+        self.assertEqual(registros[-1]['mensagem'], "evento 1999")
+        self.assertEqual(registros[0]['origem'], 'teste_log')
+
+
+if __name__ == "__main__":
+    unittest.main()